@@ -0,0 +1,527 @@
+# app/benchmark.py
+# Benchmarks reprodutíveis do extract_data.py e do infer_ean.py sem GPU: o Ollama é
+# substituído pelo mock_ollama.py (streaming por token, respostas reproduzidas de um
+# resultado_*.txt) e o catálogo por um CSV sintético de 10 mil a 1 milhão de linhas.
+# Exemplos:
+#   python benchmark.py catalogo --linhas 1000000 --saida /tmp/catalogo_1M.csv
+#   python benchmark.py executar --cenarios extracao,ean --linhas 10000,100000,1000000
+#   python benchmark.py executar --cenarios lote --tamanhos-lote 1,2,4,8
+#   python benchmark.py executar --cenarios ean,servico --linhas 100000 --clientes 16
+#   python benchmark.py executar --cenarios endpoints --latencias-endpoints 0.3,0.9,1.5 --derrubar-apos 5
+# Cada cenário roda num processo novo, para que o pico de memória (RSS) seja só dele e
+# porque o extract_data lê a configuração do ambiente uma única vez, ao ser importado.
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+DIRETORIO_APP = os.path.dirname(os.path.abspath(__file__))
+REPLAY_PADRAO = os.path.join(DIRETORIO_APP, "results", "resultado_train.txt")
+
+MARCAS = [
+    "Sadia", "Perdigão", "Seara", "Nestlé", "Ypê", "Omo", "Coca-Cola", "Pepsi", "Guaraná Antarctica",
+    "Qualy", "Piracanjuba", "Italac", "Tio João", "Camil", "Pilão", "Melitta", "Dove", "Colgate",
+    "Aurora", "Friboi", "Swift", "Vigor", "Danone", "Parmalat", "Elegê", "Bauducco", "Nescau",
+    "Toddy", "Kicaldo", "Dona Benta", "Renata", "Liza", "Soya", "Gallo", "Andorinha", "Heinz",
+    "Hellmann's", "Quero", "Fugini", "Knorr", "Maggi", "Sazón", "Veja", "Limpol", "Minuano",
+]
+PALAVRAS = [
+    "Peito", "Frango", "Coxa", "Sobrecoxa", "Filé", "Linguiça", "Toscana", "Calabresa", "Salsicha",
+    "Presunto", "Mortadela", "Queijo", "Mussarela", "Prato", "Requeijão", "Manteiga", "Margarina",
+    "Leite", "Integral", "Desnatado", "Semidesnatado", "Iogurte", "Natural", "Morango", "Chocolate",
+    "Azeite", "Extra", "Virgem", "Óleo", "Soja", "Arroz", "Tipo", "Feijão", "Carioca", "Preto",
+    "Café", "Torrado", "Moído", "Açúcar", "Refinado", "Cristal", "Farinha", "Trigo", "Biscoito",
+    "Recheado", "Cream", "Cracker", "Macarrão", "Espaguete", "Parafuso", "Molho", "Tomate",
+    "Maionese", "Ketchup", "Sabão", "Pó", "Líquido", "Detergente", "Amaciante", "Desinfetante",
+    "Sabonete", "Creme", "Dental", "Refrigerante", "Suco", "Uva", "Laranja", "Zero", "Light",
+    "Tradicional", "Congelado", "Resfriado", "Lata", "Pet", "Caixa", "Pacote", "Bandeja",
+    "200g", "500g", "1kg", "2kg", "5kg", "350ml", "600ml", "1L", "2L", "900ml",
+]
+SILABAS = ["ba", "be", "ca", "co", "da", "di", "fa", "fo", "ga", "la", "li", "ma", "mo", "na",
+           "ni", "pa", "po", "ra", "ri", "sa", "so", "ta", "to", "va", "vi", "xa", "za", "zu"]
+
+
+def _pico_rss_mb():
+    # ru_maxrss é dado em KiB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _percentis_ms(latencias):
+    if not latencias:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    p50, p95, p99 = np.percentile(np.asarray(latencias) * 1000, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2)}
+
+
+@contextlib.contextmanager
+def _silenciar():
+    """Descarta os prints das funções medidas, que distorceriam os tempos."""
+    with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+        yield
+
+
+def _cronometrar(modulo, nome_funcao, latencias, peso=None):
+    """
+    Substitui modulo.nome_funcao por uma versão que anota a duração de cada chamada
+    (repetida peso(*args) vezes, ex.: uma vez por imagem de um lote). Pode ser chamada
+    de várias threads ao mesmo tempo.
+    """
+    import threading
+
+    original = getattr(modulo, nome_funcao)
+    lock = threading.Lock()
+
+    def cronometrada(*args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            duracao = time.perf_counter() - inicio
+            with lock:
+                latencias.extend([duracao] * (peso(*args) if peso else 1))
+
+    setattr(modulo, nome_funcao, cronometrada)
+
+
+def gerar_catalogo_sintetico(caminho, linhas, semente=42):
+    """
+    Grava um CSV de catálogo (colunas ean, brand, name) com 'linhas' produtos fictícios.
+
+    Os EANs são GTIN-13 com prefixo 789 e dígito verificador válido. Cada nome combina
+    de 1 a 4 palavras de um vocabulário de supermercado com o nome de uma linha de produto
+    (pseudopalavra), o que dá ao catálogo a variedade de tokens de um catálogo real.
+    A mesma semente gera o mesmo arquivo.
+    """
+    rng = np.random.default_rng(semente)
+
+    corpos = 789_000_000_000 + rng.integers(0, 1_000_000_000, size=linhas, dtype=np.int64)
+    digitos = (corpos[:, None] // 10 ** np.arange(11, -1, -1, dtype=np.int64)) % 10
+    verificadores = (10 - (digitos @ np.tile([1, 3], 6)) % 10) % 10
+    eans = (corpos * 10 + verificadores).astype(str)
+
+    marcas = np.array(MARCAS + [""], dtype=object)[rng.integers(0, len(MARCAS) + 1, size=linhas)]
+    palavras = np.array(PALAVRAS, dtype=object)
+    tamanhos = rng.integers(1, 5, size=linhas)
+    indices = rng.integers(0, len(PALAVRAS), size=(linhas, 4))
+    silabas = np.array(SILABAS, dtype=object)
+    linhas_produto = ["".join(silabas[rng.integers(0, len(SILABAS), size=3)]).capitalize()
+                      for _ in range(max(100, linhas // 20))]
+    linha_de = rng.integers(0, len(linhas_produto), size=linhas)
+    nomes = [" ".join(palavras[indices[i, :tamanho]]) + " " + linhas_produto[linha_de[i]]
+             for i, tamanho in enumerate(tamanhos)]
+
+    diretorio = os.path.dirname(caminho)
+    if diretorio:
+        os.makedirs(diretorio, exist_ok=True)
+    pd.DataFrame({"ean": eans, "brand": marcas, "name": nomes}).to_csv(caminho, index=False)
+    return caminho
+
+
+def _imagens_sinteticas(quantidade, tamanho_kb, semente):
+    """Gera (nome, bytes) distintos; sem PREPROCESSAR o conteúdo não precisa ser uma imagem válida."""
+    rng = np.random.default_rng(semente)
+    for i in range(quantidade):
+        yield f"sintetica_{i:06d}.jpg", rng.bytes(tamanho_kb * 1024)
+
+
+def _consultas_sinteticas(df_produtos, quantidade, replay, semente):
+    """
+    Monta as consultas de EAN: respostas reproduzidas do resultado_*.txt (se houver) e
+    registros do catálogo com ruído (palavra omitida, EAN informado ou ilegível).
+    """
+    from infer_ean import ler_blocos_resultados, limpar_saida_gemma, parse_gemma_output
+
+    aleatorio = random.Random(semente)
+    gravadas = []
+    if replay and os.path.exists(replay):
+        gravadas = [parse_gemma_output(limpar_saida_gemma(texto)) for _, texto in ler_blocos_resultados(replay)]
+
+    consultas = []
+    for i in range(quantidade):
+        if gravadas and i % 5 == 0:
+            consultas.append(gravadas[(i // 5) % len(gravadas)])
+            continue
+        linha = df_produtos.iloc[aleatorio.randrange(len(df_produtos))]
+        palavras = str(linha["name"]).split()
+        if len(palavras) > 1 and aleatorio.random() < 0.5:
+            palavras.pop(aleatorio.randrange(len(palavras)))
+        sorteio = aleatorio.random()
+        codigo = str(linha["ean"]) if sorteio < 0.1 else ("Não encontrado" if sorteio < 0.9 else "7891234")
+        consultas.append({"marca": str(linha["brand"]), "produto": " ".join(palavras), "códigos_de_barras": codigo})
+    return consultas
+
+
+def _importar_extract_data(**ambiente):
+    """
+    Atualiza o ambiente e importa o extract_data, que lê a configuração (URL ou endpoints
+    do Ollama, OUTPUT_DIR, cache, pré-processamento) só na importação. Por isso os cenários
+    que o usam precisam rodar cada um num processo novo (ver _em_processo); levanta
+    RuntimeError se o módulo já tiver sido importado com outra configuração.
+    """
+    if "extract_data" in sys.modules:
+        raise RuntimeError("extract_data já foi importado neste processo; execute o cenário com _em_processo.")
+    os.environ.update(ambiente)
+    import extract_data
+    return extract_data
+
+
+def preparar_catalogo(linhas, diretorio, semente=42):
+    """Gera o catálogo sintético (se ainda não existir) e compila seu snapshot."""
+    from catalog_snapshot import carregar_catalogo
+
+    caminho = os.path.join(diretorio, f"catalogo_{linhas}.csv")
+    if not os.path.exists(caminho):
+        gerar_catalogo_sintetico(caminho, linhas, semente)
+    with _silenciar():
+        carregar_catalogo(caminho)
+    return caminho
+
+
+def cenario_extracao(imagens=200, max_em_voo=4, latencia=0.5, jitter=0.1, atraso_token=0.01,
+                     replay=None, tamanho_kb=48, semente=42, tamanho_lote=1):
+    """
+    Mede o extract_data.extrair_em_fluxo contra o mock: imagens/s e latência por imagem
+    (num lote, a latência de cada imagem é a do lote inteiro). Roda num processo novo.
+    """
+    import mock_ollama
+
+    random.seed(semente)
+    respostas_replay = mock_ollama.carregar_respostas_replay(replay) if replay else None
+    servidor = mock_ollama.iniciar_servidor(latencia=latencia, jitter=jitter, atraso_token=atraso_token,
+                                            respostas_replay=respostas_replay)
+    with tempfile.TemporaryDirectory() as saida:
+        extract_data = _importar_extract_data(
+            OLLAMA_URL=f"http://127.0.0.1:{servidor.server_address[1]}/api/generate",
+            OUTPUT_DIR=saida, USAR_CACHE="0", PREPROCESSAR="0")
+
+        latencias = []
+        _cronometrar(extract_data, "_extrair_lote", latencias, peso=lambda lote, *_: len(lote))
+        falhas = 0
+        inicio = time.perf_counter()
+        with _silenciar():
+            for _, resposta, _, _ in extract_data.extrair_em_fluxo(_imagens_sinteticas(imagens, tamanho_kb, semente),
+                                                                max_em_voo, tamanho_lote=tamanho_lote):
+                falhas += resposta is None
+        duracao = time.perf_counter() - inicio
+    servidor.shutdown()
+
+    return {
+        "imagens": imagens,
+        "falhas": falhas,
+        "segundos": round(duracao, 3),
+        "imagens_por_s": round(imagens / duracao, 2),
+        **_percentis_ms(latencias),
+        "requisicoes": servidor.requisicoes,
+        "pico_em_voo": servidor.pico_em_voo,
+        "pico_rss_mb": round(_pico_rss_mb(), 1),
+    }
+
+
+def cenario_endpoints(imagens=200, max_em_voo=8, latencias=(0.3, 0.9), jitter=0.1, atraso_token=0.01,
+                      replay=None, derrubar_apos=None, tamanho_kb=48, semente=42):
+    """
+    Mede a extração com um pool de mocks (OLLAMA_ENDPOINTS), um por latência em
+    'latencias'. Com 'derrubar_apos', o último mock cai após esse número de segundos e
+    as imagens em voo nele precisam ser reenviadas aos demais. Roda num processo novo.
+    """
+    import threading
+
+    import mock_ollama
+
+    random.seed(semente)
+    respostas_replay = mock_ollama.carregar_respostas_replay(replay) if replay else None
+    servidores = [mock_ollama.iniciar_servidor(latencia=latencia, jitter=jitter, atraso_token=atraso_token,
+                                               respostas_replay=respostas_replay)
+                  for latencia in latencias]
+    with tempfile.TemporaryDirectory() as saida:
+        extract_data = _importar_extract_data(
+            OLLAMA_ENDPOINTS=",".join(f"http://127.0.0.1:{s.server_address[1]}" for s in servidores),
+            OUTPUT_DIR=saida, USAR_CACHE="0", PREPROCESSAR="0", INTERVALO_SAUDE="1")
+
+        if derrubar_apos is not None:
+            threading.Timer(derrubar_apos, mock_ollama.derrubar_servidor, args=(servidores[-1],)).start()
+        falhas = 0
+        inicio = time.perf_counter()
+        with _silenciar():
+            for _, resposta, _, _ in extract_data.extrair_em_fluxo(_imagens_sinteticas(imagens, tamanho_kb, semente), max_em_voo):
+                falhas += resposta is None
+        duracao = time.perf_counter() - inicio
+        por_endpoint = extract_data.cliente_ollama.resumo()
+    for servidor in servidores:
+        if not servidor.fora_do_ar:
+            servidor.shutdown()
+
+    metricas = {
+        "imagens": imagens,
+        "falhas": falhas,
+        "segundos": round(duracao, 3),
+        "imagens_por_s": round(imagens / duracao, 2),
+    }
+    for latencia, estatisticas in zip(latencias, por_endpoint.values()):
+        metricas[f"latencia_{latencia:g}s"] = (f"{estatisticas['imagens']} imagens, {estatisticas['imagens_por_s']} imagens/s, "
+                                               f"{estatisticas['reenfileiradas']} reenviadas")
+    metricas["pico_rss_mb"] = round(_pico_rss_mb(), 1)
+    return metricas
+
+
+def cenario_ean(caminho_catalogo, consultas=500, threshold=75, replay=None, semente=42):
+    """Mede o inferir_ean sobre um catálogo já compilado: carga, inferências/s e latência."""
+    from catalog_snapshot import carregar_catalogo
+    from infer_ean import inferir_ean
+
+    inicio = time.perf_counter()
+    with _silenciar():
+        df_produtos, indice = carregar_catalogo(caminho_catalogo)
+    carga = time.perf_counter() - inicio
+    lista_consultas = _consultas_sinteticas(df_produtos, consultas, replay, semente)
+
+    latencias = []
+    encontrados = 0
+    inicio = time.perf_counter()
+    with _silenciar():
+        for dados_extraidos in lista_consultas:
+            t0 = time.perf_counter()
+            ean, _ = inferir_ean(dados_extraidos, df_produtos, threshold, indice)
+            latencias.append(time.perf_counter() - t0)
+            encontrados += ean is not None
+    duracao = time.perf_counter() - inicio
+
+    return {
+        "linhas_catalogo": len(df_produtos),
+        "carga_catalogo_s": round(carga, 3),
+        "consultas": consultas,
+        "encontrados": encontrados,
+        "segundos": round(duracao, 3),
+        "inferencias_por_s": round(consultas / duracao, 2),
+        **_percentis_ms(latencias),
+        "pico_rss_mb": round(_pico_rss_mb(), 1),
+    }
+
+
+def cenario_servico(caminho_catalogo, consultas=500, clientes=8, threshold=75, replay=None, semente=42,
+                    um_a_um=False, processos=1):
+    """
+    Mede o ean_service.py com 'clientes' conexões concorrentes, cada uma enviando uma
+    consulta por vez a POST /inferir: consultas/s e latência vista pelo cliente.
+    Com um_a_um=True o serviço roda sem micro-lote (janela 0, lote de 1), como referência;
+    senão o micro-lote é pontuado em 'processos' processos.
+    """
+    import threading
+
+    import requests
+
+    from ean_service import ServicoEAN, iniciar_servidor
+
+    with _silenciar():
+        opcoes_lote = {"janela_ms": 0, "tamanho_max_lote": 1} if um_a_um else {"processos": processos}
+        servico = ServicoEAN(caminho_catalogo, threshold_fuzzy=threshold, intervalo_recarga=0, **opcoes_lote)
+    servidor = iniciar_servidor(servico, porta=0, host="127.0.0.1")
+    url = f"http://127.0.0.1:{servidor.server_address[1]}/inferir"
+    lista_consultas = _consultas_sinteticas(servico.catalogo.df_produtos, consultas, replay, semente)
+
+    latencias = []
+    encontrados = []
+    erros = []
+    lock = threading.Lock()
+
+    def cliente(indices):
+        sessao = requests.Session()
+        for i in indices:
+            t0 = time.perf_counter()
+            resposta = sessao.post(url, json=lista_consultas[i])
+            latencia = time.perf_counter() - t0
+            with lock:
+                latencias.append(latencia)
+                if resposta.status_code != 200:  # ex.: 504 quando a fila passa do tempo limite
+                    erros.append(resposta.status_code)
+                else:
+                    encontrados.append(resposta.json()["ean"] is not None)
+
+    threads = [threading.Thread(target=cliente, args=(range(k, consultas, clientes),)) for k in range(clientes)]
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duracao = time.perf_counter() - inicio
+    estatisticas = servico.saude()["estatisticas"]
+    servidor.shutdown()
+    servico.parar()
+
+    return {
+        "linhas_catalogo": len(servico.catalogo.df_produtos),
+        "consultas": consultas,
+        "encontrados": sum(encontrados),
+        "erros": len(erros),
+        "segundos": round(duracao, 3),
+        "consultas_por_s": round(consultas / duracao, 2),
+        **_percentis_ms(latencias),
+        "media_por_lote": estatisticas.get("media_por_lote"),
+        "respostas_imediatas": estatisticas["respostas_imediatas"],
+        "pico_rss_mb": round(_pico_rss_mb(), 1),
+    }
+
+
+def cenario_pipeline(caminho_catalogo, imagens=200, max_em_voo=4, latencia=0.5, jitter=0.1,
+                     atraso_token=0.01, replay=None, threshold=75, tamanho_kb=48, semente=42):
+    """Mede o pipeline completo (extração + EAN) contra o mock. Roda num processo novo."""
+    import mock_ollama
+
+    random.seed(semente)
+    respostas_replay = mock_ollama.carregar_respostas_replay(replay) if replay else None
+    servidor = mock_ollama.iniciar_servidor(latencia=latencia, jitter=jitter, atraso_token=atraso_token,
+                                            respostas_replay=respostas_replay)
+    with tempfile.TemporaryDirectory() as saida:
+        extract_data = _importar_extract_data(
+            OLLAMA_URL=f"http://127.0.0.1:{servidor.server_address[1]}/api/generate",
+            OUTPUT_DIR=saida, USAR_CACHE="0", PREPROCESSAR="0")
+        from pipeline import executar_pipeline
+
+        latencias = []
+        _cronometrar(extract_data, "_extrair_lote", latencias, peso=lambda lote, *_: len(lote))
+        inicio = time.perf_counter()
+        with _silenciar():
+            executar_pipeline(_imagens_sinteticas(imagens, tamanho_kb, semente), caminho_catalogo,
+                              os.path.join(saida, "inferencias.csv"), threshold, max_em_voo)
+        duracao = time.perf_counter() - inicio
+    servidor.shutdown()
+
+    return {
+        "imagens": imagens,
+        "segundos": round(duracao, 3),
+        "imagens_por_s": round(imagens / duracao, 2),
+        **_percentis_ms(latencias),
+        "pico_rss_mb": round(_pico_rss_mb(), 1),
+    }
+
+
+def _em_processo(funcao, *args, **kwargs):
+    """Executa a função num processo novo (spawn) e devolve o resultado."""
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as executor:
+        return executor.submit(funcao, *args, **kwargs).result()
+
+
+def executar_cenarios(cenarios, imagens, max_em_voo, latencia, jitter, atraso_token, replay,
+                      linhas, consultas, threshold, diretorio, semente=42, tamanhos_lote=(1, 2, 4, 8), clientes=8,
+                      latencias_endpoints=(0.3, 0.9), derrubar_apos=None, processos_servico=1):
+    """Executa os cenários pedidos e devolve uma lista de {cenario, parametros, metricas}."""
+    relatorio = []
+
+    def registrar(nome, parametros, metricas):
+        relatorio.append({"cenario": nome, "parametros": parametros, "metricas": metricas})
+        print(f"{nome} {json.dumps(parametros, ensure_ascii=False)}")
+        for chave, valor in metricas.items():
+            print(f"    {chave:<20} {valor}")
+
+    parametros_mock = {"imagens": imagens, "max_em_voo": max_em_voo, "latencia": latencia,
+                       "jitter": jitter, "atraso_token": atraso_token, "replay": replay}
+    if "extracao" in cenarios:
+        registrar("extracao", parametros_mock,
+                  _em_processo(cenario_extracao, semente=semente, **parametros_mock))
+    if "lote" in cenarios:
+        for tamanho_lote in tamanhos_lote:
+            registrar("lote", {"tamanho_lote": tamanho_lote, **parametros_mock},
+                      _em_processo(cenario_extracao, semente=semente, tamanho_lote=tamanho_lote, **parametros_mock))
+    if "endpoints" in cenarios:
+        parametros = {"imagens": imagens, "max_em_voo": max_em_voo, "latencias": list(latencias_endpoints),
+                      "jitter": jitter, "atraso_token": atraso_token, "replay": replay, "derrubar_apos": derrubar_apos}
+        registrar("endpoints", parametros, _em_processo(cenario_endpoints, semente=semente, **parametros))
+
+    for linhas_catalogo in linhas if {"ean", "servico", "pipeline"} & set(cenarios) else []:
+        caminho = _em_processo(preparar_catalogo, linhas_catalogo, diretorio, semente)
+        if "ean" in cenarios:
+            registrar("ean", {"linhas": linhas_catalogo, "consultas": consultas, "threshold": threshold},
+                      _em_processo(cenario_ean, caminho, consultas, threshold, replay, semente))
+        if "servico" in cenarios:
+            # Micro-lote contra a referência de uma consulta por vez, com as mesmas consultas
+            for um_a_um in (True, False):
+                registrar("servico", {"linhas": linhas_catalogo, "consultas": consultas, "clientes": clientes,
+                                      "threshold": threshold, "modo": "um_a_um" if um_a_um else "micro_lote",
+                                      "processos": 1 if um_a_um else processos_servico},
+                          _em_processo(cenario_servico, caminho, consultas, clientes, threshold, replay, semente,
+                                       um_a_um, processos_servico))
+        if "pipeline" in cenarios:
+            registrar("pipeline", {"linhas": linhas_catalogo, "threshold": threshold, **parametros_mock},
+                      _em_processo(cenario_pipeline, caminho, threshold=threshold, semente=semente, **parametros_mock))
+    return relatorio
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks da extração e da inferência de EAN sem GPU.")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    parser_catalogo = subparsers.add_parser("catalogo", help="gera um catálogo sintético em CSV")
+    parser_catalogo.add_argument("--linhas", type=int, default=100_000)
+    parser_catalogo.add_argument("--saida", required=True)
+    parser_catalogo.add_argument("--semente", type=int, default=42)
+
+    parser_executar = subparsers.add_parser("executar", help="executa os cenários de benchmark")
+    parser_executar.add_argument("--cenarios", default="extracao,ean,pipeline",
+                                 help="lista separada por vírgulas: extracao, lote, endpoints, ean, servico, pipeline")
+    parser_executar.add_argument("--imagens", type=int, default=200)
+    parser_executar.add_argument("--max-em-voo", type=int, default=4)
+    parser_executar.add_argument("--latencia", type=float, default=0.5, help="latência do mock antes do 1º token (s)")
+    parser_executar.add_argument("--jitter", type=float, default=0.1)
+    parser_executar.add_argument("--atraso-token", type=float, default=0.01, help="intervalo entre tokens (s)")
+    parser_executar.add_argument("--replay", default=REPLAY_PADRAO if os.path.exists(REPLAY_PADRAO) else None,
+                                 help="resultado_*.txt reproduzido pelo mock e usado nas consultas de EAN")
+    parser_executar.add_argument("--linhas", default="10000,100000",
+                                 help="tamanhos do catálogo sintético, separados por vírgulas (até 1000000)")
+    parser_executar.add_argument("--consultas", type=int, default=500)
+    parser_executar.add_argument("--clientes", type=int, default=8, help="conexões concorrentes do cenário 'servico'")
+    parser_executar.add_argument("--processos-servico", type=int, default=1,
+                                 help="processos que pontuam o micro-lote no cenário 'servico'")
+    parser_executar.add_argument("--tamanhos-lote", default="1,2,4,8",
+                                 help="tamanhos de lote do cenário 'lote', separados por vírgulas")
+    parser_executar.add_argument("--latencias-endpoints", default="0.3,0.9",
+                                 help="latência de cada mock do cenário 'endpoints', separadas por vírgulas")
+    parser_executar.add_argument("--derrubar-apos", type=float,
+                                 help="no cenário 'endpoints', derruba o último mock após este número de segundos")
+    parser_executar.add_argument("--threshold", type=int, default=75)
+    parser_executar.add_argument("--diretorio", default=os.path.join(tempfile.gettempdir(), "benchmark_precos"),
+                                 help="onde guardar os catálogos sintéticos e seus snapshots")
+    parser_executar.add_argument("--semente", type=int, default=42)
+    parser_executar.add_argument("--saida", help="grava o relatório em JSON neste arquivo")
+    args = parser.parse_args()
+
+    if args.comando == "catalogo":
+        inicio = time.perf_counter()
+        gerar_catalogo_sintetico(args.saida, args.linhas, args.semente)
+        print(f"Catálogo sintético com {args.linhas} linhas gravado em '{args.saida}' ({time.perf_counter() - inicio:.1f}s).")
+        sys.exit(0)
+
+    relatorio = executar_cenarios(
+        cenarios=[c.strip() for c in args.cenarios.split(",") if c.strip()],
+        imagens=args.imagens,
+        max_em_voo=args.max_em_voo,
+        latencia=args.latencia,
+        jitter=args.jitter,
+        atraso_token=args.atraso_token,
+        replay=args.replay,
+        linhas=[int(n) for n in args.linhas.split(",") if n.strip()],
+        consultas=args.consultas,
+        threshold=args.threshold,
+        diretorio=args.diretorio,
+        semente=args.semente,
+        tamanhos_lote=[int(n) for n in args.tamanhos_lote.split(",") if n.strip()],
+        clientes=args.clientes,
+        latencias_endpoints=[float(n) for n in args.latencias_endpoints.split(",") if n.strip()],
+        derrubar_apos=args.derrubar_apos,
+        processos_servico=args.processos_servico,
+    )
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+        print(f"Relatório salvo em '{args.saida}'.")
@@ -0,0 +1,192 @@
+# app/catalog_snapshot.py
+
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import sys
+import time
+from functools import lru_cache
+
+import pandas as pd
+
+import product_index
+from product_index import ProductIndex
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # sem pyarrow o catálogo compilado é gravado em pickle
+    pa = None
+
+# Mude a versão ao alterar o formato do snapshot. Mudanças no código do ProductIndex ou na
+# normalização do CSV já invalidam o snapshot pela assinatura do código (ver _assinatura_codigo).
+VERSAO_SNAPSHOT = 2
+
+
+def _sha256_arquivo(caminho):
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _assinatura_codigo():
+    """SHA-256 do código que determina o conteúdo do snapshot: product_index.py e a carga do CSV."""
+    from infer_ean import carregar_base_dados_produtos
+
+    h = hashlib.sha256()
+    with open(product_index.__file__, "rb") as f:
+        h.update(f.read())
+    h.update(inspect.getsource(carregar_base_dados_produtos).encode("utf-8"))
+    return h.hexdigest()
+
+
+def diretorio_snapshot_padrao(csv_database_path):
+    return os.getenv("CATALOGO_SNAPSHOT_DIR", csv_database_path + ".snapshot")
+
+
+def _meta_valida(meta, csv_database_path, estado_csv):
+    """
+    Confere se o snapshot foi gerado por este código e corresponde ao CSV: mtime/tamanho
+    e, se mudaram, o checksum.
+    """
+    if meta.get("versao") != VERSAO_SNAPSHOT or meta.get("codigo") != _assinatura_codigo():
+        return False
+    if meta.get("tamanho") == estado_csv.st_size and meta.get("mtime_ns") == estado_csv.st_mtime_ns:
+        return True
+    # O mtime mudou (ex.: cópia do arquivo), mas o conteúdo pode ser o mesmo
+    return meta.get("tamanho") == estado_csv.st_size and meta.get("sha256") == _sha256_arquivo(csv_database_path)
+
+
+def _gravar_meta(diretorio, meta):
+    """Grava o meta.json num arquivo temporário e o troca de uma vez, para nunca deixá-lo pela metade."""
+    caminho_temp = os.path.join(diretorio, "meta.json.tmp")
+    with open(caminho_temp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(caminho_temp, os.path.join(diretorio, "meta.json"))
+
+
+def compilar_catalogo(csv_database_path, diretorio=None):
+    """
+    Lê o CSV do catálogo uma vez e grava o snapshot compilado: o DataFrame já normalizado
+    (Arrow IPC sem compressão, convertido de volta para pandas na carga sem reprocessar o
+    CSV), o ProductIndex pré-construído e os metadados do CSV de origem (tamanho, mtime e
+    SHA-256) e do código usados para invalidar o snapshot.
+    Retorna (df_produtos, indice) ou (None, None) se o CSV não puder ser carregado.
+    """
+    from infer_ean import carregar_base_dados_produtos
+
+    diretorio = diretorio or diretorio_snapshot_padrao(csv_database_path)
+    df_produtos = carregar_base_dados_produtos(csv_database_path)
+    if df_produtos is None:
+        return None, None
+
+    estado_csv = os.stat(csv_database_path)
+    indice = ProductIndex(df_produtos)
+
+    os.makedirs(diretorio, exist_ok=True)
+    df_gravado = df_produtos.reset_index(drop=True)
+    for coluna in df_gravado.columns:
+        if df_gravado[coluna].dtype == object:
+            df_gravado[coluna] = df_gravado[coluna].astype("string")
+    if pa is not None:
+        caminho_temp = os.path.join(diretorio, "catalogo.arrow.tmp")
+        feather.write_feather(df_gravado, caminho_temp, compression="uncompressed")
+        os.replace(caminho_temp, os.path.join(diretorio, "catalogo.arrow"))
+    else:
+        caminho_temp = os.path.join(diretorio, "catalogo.pkl.tmp")
+        df_gravado.to_pickle(caminho_temp)
+        os.replace(caminho_temp, os.path.join(diretorio, "catalogo.pkl"))
+
+    caminho_temp = os.path.join(diretorio, "indice.pkl.tmp")
+    with open(caminho_temp, "wb") as f:
+        pickle.dump(indice, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(caminho_temp, os.path.join(diretorio, "indice.pkl"))
+
+    # Metadados por último: um snapshot sem meta.json (compilação interrompida) é inválido
+    meta = {
+        "versao": VERSAO_SNAPSHOT,
+        "codigo": _assinatura_codigo(),
+        "csv": os.path.abspath(csv_database_path),
+        "tamanho": estado_csv.st_size,
+        "mtime_ns": estado_csv.st_mtime_ns,
+        "sha256": _sha256_arquivo(csv_database_path),
+        "formato": "arrow" if pa is not None else "pickle",
+        "registros": len(df_produtos),
+    }
+    _gravar_meta(diretorio, meta)
+
+    print(f"Snapshot do catálogo compilado em '{diretorio}' ({len(df_produtos)} registros).")
+    return df_produtos, indice
+
+
+def carregar_snapshot(csv_database_path, diretorio=None):
+    """
+    Carrega o snapshot compilado se ele ainda corresponder ao CSV; senão retorna (None, None).
+    Um snapshot com arquivos ausentes ou corrompidos também retorna (None, None), para ser
+    recompilado.
+    """
+    diretorio = diretorio or diretorio_snapshot_padrao(csv_database_path)
+    caminho_meta = os.path.join(diretorio, "meta.json")
+    if not os.path.exists(caminho_meta) or not os.path.exists(csv_database_path):
+        return None, None
+
+    try:
+        with open(caminho_meta, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"AVISO: meta.json do snapshot ilegível em '{diretorio}' ({e}).")
+        return None, None
+    estado_csv = os.stat(csv_database_path)
+    if not _meta_valida(meta, csv_database_path, estado_csv):
+        return None, None
+    if meta.get("formato") == "arrow" and pa is None:
+        return None, None
+
+    try:
+        if meta.get("formato") == "arrow":
+            df_produtos = feather.read_table(os.path.join(diretorio, "catalogo.arrow")).to_pandas()
+        else:
+            df_produtos = pd.read_pickle(os.path.join(diretorio, "catalogo.pkl"))
+        with open(os.path.join(diretorio, "indice.pkl"), "rb") as f:
+            indice = pickle.load(f)
+    except Exception as e:
+        # Arquivo ausente, truncado ou de outra versão das bibliotecas: recompila
+        print(f"AVISO: Snapshot do catálogo em '{diretorio}' ilegível ({type(e).__name__}: {e}).")
+        return None, None
+    if not isinstance(indice, ProductIndex) or len(df_produtos) != meta.get("registros"):
+        print(f"AVISO: Snapshot do catálogo em '{diretorio}' inconsistente com o meta.json.")
+        return None, None
+
+    if meta.get("mtime_ns") != estado_csv.st_mtime_ns:
+        # Mesmo conteúdo com outro mtime: atualiza para evitar recalcular o checksum
+        meta["mtime_ns"] = estado_csv.st_mtime_ns
+        _gravar_meta(diretorio, meta)
+    return df_produtos, indice
+
+
+def carregar_catalogo(csv_database_path, match_exaustivo=False, diretorio=None):
+    """
+    Retorna (df_produtos, indice) a partir do snapshot compilado, compilando-o antes se
+    estiver ausente ou desatualizado em relação ao CSV.
+    """
+    inicio = time.perf_counter()
+    df_produtos, indice = carregar_snapshot(csv_database_path, diretorio)
+    if df_produtos is not None:
+        print(f"Catálogo carregado do snapshot em {(time.perf_counter() - inicio) * 1000:.0f} ms ({len(df_produtos)} registros).")
+    else:
+        print("Snapshot do catálogo ausente ou desatualizado. Compilando a partir do CSV...")
+        df_produtos, indice = compilar_catalogo(csv_database_path, diretorio)
+        if df_produtos is None:
+            return None, None
+    indice.exaustivo = match_exaustivo
+    return df_produtos, indice
+
+
+if __name__ == "__main__":
+    CSV_DATABASE_FILE = sys.argv[1] if len(sys.argv) > 1 else os.getenv("CSV_DATABASE_FILE", "/app/data/ludiiprice_db_17012025.csv")
+    compilar_catalogo(CSV_DATABASE_FILE)
@@ -0,0 +1,435 @@
+# app/ean_service.py
+#
+# Serviço HTTP/JSON residente de inferência de EAN. Mantém o catálogo e o ProductIndex
+# em memória (carregados do snapshot compilado), agrupa as consultas concorrentes que
+# precisam de fuzzy match em micro-lotes e recarrega o catálogo quando o CSV muda.
+#
+#   CSV_DATABASE_FILE=/app/data/catalogo.csv python ean_service.py
+#   curl -X POST localhost:8090/inferir -d '{"marca": "Sadia", "produto": "Peito de Frango"}'
+#   curl -X POST localhost:8090/inferir/lote -d '{"consultas": [{"produto": "..."}, {"códigos_de_barras": "..."}]}'
+#   curl localhost:8090/saude
+#   curl -X POST localhost:8090/recarregar
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from catalog_snapshot import carregar_catalogo, diretorio_snapshot_padrao
+from infer_ean import _buscar_em_worker, _iniciar_worker, inferir_ean, montar_texto_busca
+
+CAMPOS_CONSULTA = ("marca", "produto", "códigos_de_barras")
+
+
+def _normalizar_consulta(consulta):
+    """Mantém só os campos usados na inferência, como strings (None/ausente vira '')."""
+    if not isinstance(consulta, dict):
+        raise ValueError("cada consulta deve ser um objeto JSON")
+    return {campo: "" if consulta.get(campo) is None else str(consulta[campo]) for campo in CAMPOS_CONSULTA}
+
+
+def _percentis_ms(latencias):
+    valores = sorted(latencias)
+    if not valores:
+        return {}
+    def p(q):
+        return round(valores[min(len(valores) - 1, int(round(q / 100 * (len(valores) - 1))))] * 1000, 3)
+    return {"p50_ms": p(50), "p95_ms": p(95), "p99_ms": p(99), "max_ms": round(valores[-1] * 1000, 3)}
+
+
+class _CacheLRU:
+    """Cache LRU (texto de busca -> resultado de ProductIndex.buscar) compartilhado entre threads."""
+
+    def __init__(self, capacidade):
+        self.capacidade = capacidade
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._itens)
+
+    def obter(self, texto):
+        """Retorna (True, resultado) se o texto estiver no cache, senão (False, None)."""
+        with self._lock:
+            if texto not in self._itens:
+                return False, None
+            self._itens.move_to_end(texto)
+            return True, self._itens[texto]
+
+    def guardar(self, texto, resultado):
+        if self.capacidade <= 0:
+            return
+        with self._lock:
+            self._itens[texto] = resultado
+            self._itens.move_to_end(texto)
+            while len(self._itens) > self.capacidade:
+                self._itens.popitem(last=False)
+
+
+class _Catalogo:
+    """Uma versão carregada do catálogo; trocada por inteiro na recarga."""
+
+    def __init__(self, df_produtos, indice, identidade, versao, capacidade_cache, processos=1):
+        self.df_produtos = df_produtos
+        self.indice = indice
+        self.identidade = identidade
+        self.versao = versao
+        self.carregado_em = time.time()
+        self.cache = _CacheLRU(capacidade_cache)
+        # Processos com uma cópia do índice desta versão, para pontuar os textos de um lote em paralelo
+        self.executor = None
+        if processos > 1:
+            self.executor = ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_worker, initargs=(indice,))
+
+    def encerrar(self):
+        """Libera os processos depois que o lote em andamento (se houver) terminar de usá-los."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+
+class ServicoEAN:
+    """
+    Serviço residente de inferência de EAN.
+
+    Consultas que não precisam de fuzzy match (código de barras encontrado no catálogo,
+    texto de busca vazio ou já presente no cache LRU) são respondidas na própria thread
+    da requisição. As demais vão para uma fila consumida por uma única thread, que junta
+    as consultas que chegam dentro de 'janela_ms' (até 'tamanho_max_lote'), pontua cada
+    texto de busca único uma vez e responde cada consulta assim que o seu texto é
+    pontuado. A busca é a limitada do ProductIndex (limitada=True): textos que não podem
+    alcançar o threshold não são pontuados e consultas genéricas pontuam só os textos
+    mais promissores. Por isso o score reportado em 'Baixa Confiança' pode ser menor que
+    o de inferir_ean e, nas consultas genéricas, a correspondência pode diferir.
+
+    Com 'processos' > 1, os textos do lote que não estão no cache são distribuídos de uma
+    vez entre processos com uma cópia do índice (recriados a cada recarga do catálogo);
+    com 1, são pontuados em sequência na thread do lote. Com janela_ms=0 e
+    tamanho_max_lote=1 cada consulta é pontuada sozinha; o cenário 'servico' do
+    benchmark.py mede os dois modos lado a lado (p99 incluso).
+
+    Uma thread de fundo confere a cada 'intervalo_recarga' segundos se o CSV (ou o
+    snapshot compilado) mudou; a nova versão é carregada fora do caminho das consultas e
+    trocada atomicamente, junto com um cache novo.
+    """
+
+    def __init__(self, csv_database_path, threshold_fuzzy=75, match_exaustivo=False,
+                 janela_ms=2.0, tamanho_max_lote=64, intervalo_recarga=5.0,
+                 capacidade_cache=10000, tempo_limite=30.0, processos=1):
+        self.csv_database_path = csv_database_path
+        self.threshold_fuzzy = threshold_fuzzy
+        self.match_exaustivo = match_exaustivo
+        self.janela_s = janela_ms / 1000
+        self.tamanho_max_lote = tamanho_max_lote
+        self.intervalo_recarga = intervalo_recarga
+        self.capacidade_cache = capacidade_cache
+        self.tempo_limite = tempo_limite
+        self.processos = processos
+
+        self._fila = queue.Queue()
+        self._lock_recarga = threading.Lock()
+        self._lock_estatisticas = threading.Lock()
+        self._parar = threading.Event()
+        self.estatisticas = {"consultas": 0, "respostas_imediatas": 0, "em_lote": 0, "lotes": 0,
+                             "textos_pontuados": 0, "recargas": 0, "erros_recarga": 0}
+        self.latencias = deque(maxlen=10000)
+
+        self.catalogo = None
+        if not self.recarregar():
+            raise RuntimeError(f"Não foi possível carregar o catálogo '{csv_database_path}'.")
+
+        threading.Thread(target=self._processar_lotes, daemon=True).start()
+        if intervalo_recarga > 0:
+            threading.Thread(target=self._vigiar_catalogo, daemon=True).start()
+
+    # --- Catálogo ---
+
+    def _identidade_catalogo(self):
+        """Tamanho/mtime do CSV e mtime do meta.json do snapshot (recompilado por fora)."""
+        estado_csv = os.stat(self.csv_database_path)
+        caminho_meta = os.path.join(diretorio_snapshot_padrao(self.csv_database_path), "meta.json")
+        mtime_meta = os.stat(caminho_meta).st_mtime_ns if os.path.exists(caminho_meta) else None
+        return estado_csv.st_size, estado_csv.st_mtime_ns, mtime_meta
+
+    def recarregar(self):
+        """Carrega o catálogo e troca a versão em uso. Retorna False (mantendo a anterior) se falhar."""
+        with self._lock_recarga:
+            try:
+                df_produtos, indice = carregar_catalogo(self.csv_database_path, self.match_exaustivo)
+                # Lida depois da carga: a compilação do snapshot regrava o meta.json
+                identidade = self._identidade_catalogo()
+            except Exception as e:
+                print(f"ERRO ao carregar o catálogo '{self.csv_database_path}': {e}")
+                df_produtos = None
+            if df_produtos is None:
+                with self._lock_estatisticas:
+                    self.estatisticas["erros_recarga"] += 1
+                return False
+            anterior = self.catalogo
+            versao = anterior.versao + 1 if anterior else 1
+            self.catalogo = _Catalogo(df_produtos, indice, identidade, versao, self.capacidade_cache, self.processos)
+            if anterior is not None:
+                anterior.encerrar()
+            with self._lock_estatisticas:
+                self.estatisticas["recargas"] += 1
+            print(f"✅ Catálogo versão {versao} em uso ({len(df_produtos)} registros, {len(indice)} textos únicos).")
+            return True
+
+    def _vigiar_catalogo(self):
+        while not self._parar.wait(self.intervalo_recarga):
+            try:
+                mudou = self._identidade_catalogo() != self.catalogo.identidade
+            except OSError:
+                continue  # CSV sendo substituído; tenta de novo no próximo ciclo
+            if mudou:
+                print(f"Catálogo '{self.csv_database_path}' alterado. Recarregando...")
+                self.recarregar()
+
+    # --- Consultas ---
+
+    def _registrar_latencia(self, inicio, quantidade, imediatas):
+        with self._lock_estatisticas:
+            self.estatisticas["consultas"] += quantidade
+            self.estatisticas["respostas_imediatas"] += imediatas
+            self.estatisticas["em_lote"] += quantidade - imediatas
+            self.latencias.append(time.perf_counter() - inicio)
+
+    def _resolver(self, catalogo, dados, correspondencias=None):
+        ean, status = inferir_ean(dados, catalogo.df_produtos, self.threshold_fuzzy, catalogo.indice,
+                                  correspondencias, verboso=False)
+        return {"ean": None if ean is None else str(ean), "status": status}
+
+    def _texto_pendente(self, catalogo, dados):
+        """Retorna o texto de busca se a consulta precisar de fuzzy match fora do cache, senão None."""
+        ean = dados["códigos_de_barras"].strip()
+        if ean and catalogo.indice.buscar_gtin(ean) is not None:
+            return None
+        texto_busca = montar_texto_busca(dados)
+        if not texto_busca or len(catalogo.indice) == 0:
+            return None
+        return texto_busca
+
+    def inferir(self, consultas):
+        """Infere o EAN de uma lista de consultas (marca, produto, códigos_de_barras)."""
+        inicio = time.perf_counter()
+        catalogo = self.catalogo
+        resultados = [None] * len(consultas)
+        pendentes = []
+        for posicao, consulta in enumerate(consultas):
+            dados = _normalizar_consulta(consulta)
+            texto_busca = self._texto_pendente(catalogo, dados)
+            if texto_busca is None:
+                resultados[posicao] = self._resolver(catalogo, dados)
+                continue
+            encontrado, resultado_busca = catalogo.cache.obter(texto_busca)
+            if encontrado:
+                resultados[posicao] = self._resolver(catalogo, dados, {texto_busca: resultado_busca})
+                continue
+            futuro = Future()
+            self._fila.put((dados, texto_busca, futuro))
+            pendentes.append((posicao, futuro))
+
+        for posicao, futuro in pendentes:
+            resultados[posicao] = futuro.result(timeout=self.tempo_limite)
+        self._registrar_latencia(inicio, len(consultas), len(consultas) - len(pendentes))
+        return resultados
+
+    def _coletar_lote(self):
+        """Bloqueia até a primeira consulta e junta as que chegarem dentro da janela."""
+        lote = [self._fila.get()]
+        prazo = time.perf_counter() + self.janela_s
+        while len(lote) < self.tamanho_max_lote:
+            restante = prazo - time.perf_counter()
+            try:
+                lote.append(self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _processar_lotes(self):
+        while True:
+            lote = self._coletar_lote()
+            catalogo = self.catalogo
+            por_texto = OrderedDict()
+            for dados, texto_busca, futuro in lote:
+                por_texto.setdefault(texto_busca, []).append((dados, futuro))
+
+            with self._lock_estatisticas:
+                self.estatisticas["lotes"] += 1
+                self.estatisticas["textos_pontuados"] += len(por_texto)
+
+            # Com processos, os textos fora do cache são submetidos todos de uma vez
+            buscas = {}
+            for texto_busca in por_texto:
+                encontrado, resultado_busca = catalogo.cache.obter(texto_busca)
+                if encontrado:
+                    buscas[texto_busca] = resultado_busca
+                elif catalogo.executor is not None:
+                    try:
+                        buscas[texto_busca] = catalogo.executor.submit(
+                            _buscar_em_worker, (texto_busca, self.threshold_fuzzy, True))
+                    except BrokenProcessPool:
+                        pass  # pontuado nesta thread, abaixo
+
+            # Responde as consultas de cada texto assim que ele é pontuado, sem esperar o lote todo
+            for texto_busca, consultas in por_texto.items():
+                try:
+                    resultado_busca = buscas.get(texto_busca)
+                    if isinstance(resultado_busca, Future):
+                        try:
+                            resultado_busca = resultado_busca.result()
+                        except BrokenProcessPool:
+                            print("AVISO: processo de busca encerrado inesperadamente; pontuando na thread do lote.")
+                            del buscas[texto_busca]
+                        else:
+                            catalogo.cache.guardar(texto_busca, resultado_busca)
+                    if texto_busca not in buscas:
+                        resultado_busca = catalogo.indice.buscar(
+                            texto_busca, score_minimo=self.threshold_fuzzy, limitada=True)
+                        catalogo.cache.guardar(texto_busca, resultado_busca)
+                    correspondencias = {texto_busca: resultado_busca}
+                    for dados, futuro in consultas:
+                        futuro.set_result(self._resolver(catalogo, dados, correspondencias))
+                except Exception as e:
+                    for _, futuro in consultas:
+                        if not futuro.done():
+                            futuro.set_exception(e)
+
+    def saude(self):
+        catalogo = self.catalogo
+        with self._lock_estatisticas:
+            estatisticas = dict(self.estatisticas)
+            latencias = list(self.latencias)
+        if estatisticas["lotes"]:
+            estatisticas["media_por_lote"] = round(estatisticas["em_lote"] / estatisticas["lotes"], 2)
+        return {
+            "status": "ok",
+            "catalogo": {
+                "csv": self.csv_database_path,
+                "versao": catalogo.versao,
+                "registros": len(catalogo.df_produtos),
+                "textos_unicos": len(catalogo.indice),
+                "carregado_em": catalogo.carregado_em,
+                "cache": len(catalogo.cache),
+            },
+            "fila": self._fila.qsize(),
+            "estatisticas": estatisticas,
+            "latencia_requisicao": _percentis_ms(latencias),
+        }
+
+    def parar(self):
+        self._parar.set()
+        self.catalogo.encerrar()
+
+
+def iniciar_servidor(servico, porta=8090, host="0.0.0.0"):
+    """Serve o ServicoEAN por HTTP numa thread de fundo e retorna o servidor."""
+
+    class _Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # conexões persistentes: evita um handshake por consulta
+        # Cabeçalhos e corpo saem em escritas separadas: com o Nagle ligado, o corpo espera o
+        # ACK atrasado do cliente (~40 ms) em toda resposta de uma conexão persistente
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _responder(self, codigo, corpo):
+            dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+            self.send_response(codigo)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def do_GET(self):
+            if self.path == "/saude":
+                self._responder(200, servico.saude())
+            else:
+                self._responder(404, {"erro": f"Rota desconhecida: {self.path}"})
+
+        def do_POST(self):
+            try:
+                tamanho = int(self.headers.get("Content-Length", 0))
+                if tamanho < 0:
+                    raise ValueError
+            except ValueError:
+                self.close_connection = True  # o corpo não pode ser delimitado
+                self._responder(400, {"erro": "Content-Length inválido."})
+                return
+            corpo = self.rfile.read(tamanho) if tamanho else b""
+            if self.path == "/recarregar":
+                if servico.recarregar():
+                    self._responder(200, {"versao": servico.catalogo.versao})
+                else:
+                    self._responder(500, {"erro": "Falha ao recarregar o catálogo; a versão anterior continua em uso."})
+                return
+            if self.path not in ("/inferir", "/inferir/lote"):
+                self._responder(404, {"erro": f"Rota desconhecida: {self.path}"})
+                return
+
+            try:
+                pedido = json.loads(corpo or b"{}")
+                if self.path == "/inferir":
+                    consultas = [pedido]
+                elif isinstance(pedido, dict) and isinstance(pedido.get("consultas"), list):
+                    consultas = pedido["consultas"]
+                else:
+                    raise ValueError("o corpo deve ter a lista 'consultas'")
+                resultados = servico.inferir(consultas)
+            except ValueError as e:
+                self._responder(400, {"erro": f"Consulta inválida: {e}"})
+                return
+            except TimeoutError:
+                self._responder(504, {"erro": "Tempo limite excedido na inferência."})
+                return
+            except Exception as e:
+                self._responder(500, {"erro": str(e)})
+                return
+
+            if self.path == "/inferir":
+                self._responder(200, resultados[0])
+            else:
+                self._responder(200, {"resultados": resultados})
+
+    servidor = ThreadingHTTPServer((host, porta), _Handler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+if __name__ == "__main__":
+    CSV_DATABASE_FILE = os.getenv("CSV_DATABASE_FILE", "/app/data/ludiiprice_db_17012025.csv")
+    FUZZY_THRESHOLD = int(os.getenv("FUZZY_THRESHOLD", 75))
+    MATCH_EXAUSTIVO = os.getenv("MATCH_EXAUSTIVO", "0") == "1"
+    PORTA_SERVICO_EAN = int(os.getenv("PORTA_SERVICO_EAN", 8090))
+    JANELA_LOTE_MS = float(os.getenv("JANELA_LOTE_MS", 2))
+    TAMANHO_MAX_LOTE = int(os.getenv("TAMANHO_MAX_LOTE", 64))
+    INTERVALO_RECARGA = float(os.getenv("INTERVALO_RECARGA", 5))
+    CACHE_CONSULTAS = int(os.getenv("CACHE_CONSULTAS", 10000))
+    TEMPO_LIMITE_CONSULTA = float(os.getenv("TEMPO_LIMITE_CONSULTA", 30))
+    PROCESSOS_SERVICO_EAN = int(os.getenv("PROCESSOS_SERVICO_EAN", 1))
+
+    servico = ServicoEAN(
+        CSV_DATABASE_FILE,
+        threshold_fuzzy=FUZZY_THRESHOLD,
+        match_exaustivo=MATCH_EXAUSTIVO,
+        janela_ms=JANELA_LOTE_MS,
+        tamanho_max_lote=TAMANHO_MAX_LOTE,
+        intervalo_recarga=INTERVALO_RECARGA,
+        capacidade_cache=CACHE_CONSULTAS,
+        tempo_limite=TEMPO_LIMITE_CONSULTA,
+        processos=PROCESSOS_SERVICO_EAN,
+    )
+    servidor = iniciar_servidor(servico, PORTA_SERVICO_EAN)
+    print(f"Serviço de EAN em http://0.0.0.0:{servidor.server_address[1]} (POST /inferir, POST /inferir/lote, GET /saude, POST /recarregar)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print("Encerrando o serviço de EAN.")
+        servico.parar()
+        servidor.shutdown()
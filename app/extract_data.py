@@ -1,77 +1,622 @@
 import base64
-import requests
 import json
 import os
 import sys
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-OLLAMA_URL = "http://ollama:11434/api/generate"
-MODEL = "gemma3:4b"
+from ollama_client import OllamaClient, OllamaError, RespostaInvalidaError
+from ollama_pool import OllamaPool, carregar_endpoints
+from manifest import Manifest
+from response_cache import ResponseCache, chave_cache
+from result_store import ResultStore
+from telemetry import Telemetria
 
-PASTA_IMAGENS_INPUT = "/app/dataset-images/valid"
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://ollama:11434/api/generate")
+# Pool de servidores Ollama (substitui OLLAMA_URL): URLs separadas por vírgulas ou uma lista
+# JSON com peso e modelos de cada um, ex.:
+#   [{"url": "http://gpu1:11434", "peso": 2}, {"url": "http://gpu2:11434", "modelos": ["gemma3:4b"]}]
+# Aumente MAX_EM_VOO de acordo com a capacidade somada dos servidores.
+OLLAMA_ENDPOINTS = os.getenv("OLLAMA_ENDPOINTS", "")
+MODEL = os.getenv("MODEL", "gemma3:4b")
+# Cascata: com MODELO_GRANDE definido, cada imagem vai primeiro ao MODEL e só é refeita no
+# modelo grande se a resposta não for interpretável, não tiver produto/preço ou se o
+# avaliador do chamador a rejeitar (no pipeline: nenhum EAN acima do FUZZY_THRESHOLD).
+MODELO_GRANDE = os.getenv("MODELO_GRANDE", "")
 
-OUTPUT_DIR = "/app/results"
+PASTA_IMAGENS_INPUT = os.getenv("PASTA_IMAGENS_INPUT", "/app/dataset-images/valid")
+
+OUTPUT_DIR = os.getenv("OUTPUT_DIR", "/app/results")
+
+# Número máximo de requisições simultâneas ao Ollama
+MAX_EM_VOO = int(os.getenv("MAX_EM_VOO", 4))
+# Latência (s) abaixo da qual uma resposta nunca é considerada lenta
+LATENCIA_LENTA_MIN = float(os.getenv("LATENCIA_LENTA_MIN", 30))
+# Atraso máximo (s) entre envios quando o servidor está lento ou com erros
+ATRASO_MAX = float(os.getenv("ATRASO_MAX", 30))
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Saída estruturada: o Ollama devolve JSON restrito a SCHEMA_EXTRACAO (parâmetro 'format')
+# e os resultados vão para um JSONL. SAIDA_ESTRUTURADA=0 volta ao texto livre em .txt.
+SAIDA_ESTRUTURADA = os.getenv("SAIDA_ESTRUTURADA", "1") == "1"
+
+CAMPOS_EXTRACAO = ["marca", "produto", "preço", "unidade", "códigos_de_barras"]
+SCHEMA_EXTRACAO = {
+    "type": "object",
+    "properties": {campo: {"type": "string"} for campo in CAMPOS_EXTRACAO},
+    "required": CAMPOS_EXTRACAO,
+}
+
+if SAIDA_ESTRUTURADA:
+    PROMPT_GEMMA = """
+    Extraia da etiqueta de preço da imagem a marca, o nome do produto, o preço, a unidade
+    e os códigos de barras (somente dígitos). Responda em JSON com os campos marca, produto,
+    preço, unidade e códigos_de_barras. Use "" para campos que não aparecem na imagem.
+    """
+    OPCOES_GERACAO = {"format": SCHEMA_EXTRACAO}
+    ARQUIVO_RESULTADOS = os.path.join(OUTPUT_DIR, "resultado_gemma3:27b-it-qat.jsonl")
+else:
+    PROMPT_GEMMA = """
+    Extraia o nome do produto, marca, preço e unidade da imagem.
+    """
+    OPCOES_GERACAO = {}
+    ARQUIVO_RESULTADOS = os.path.join(OUTPUT_DIR, "resultado_gemma3:27b-it-qat.txt")
+
+# Lotes: TAMANHO_LOTE > 1 envia várias imagens num único prompt e pede uma lista de
+# respostas na mesma ordem (só com saída estruturada). Lotes com a contagem errada ou
+# respostas inválidas voltam para a extração imagem a imagem.
+TAMANHO_LOTE = int(os.getenv("TAMANHO_LOTE", 1))
+if TAMANHO_LOTE > 1 and not SAIDA_ESTRUTURADA:
+    print("AVISO: TAMANHO_LOTE exige SAIDA_ESTRUTURADA=1. Enviando uma imagem por requisição.")
+    TAMANHO_LOTE = 1
+
+PROMPT_LOTE = """
+    Você receberá {n} imagens de etiquetas de preço, numeradas de 1 a {n} na ordem em que
+    foram enviadas. Para cada imagem, extraia a marca, o nome do produto, o preço, a unidade
+    e os códigos de barras (somente dígitos). Responda em JSON com o campo resultados: uma
+    lista com exatamente {n} objetos, um por imagem e na mesma ordem, cada um com os campos
+    indice (1 a {n}), marca, produto, preço, unidade e códigos_de_barras. Use "" para campos
+    que não aparecem na imagem.
+    """
+
+def schema_lote(n):
+    """Schema JSON da resposta a um lote de n imagens."""
+    return {
+        "type": "object",
+        "properties": {
+            "resultados": {
+                "type": "array",
+                "minItems": n,
+                "maxItems": n,
+                "items": {
+                    "type": "object",
+                    "properties": {"indice": {"type": "integer"}, **SCHEMA_EXTRACAO["properties"]},
+                    "required": ["indice", *CAMPOS_EXTRACAO],
+                },
+            },
+        },
+        "required": ["resultados"],
+    }
+
+if OLLAMA_ENDPOINTS:
+    cliente_ollama = OllamaPool(carregar_endpoints(OLLAMA_ENDPOINTS), MODEL, tamanho_pool=MAX_EM_VOO)
+else:
+    cliente_ollama = OllamaClient(OLLAMA_URL, MODEL, tamanho_pool=MAX_EM_VOO)
+
+# Cache de respostas por conteúdo da imagem + modelo + prompt (USAR_CACHE=0 desativa)
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(OUTPUT_DIR, "cache_respostas.sqlite"))
+cache_respostas = ResponseCache(CACHE_PATH) if os.getenv("USAR_CACHE", "1") == "1" else None
+
+# Pré-processamento opcional (PREPROCESSAR=1): redimensiona/recodifica antes do base64
+preprocessador = None
+if os.getenv("PREPROCESSAR", "0") == "1":
+    from image_preprocess import PreProcessadorImagem
+    preprocessador = PreProcessadorImagem(os.path.join(OUTPUT_DIR, "cache_imagens"))
+
+# Tempos por imagem e por etapa + campos de tempo do Ollama (ver telemetry.py).
+# METRICAS_PORTA expõe os totais no formato Prometheus em /metrics.
+telemetria = Telemetria()
+METRICAS_PORTA = int(os.getenv("METRICAS_PORTA", 0))
+
+# Valores que o modelo usa para campos ausentes
+VALORES_AUSENTES = {"", "n/a", "não encontrado", "nao encontrado", "não informado", "não visível"}
+
+# Aberto só na primeira gravação, depois de o manifesto reconciliar o arquivo de resultados
+store_resultados = None
+
+def preparar_imagem(imagem_bytes, nome_imagem=""):
+    """Aplica o pré-processamento aos bytes da imagem, se estiver ativo."""
+    if preprocessador is not None:
+        return preprocessador.processar(imagem_bytes, nome_imagem)
+    return imagem_bytes
+
+def ler_imagem(caminho):
+    """Lê os bytes da imagem, aplicando o pré-processamento se estiver ativo."""
+    with open(caminho, "rb") as f:
+        return preparar_imagem(f.read(), os.path.basename(caminho))
+
 def converter_imagem_para_base64(caminho):
     """Converte uma imagem de um caminho para formato base64."""
+    return base64.b64encode(ler_imagem(caminho)).decode("utf-8")
+
+def extrair_resposta(caminho):
+    """
+    Obtém a resposta do modelo para a imagem, consultando antes o cache de respostas.
+    Levanta OllamaError se a resposta não puder ser obtida.
+    """
     with open(caminho, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
+        return extrair_resposta_de_bytes(f.read(), os.path.basename(caminho))
 
-def enviar_para_ollama(imagem_base64):
-    """Envia a imagem para o modelo Gemma no Ollama e retorna a resposta."""
-    prompt_gemma ="""
-    Extraia o nome do produto, marca, preço e unidade da imagem.
+def extrair_resposta_de_bytes(imagem_bytes, nome_imagem="", modelo=None, consultar_cache=True):
     """
+    Como extrair_resposta, mas para uma imagem já em memória (ex.: um recorte).
+    'modelo' substitui o MODEL (ex.: o modelo grande da cascata). Com consultar_cache=False
+    a resposta não é procurada no cache (quem chama já procurou), mas é guardada nele.
+    """
+    modelo = modelo or MODEL
+    with telemetria.medir(nome_imagem, "codificacao"):
+        imagem_bytes = preparar_imagem(imagem_bytes, nome_imagem)
 
-    payload = {
-        "model": MODEL,
-        "prompt": prompt_gemma,
-        "images": [imagem_base64]
-    }
+    chave = None
+    if cache_respostas is not None:
+        chave = chave_cache(imagem_bytes, modelo, PROMPT_GEMMA, OPCOES_GERACAO)
+        resposta = cache_respostas.obter(chave) if consultar_cache else None
+        if resposta is not None:
+            telemetria.registrar(nome_imagem, cache=True)
+            return resposta
+
+    with telemetria.medir(nome_imagem, "codificacao"):
+        imagem_base64 = base64.b64encode(imagem_bytes).decode("utf-8")
+    resposta = enviar_para_ollama(imagem_base64, nome_imagem, modelo)
+    if SAIDA_ESTRUTURADA:
+        # Valida antes de guardar no cache: respostas fora do schema contam como falha
+        with telemetria.medir(nome_imagem, "parse"):
+            interpretar_resposta_json(resposta)
+    if chave is not None:
+        cache_respostas.guardar(chave, resposta)
+    return resposta
 
+def enviar_para_ollama(imagem_base64, nome_imagem="", modelo=None):
+    """
+    Envia a imagem para o modelo Gemma no Ollama e retorna a resposta, registrando na
+    telemetria os tempos da requisição. Levanta OllamaError se a resposta não puder ser obtida.
+    """
+    modelo = modelo or MODEL
+    resposta, metricas = cliente_ollama.gerar_com_metricas(PROMPT_GEMMA, [imagem_base64], modelo, **OPCOES_GERACAO)
+    # Chamadas ao modelo grande da cascata ficam num registro próprio, para separar os tempos por modelo
+    telemetria.registrar_ollama(nome_imagem if modelo == MODEL else f"{nome_imagem} ({modelo})", metricas)
+    return resposta
+
+def dados_da_resposta(resposta):
+    """
+    Converte a resposta do modelo (JSON ou texto livre) no dicionário de campos extraídos.
+    Levanta RespostaInvalidaError se nenhum campo puder ser lido.
+    """
+    if SAIDA_ESTRUTURADA:
+        return interpretar_resposta_json(resposta)
+    from infer_ean import limpar_saida_gemma, parse_gemma_output
+    dados = parse_gemma_output(limpar_saida_gemma(resposta))
+    if not dados:
+        raise RespostaInvalidaError(f"Resposta sem campos reconhecíveis: {resposta[:200]}")
+    return dados
+
+def motivo_escalada(resposta, nome_imagem="", avaliar=None):
+    """
+    Retorna por que a resposta não é aceitável ('parse', 'campos' ou o motivo devolvido
+    por avaliar(nome, resposta)), ou None se ela for aceitável.
+    """
     try:
-        with requests.post(OLLAMA_URL, json=payload, stream=True) as response:
-            response.raise_for_status()
-            resposta_final = ''.join(
-                json.loads(linha.decode("utf-8")).get("response", "")
-                for linha in response.iter_lines() if linha
-            )
-        return resposta_final.strip()
-    except requests.exceptions.ConnectionError as e:
-        return f"Erro de conexão com o Ollama. Verifique se o serviço 'ollama' está rodando e acessível em {OLLAMA_URL}: {e}"
-    except Exception as e:
-        return f"Erro ao se comunicar com o modelo: {str(e)}"
+        dados = dados_da_resposta(resposta)
+    except RespostaInvalidaError:
+        return "parse"
+    if any(dados.get(campo, "").strip().lower() in VALORES_AUSENTES for campo in ("produto", "preço")):
+        return "campos"
+    return avaliar(nome_imagem, resposta) if avaliar is not None else None
+
+class EstatisticasCascata:
+    """Conta, por modelo da cascata, as imagens respondidas e as respostas rejeitadas por motivo."""
+
+    def __init__(self):
+        self.por_modelo = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, modelo, motivo):
+        with self._lock:
+            estatisticas = self.por_modelo.setdefault(modelo, {"imagens": 0, "rejeitadas": 0, "motivos": {}})
+            estatisticas["imagens"] += 1
+            if motivo:
+                estatisticas["rejeitadas"] += 1
+                estatisticas["motivos"][motivo] = estatisticas["motivos"].get(motivo, 0) + 1
+
+    def resumo(self):
+        with self._lock:
+            return {
+                modelo: {**e, "motivos": dict(e["motivos"]), "taxa_rejeicao": e["rejeitadas"] / e["imagens"]}
+                for modelo, e in self.por_modelo.items()
+            }
+
+cascata = EstatisticasCascata()
+
+def extrair_com_cascata(imagem_bytes, nome_imagem="", avaliar=None, consultar_cache=True):
+    """
+    Extrai a resposta com o MODEL e, se MODELO_GRANDE estiver definido e a resposta for
+    rejeitada (ver motivo_escalada), refaz a extração no modelo grande. Retorna (resposta,
+    modelo que a produziu). Levanta OllamaError se a resposta não puder ser obtida.
+    consultar_cache vale para a resposta do MODEL (ver extrair_resposta_de_bytes).
+    """
+    if not MODELO_GRANDE:
+        return extrair_resposta_de_bytes(imagem_bytes, nome_imagem, MODEL, consultar_cache), MODEL
+
+    try:
+        resposta = extrair_resposta_de_bytes(imagem_bytes, nome_imagem, MODEL, consultar_cache)
+        motivo = motivo_escalada(resposta, nome_imagem, avaliar)
+    except RespostaInvalidaError:
+        motivo = "parse"
+    cascata.registrar(MODEL, motivo)
+    if motivo is None:
+        return resposta, MODEL
+    return _escalar(imagem_bytes, nome_imagem, motivo, avaliar)
+
+def _escalar(imagem_bytes, nome_imagem, motivo, avaliar=None):
+    """
+    Refaz no MODELO_GRANDE a extração de uma imagem cuja resposta do MODEL foi rejeitada.
+    Retorna (resposta, MODELO_GRANDE).
+    """
+    print(f"⬆️ {nome_imagem}: resposta do {MODEL} rejeitada ({motivo}). Escalando para {MODELO_GRANDE}.")
+    telemetria.registrar(nome_imagem, escalada=motivo)
+    try:
+        resposta = extrair_resposta_de_bytes(imagem_bytes, nome_imagem, MODELO_GRANDE)
+    except RespostaInvalidaError:
+        cascata.registrar(MODELO_GRANDE, "parse")
+        raise
+    # No último nível a resposta é mantida; a rejeição só é contabilizada
+    cascata.registrar(MODELO_GRANDE, motivo_escalada(resposta, nome_imagem, avaliar))
+    return resposta, MODELO_GRANDE
+
+def _respostas_do_lote(resposta, n):
+    """
+    Separa a resposta de um lote em n resultados (dicts), na ordem das imagens.
+    Levanta RespostaInvalidaError se a resposta não for uma lista com n objetos cujos
+    'indice' sejam exatamente 1..n: sem isso não há como saber de qual imagem é cada um.
+    """
+    try:
+        resultados = json.loads(resposta)["resultados"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise RespostaInvalidaError(f"Resposta do lote sem a lista 'resultados': {e}") from e
+    if not isinstance(resultados, list) or len(resultados) != n or not all(isinstance(r, dict) for r in resultados):
+        quantidade = len(resultados) if isinstance(resultados, list) else "?"
+        raise RespostaInvalidaError(f"lote de {n} imagens respondido com {quantidade} resultados")
+    indices = [r.get("indice") for r in resultados]
+    if not all(type(indice) is int for indice in indices) or sorted(indices) != list(range(1, n + 1)):
+        raise RespostaInvalidaError(f"lote de {n} imagens respondido com os índices {indices}")
+    return sorted(resultados, key=lambda r: r["indice"])
+
+def _resposta_do_item(resultado):
+    """
+    Monta a resposta JSON individual de um resultado do lote. Levanta RespostaInvalidaError
+    se faltar algum dos campos, que o schema do lote exige em todos os resultados.
+    """
+    faltantes = [campo for campo in CAMPOS_EXTRACAO if campo not in resultado]
+    if faltantes:
+        raise RespostaInvalidaError(f"Resultado do lote sem os campos {faltantes}")
+    resposta = json.dumps({campo: resultado[campo] for campo in CAMPOS_EXTRACAO}, ensure_ascii=False)
+    interpretar_resposta_json(resposta)
+    return resposta
+
+def extrair_respostas_de_lote(lote):
+    """
+    Extrai as respostas de um lote de (nome, bytes) com uma única requisição ao MODEL.
+    Retorna uma lista alinhada ao lote em que cada item é a resposta JSON da imagem ou
+    None quando ela precisa ser extraída individualmente (lote rejeitado pelo servidor,
+    contagem de resultados diferente do número de imagens ou resposta inválida).
+    """
+    nomes = [nome_imagem for nome_imagem, _ in lote]
+    preparadas = []
+    for nome_imagem, imagem_bytes in lote:
+        with telemetria.medir(nome_imagem, "codificacao"):
+            preparadas.append(preparar_imagem(imagem_bytes, nome_imagem))
+
+    # Respostas obtidas em lote ficam no cache com uma chave própria (prompt de lote);
+    # respostas de extrações individuais anteriores também são aproveitadas. Cada imagem
+    # é consultada uma única vez, com as duas chaves.
+    respostas = [None] * len(lote)
+    chaves = [None] * len(lote)
+    if cache_respostas is not None:
+        for i, imagem_bytes in enumerate(preparadas):
+            chaves[i] = chave_cache(imagem_bytes, MODEL, PROMPT_LOTE, {"lote": True})
+            respostas[i] = cache_respostas.obter(
+                chaves[i], chave_cache(imagem_bytes, MODEL, PROMPT_GEMMA, OPCOES_GERACAO))
+            if respostas[i] is not None:
+                telemetria.registrar(nomes[i], cache=True)
+    faltantes = [i for i, resposta in enumerate(respostas) if resposta is None]
+    if len(faltantes) < 2:
+        return respostas
+
+    imagens_base64 = []
+    for i in faltantes:
+        with telemetria.medir(nomes[i], "codificacao"):
+            imagens_base64.append(base64.b64encode(preparadas[i]).decode("utf-8"))
+    n = len(faltantes)
+    try:
+        resposta, metricas = cliente_ollama.gerar_com_metricas(
+            PROMPT_LOTE.format(n=n), imagens_base64, MODEL, format=schema_lote(n))
+        telemetria.registrar_ollama(f"lote de {n}: {nomes[faltantes[0]]}", metricas)
+        with telemetria.medir(nomes[faltantes[0]], "parse"):
+            resultados_lote = _respostas_do_lote(resposta, n)
+    except OllamaError as e:
+        print(f"AVISO: Lote de {n} imagens ({nomes[faltantes[0]]}...) falhou ({e}). Extraindo uma a uma.")
+        return respostas
+
+    for i, resultado in zip(faltantes, resultados_lote):
+        try:
+            resposta_imagem = _resposta_do_item(resultado)
+        except RespostaInvalidaError as e:
+            print(f"AVISO: Imagem '{nomes[i]}' sem resposta válida no lote ({e}). Extraindo sozinha.")
+            continue
+        telemetria.registrar(nomes[i], lote=n)
+        respostas[i] = resposta_imagem
+        if chaves[i] is not None:
+            cache_respostas.guardar(chaves[i], resposta_imagem)
+    return respostas
+
+def extrair_lote_com_cascata(lote, avaliar=None):
+    """
+    Extrai um lote de (nome, bytes) e devolve [(nome, resposta, erro, modelo)] na mesma ordem.
+    Imagens sem resposta válida no lote são extraídas individualmente, sem consultar de
+    novo o cache (extrair_respostas_de_lote já o consultou); no modo cascata,
+    cada resposta do lote passa pelo mesmo critério de escalada da extração individual.
+    """
+    respostas = extrair_respostas_de_lote(lote)
+    resultados = []
+    for (nome_imagem, imagem_bytes), resposta in zip(lote, respostas):
+        modelo = MODEL
+        try:
+            if resposta is None:
+                resposta, modelo = extrair_com_cascata(imagem_bytes, nome_imagem, avaliar, consultar_cache=False)
+            elif MODELO_GRANDE:
+                motivo = motivo_escalada(resposta, nome_imagem, avaliar)
+                cascata.registrar(MODEL, motivo)
+                if motivo is not None:
+                    resposta, modelo = _escalar(imagem_bytes, nome_imagem, motivo, avaliar)
+        except OllamaError as e:
+            resultados.append((nome_imagem, None, e, None))
+            continue
+        resultados.append((nome_imagem, resposta, None, modelo))
+    return resultados
+
+def imprimir_resumo_cascata():
+    for modelo, estatisticas in cascata.resumo().items():
+        motivos = ", ".join(f"{motivo}: {total}" for motivo, total in sorted(estatisticas["motivos"].items()))
+        acao = "escaladas" if modelo == MODEL else "ainda rejeitadas"
+        print(f"Cascata {modelo}: {estatisticas['imagens']} imagens, {estatisticas['rejeitadas']} {acao} "
+              f"({estatisticas['taxa_rejeicao']:.1%}){' - ' + motivos if motivos else ''}.")
+
+def imprimir_resumo_endpoints():
+    if not isinstance(cliente_ollama, OllamaPool):
+        return
+    for url, estatisticas in cliente_ollama.resumo().items():
+        vazao = f"{estatisticas['imagens_por_s']} imagens/s" if estatisticas["imagens_por_s"] is not None else "sem imagens"
+        print(f"Endpoint {url} (peso {estatisticas['peso']:g}): {estatisticas['imagens']} imagens, {vazao}, "
+              f"{estatisticas['requisicoes']} requisições, {estatisticas['falhas']} falhas, "
+              f"{estatisticas['reenfileiradas']} reenviadas a outro endpoint, {estatisticas['quedas']} quedas"
+              f"{'' if estatisticas['saudavel'] else ' - fora do ar'}.")
+
+def salvar_telemetria():
+    """
+    Grava o relatório de telemetria do run (telemetria_<data>_<hora>.json e .csv) em
+    OUTPUT_DIR e imprime o resumo por etapa e por modelo.
+    """
+    resumo = telemetria.resumo()
+    if not resumo["imagens"]:
+        return
+    base = os.path.join(OUTPUT_DIR, time.strftime("telemetria_%Y%m%d_%H%M%S"))
+    telemetria.salvar_json(base + ".json")
+    telemetria.salvar_csv(base + ".csv")
+    for etapa, estatisticas in resumo["etapas"].items():
+        print(f"Telemetria {etapa}: média {estatisticas['media_ms']:.1f} ms, p95 {estatisticas['p95_ms']:.1f} ms "
+              f"({estatisticas['imagens']} imagens).")
+    for modelo, estatisticas in resumo["modelos"].items():
+        print(f"Telemetria {modelo}: {estatisticas['tokens_por_s']} tokens/s, {estatisticas['recargas']} recargas; "
+              f"tempo no servidor: carga {estatisticas['fracao_carga'] or 0:.0%}, prompt {estatisticas['fracao_prompt'] or 0:.0%}, "
+              f"geração {estatisticas['fracao_geracao'] or 0:.0%}.")
+    print(f"Relatório de telemetria salvo em '{base}.json' e '{base}.csv'.")
+
+def interpretar_resposta_json(resposta):
+    """
+    Converte a resposta estruturada do modelo no dicionário de campos extraídos.
+    Levanta RespostaInvalidaError se não for um objeto JSON com os campos esperados.
+    """
+    try:
+        dados = json.loads(resposta)
+    except ValueError as e:
+        raise RespostaInvalidaError(f"Resposta não é JSON válido: {e}") from e
+    if not isinstance(dados, dict) or not any(campo in dados for campo in CAMPOS_EXTRACAO):
+        raise RespostaInvalidaError(f"Resposta JSON sem os campos esperados: {resposta[:200]}")
+    return {campo: "" if dados.get(campo) is None else str(dados.get(campo)).strip() for campo in CAMPOS_EXTRACAO}
+
+def montar_bloco(nome_imagem, resultado_gemma):
+    """Monta o bloco de texto gravado no arquivo de resultados para uma imagem."""
+    return f"Imagem: {nome_imagem}\n" + resultado_gemma + "\n" + "="*40 + "\n"
+
+def salvar_bloco(bloco):
+    """Acrescenta um bloco inteiro ao arquivo de resultados com uma única escrita."""
+    output_file_path = os.path.join(OUTPUT_DIR, "resultado_gemma3:27b-it-qat.txt")
+    with open(output_file_path, "a", encoding="utf-8") as f:
+        f.write(bloco)
+        f.flush()
+        os.fsync(f.fileno())
+
+def salvar_resultado(nome_imagem, resultado_gemma, modelo=None):
+    """
+    Grava o resultado de uma imagem no JSONL (saída estruturada) ou como bloco de texto
+    e retorna o tamanho do arquivo de resultados após a gravação. 'modelo' é o modelo que
+    produziu a resposta (padrão: MODEL), registrado no JSONL.
+    """
+    global store_resultados
+    if SAIDA_ESTRUTURADA:
+        if store_resultados is None:
+            store_resultados = ResultStore(ARQUIVO_RESULTADOS)
+        store_resultados.adicionar(nome_imagem, interpretar_resposta_json(resultado_gemma), modelo=modelo or MODEL)
+    else:
+        salvar_bloco(montar_bloco(nome_imagem, resultado_gemma))
+    return os.path.getsize(ARQUIVO_RESULTADOS)
+
+def registrar_falha(nome_imagem, erro):
+    """Registra uma imagem cuja extração falhou em falhas.txt (apenas para consulta)."""
+    print(f"❌ Falha ao processar {nome_imagem}: {erro}")
+    with open(os.path.join(OUTPUT_DIR, "falhas.txt"), "a", encoding="utf-8") as f:
+        f.write(f"{nome_imagem}\t{erro}\n")
 
 def processar_imagem(caminho):
     """Processa uma única imagem: converte, envia para Ollama e salva o resultado."""
     print(f"Processando: {os.path.basename(caminho)}...")
-    imagem_base64 = converter_imagem_para_base64(caminho)
-    resultado_gemma = enviar_para_ollama(imagem_base64)
+    try:
+        resultado_gemma = extrair_resposta(caminho)
+    except OllamaError as e:
+        registrar_falha(os.path.basename(caminho), e)
+        return
     print("--- Resposta do Gemma ---")
     print(resultado_gemma)
     print("------------------------")
 
-    output_file_path = os.path.join(OUTPUT_DIR, "resultado_gemma3:27b-it-qat.txt")
-    with open(output_file_path, "a", encoding="utf-8") as f:
-        f.write(f"Imagem: {os.path.basename(caminho)}\n")
-        f.write(resultado_gemma + "\n")
-        f.write("="*40 + "\n")
-
-def ler_ultima_imagem_processada():
-    """Lê o nome da última imagem processada para retomar o processamento."""
-    prog_file_path = os.path.join(OUTPUT_DIR, "progresso.txt")
-    if os.path.exists(prog_file_path):
-        with open(prog_file_path, "r", encoding="utf-8") as f:
-            return f.read().strip()
-    return None
-
-def salvar_ultima_imagem_processada(nome):
-    """Salva o nome da última imagem processada."""
-    prog_file_path = os.path.join(OUTPUT_DIR, "progresso.txt")
-    with open(prog_file_path, "w", encoding="utf-8") as f:
-        f.write(nome)
+    salvar_resultado(os.path.basename(caminho), resultado_gemma)
+
+class ControleAdaptativo:
+    """
+    Limita o número de requisições em voo e ajusta o ritmo de envio (AIMD).
+
+    Respostas com erro ou mais lentas que o dobro da média móvel (e acima de
+    LATENCIA_LENTA_MIN) reduzem a janela pela metade e dobram o atraso entre envios;
+    respostas normais aumentam a janela em uma unidade e reduzem o atraso pela metade.
+    """
+
+    def __init__(self, max_em_voo, latencia_lenta_min=LATENCIA_LENTA_MIN, atraso_max=ATRASO_MAX):
+        self.max_em_voo = max_em_voo
+        self.latencia_lenta_min = latencia_lenta_min
+        self.atraso_max = atraso_max
+        self.limite = float(max_em_voo)
+        self.em_voo = 0
+        self.atraso = 0.0
+        self.latencia_media = None
+        self._cond = threading.Condition()
+
+    def aguardar_vaga(self):
+        """Bloqueia até haver vaga na janela e aplica o atraso atual antes do envio."""
+        with self._cond:
+            while self.em_voo >= int(self.limite):
+                self._cond.wait()
+            self.em_voo += 1
+            atraso = self.atraso
+        if atraso:
+            time.sleep(atraso)
+
+    def registrar(self, latencia, ok):
+        """Libera a vaga de uma requisição concluída e ajusta janela e atraso."""
+        with self._cond:
+            self.em_voo -= 1
+            lenta = (
+                self.latencia_media is not None
+                and latencia > max(self.latencia_lenta_min, 2 * self.latencia_media)
+            )
+            if not ok or lenta:
+                self.limite = max(1.0, self.limite / 2)
+                self.atraso = min(self.atraso_max, max(1.0, self.atraso * 2))
+            else:
+                self.limite = min(float(self.max_em_voo), self.limite + 1)
+                self.atraso = self.atraso / 2 if self.atraso >= 0.1 else 0.0
+            if ok:
+                self.latencia_media = latencia if self.latencia_media is None else 0.8 * self.latencia_media + 0.2 * latencia
+            self._cond.notify_all()
+
+def _extrair_imagem(nome_imagem, imagem_bytes, controle, avaliar=None):
+    """Executa a extração de uma imagem numa thread e devolve (nome, resposta, erro, modelo)."""
+    inicio = time.monotonic()
+    try:
+        resultado_gemma, modelo = extrair_com_cascata(imagem_bytes, nome_imagem, avaliar)
+    except OllamaError as e:
+        controle.registrar(time.monotonic() - inicio, False)
+        return nome_imagem, None, e, None
+    latencia = time.monotonic() - inicio
+    controle.registrar(latencia, True)
+    print(f"✅ {nome_imagem} ({latencia:.1f}s)")
+    return nome_imagem, resultado_gemma, None, modelo
+
+def _extrair_lote(lote, controle, avaliar=None):
+    """Executa a extração de um lote numa thread e devolve [(nome, resposta, erro, modelo)]."""
+    if len(lote) == 1:
+        return [_extrair_imagem(*lote[0], controle, avaliar)]
+    inicio = time.monotonic()
+    resultados = extrair_lote_com_cascata(lote, avaliar)
+    latencia = time.monotonic() - inicio
+    falhas = sum(1 for _, resposta, _, _ in resultados if resposta is None)
+    controle.registrar(latencia, falhas == 0)
+    print(f"✅ Lote de {len(lote)} imagens a partir de {lote[0][0]} ({latencia:.1f}s, {falhas} falhas)")
+    return resultados
+
+def _agrupar(imagens, tamanho):
+    lote = []
+    for item in imagens:
+        lote.append(item)
+        if len(lote) == tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def extrair_em_fluxo(imagens, max_em_voo=MAX_EM_VOO, avaliar=None, tamanho_lote=None):
+    """
+    Extrai as respostas de um iterável de (nome, bytes da imagem) com até max_em_voo
+    requisições simultâneas ao Ollama e gera (nome, resposta, erro, modelo) na mesma ordem
+    da entrada, à medida que ficam prontas. 'resposta' e 'modelo' são None quando a extração
+    falha; senão 'modelo' é o modelo que produziu a resposta (o grande, se houve escalada).
+    No modo cascata, avaliar(nome, resposta) pode rejeitar respostas do modelo pequeno
+    devolvendo o motivo (ver extrair_com_cascata). Com tamanho_lote > 1 (padrão:
+    TAMANHO_LOTE), cada requisição leva um lote de imagens (ver extrair_lote_com_cascata).
+
+    A entrada é consumida sob demanda: no máximo max_em_voo * 4 lotes ficam em memória.
+    """
+    controle = ControleAdaptativo(max_em_voo)
+    pendentes = deque()
+
+    with ThreadPoolExecutor(max_workers=max_em_voo) as executor:
+        for lote in _agrupar(imagens, tamanho_lote or TAMANHO_LOTE):
+            controle.aguardar_vaga()
+            pendentes.append(executor.submit(_extrair_lote, lote, controle, avaliar))
+            while pendentes and pendentes[0].done():
+                yield from pendentes.popleft().result()
+            # Limita a memória usada por respostas prontas aguardando uma anterior lenta
+            while len(pendentes) > max_em_voo * 4:
+                yield from pendentes.popleft().result()
+        while pendentes:
+            yield from pendentes.popleft().result()
+
+def _ler_imagens(caminhos):
+    for caminho in caminhos:
+        with open(caminho, "rb") as f:
+            yield os.path.basename(caminho), f.read()
+
+def processar_imagens_concorrente(caminhos, max_em_voo=MAX_EM_VOO, manifesto=None):
+    """
+    Processa as imagens com até max_em_voo requisições simultâneas ao Ollama.
+
+    Os blocos são gravados inteiros e na mesma ordem de 'caminhos', independentemente
+    da ordem em que as respostas chegam. Imagens que falham não entram no arquivo de
+    resultados. Se houver manifesto, cada resultado (ou falha) é confirmado nele logo
+    após a gravação.
+    """
+    caminho_por_nome = {os.path.basename(caminho): caminho for caminho in caminhos}
+    for nome_imagem, resultado_gemma, erro, modelo in extrair_em_fluxo(_ler_imagens(caminhos), max_em_voo):
+        if resultado_gemma is None:
+            registrar_falha(nome_imagem, erro)
+            if manifesto is not None:
+                manifesto.registrar(caminho_por_nome[nome_imagem], "falha", erro=erro)
+            continue
+        fim_resultados = salvar_resultado(nome_imagem, resultado_gemma, modelo)
+        if manifesto is not None:
+            manifesto.registrar(caminho_por_nome[nome_imagem], "ok", fim_resultados, arquivo_resultados=ARQUIVO_RESULTADOS)
 
 if __name__ == "__main__":
 
@@ -86,22 +631,39 @@ if __name__ == "__main__":
 
     print(f"Total de {len(caminhos)} imagens encontradas para processar.")
 
-    print("Se quiser retomar de um ponto específico, digite o nome do arquivo (ex: 1003.jpg). Deixe em branco para começar do início.")
-    inicio = input("Arquivo para começar (ou Enter): ").strip()
-    pular = bool(inicio)
+    # O manifesto registra cada imagem concluída; um novo run retoma de onde parou
+    manifesto = Manifest(os.path.join(OUTPUT_DIR, "manifesto.jsonl"))
+    manifesto.reconciliar_resultados(ARQUIVO_RESULTADOS)
+    total_imagens = len(caminhos)
+    caminhos = manifesto.pendentes(caminhos)
+    print(f"{total_imagens - len(caminhos)} imagens já concluídas; {len(caminhos)} na fila (novas, alteradas ou com falha).")
 
-    for caminho_completo_imagem in caminhos:
-        nome_arquivo_imagem = os.path.basename(caminho_completo_imagem)
-        if pular:
-            if nome_arquivo_imagem == inicio:
-                pular = False
-                print(f"Retomando o processamento a partir de: {nome_arquivo_imagem}")
-            else:
-                print(f"Pulando: {nome_arquivo_imagem}")
-                continue
+    if METRICAS_PORTA:
+        telemetria.iniciar_servidor_metricas(METRICAS_PORTA)
+
+    print(f"Processando com até {MAX_EM_VOO} requisições simultâneas ao Ollama.")
+    if isinstance(cliente_ollama, OllamaPool):
+        print(f"Distribuindo entre {len(cliente_ollama.endpoints)} endpoints: {cliente_ollama.url}.")
+    if TAMANHO_LOTE > 1:
+        print(f"Enviando lotes de até {TAMANHO_LOTE} imagens por requisição.")
+    if MODELO_GRANDE:
+        print(f"Modo cascata: {MODEL} primeiro, escalando para {MODELO_GRANDE} quando necessário.")
+    processar_imagens_concorrente(caminhos, MAX_EM_VOO, manifesto)
+    manifesto.fechar()
+
+    if cache_respostas is not None:
+        estatisticas = cache_respostas.estatisticas()
+        print(f"Cache de respostas: {estatisticas['acertos']} acertos, {estatisticas['falhas']} falhas "
+              f"({estatisticas['taxa_acerto']:.0%}), {estatisticas['entradas']} entradas.")
+
+    if preprocessador is not None:
+        resumo = preprocessador.resumo()
+        preprocessador.salvar_relatorio(os.path.join(OUTPUT_DIR, "preprocessamento.csv"))
+        print(f"Pré-processamento: {resumo['imagens']} imagens, {resumo['bytes_economizados']} bytes economizados "
+              f"({resumo['reducao']:.0%}), {resumo['latencia_media_ms']:.1f} ms/imagem em média.")
 
-        processar_imagem(caminho_completo_imagem)
-        salvar_ultima_imagem_processada(nome_arquivo_imagem)
-        time.sleep(2)
+    imprimir_resumo_endpoints()
+    imprimir_resumo_cascata()
+    salvar_telemetria()
 
     print("\nProcessamento de todas as imagens concluído.")
\ No newline at end of file
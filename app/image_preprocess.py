@@ -0,0 +1,117 @@
+# app/image_preprocess.py
+
+import csv
+import hashlib
+import io
+import os
+import threading
+import time
+
+from PIL import Image
+
+PREPROC_LADO_MAX = int(os.getenv("PREPROC_LADO_MAX", 1024))
+PREPROC_CINZA = os.getenv("PREPROC_CINZA", "0") == "1"
+PREPROC_QUALIDADE = int(os.getenv("PREPROC_QUALIDADE", 85))
+
+
+class PreProcessadorImagem:
+    """
+    Reduz o tamanho das imagens antes do envio ao modelo de visão.
+
+    Redimensiona para que o maior lado não passe de lado_max, converte para tons de
+    cinza se pedido e recodifica como JPEG na qualidade indicada. O resultado fica em
+    cache no disco (chave: SHA-256 dos bytes originais + parâmetros). Se a versão
+    processada não for menor que a original, a original é usada; o mesmo vale para
+    imagens que o PIL não consegue decodificar, que seguem sem alteração.
+
+    Registra, por imagem, bytes originais, bytes finais e latência, para calibrar os
+    parâmetros contra a acurácia da extração.
+    """
+
+    def __init__(self, diretorio_cache, lado_max=PREPROC_LADO_MAX, cinza=PREPROC_CINZA,
+                 qualidade=PREPROC_QUALIDADE):
+        self.diretorio_cache = diretorio_cache
+        self.lado_max = lado_max
+        self.cinza = cinza
+        self.qualidade = qualidade
+        self.registros = []
+        self._lock = threading.Lock()
+        os.makedirs(diretorio_cache, exist_ok=True)
+
+    def _parametros(self):
+        return f"lado_max={self.lado_max};cinza={int(self.cinza)};qualidade={self.qualidade}"
+
+    def _converter(self, imagem_bytes):
+        with Image.open(io.BytesIO(imagem_bytes)) as imagem:
+            imagem.load()
+            if self.cinza:
+                imagem = imagem.convert("L")
+            elif imagem.mode not in ("RGB", "L"):
+                imagem = imagem.convert("RGB")
+            if max(imagem.size) > self.lado_max:
+                imagem.thumbnail((self.lado_max, self.lado_max), Image.LANCZOS)
+            saida = io.BytesIO()
+            imagem.save(saida, format="JPEG", quality=self.qualidade, optimize=True)
+        return saida.getvalue()
+
+    def processar(self, imagem_bytes, nome_imagem=""):
+        """Retorna os bytes da imagem pré-processada (do cache em disco, se disponível)."""
+        inicio = time.perf_counter()
+        chave = hashlib.sha256(imagem_bytes + self._parametros().encode("utf-8")).hexdigest()
+        caminho_cache = os.path.join(self.diretorio_cache, chave + ".jpg")
+
+        do_cache = os.path.exists(caminho_cache)
+        if do_cache:
+            with open(caminho_cache, "rb") as f:
+                resultado = f.read()
+        else:
+            try:
+                resultado = self._converter(imagem_bytes)
+            except (OSError, Image.DecompressionBombError) as e:
+                # Formato que o PIL não lê ou arquivo corrompido: envia os bytes originais e
+                # deixa o modelo decidir, sem derrubar o lote. Não vai para o cache.
+                print(f"AVISO: Não foi possível pré-processar a imagem '{nome_imagem}' ({e}). Usando a original.")
+                resultado = imagem_bytes
+            else:
+                if len(resultado) >= len(imagem_bytes):
+                    resultado = imagem_bytes
+                caminho_temp = f"{caminho_cache}.{threading.get_ident()}.tmp"
+                with open(caminho_temp, "wb") as f:
+                    f.write(resultado)
+                os.replace(caminho_temp, caminho_cache)
+
+        with self._lock:
+            self.registros.append({
+                "imagem": nome_imagem,
+                "bytes_originais": len(imagem_bytes),
+                "bytes_finais": len(resultado),
+                "latencia_ms": round((time.perf_counter() - inicio) * 1000, 2),
+                "do_cache": do_cache,
+            })
+        return resultado
+
+    def resumo(self):
+        with self._lock:
+            registros = list(self.registros)
+        if not registros:
+            return {"imagens": 0, "bytes_originais": 0, "bytes_finais": 0, "bytes_economizados": 0,
+                    "reducao": 0.0, "latencia_media_ms": 0.0}
+        originais = sum(r["bytes_originais"] for r in registros)
+        finais = sum(r["bytes_finais"] for r in registros)
+        return {
+            "imagens": len(registros),
+            "bytes_originais": originais,
+            "bytes_finais": finais,
+            "bytes_economizados": originais - finais,
+            "reducao": (originais - finais) / originais if originais else 0.0,
+            "latencia_media_ms": sum(r["latencia_ms"] for r in registros) / len(registros),
+        }
+
+    def salvar_relatorio(self, caminho_csv):
+        """Grava os registros por imagem em CSV."""
+        with self._lock:
+            registros = list(self.registros)
+        with open(caminho_csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=["imagem", "bytes_originais", "bytes_finais", "latencia_ms", "do_cache"])
+            writer.writeheader()
+            writer.writerows(registros)
@@ -3,7 +3,10 @@
 import pandas as pd
 import os
 import re
-from fuzzywuzzy import process
+from concurrent.futures import ProcessPoolExecutor
+from catalog_snapshot import carregar_catalogo
+from product_index import ProductIndex, normalizar_gtin
+from result_store import ResultStore
 # import csv # No longer need csv module directly for this approach
 
 # --- Funções Auxiliares (mantidas as mesmas, exceto carregar_base_dados_produtos) ---
@@ -21,6 +24,13 @@ def parse_gemma_output(gemma_output_text):
         data[key_cleaned] = value.strip()
     return data
 
+def limpar_saida_gemma(gemma_output_text):
+    """Remove linhas vazias e a frase introdutória da resposta do Gemma, como na leitura dos arquivos de resultados."""
+    linhas = (linha.strip() for linha in gemma_output_text.splitlines())
+    return "\n".join(
+        linha for linha in linhas if linha and not linha.startswith("Aqui estão as informações")
+    )
+
 def carregar_base_dados_produtos(csv_database_path):
     """
     Carrega o CSV da base de dados de produtos, assumindo um formato CSV padrão
@@ -64,11 +74,11 @@ def carregar_base_dados_produtos(csv_database_path):
         
         # Cria a coluna comparable_text_db combinando marca e nome
         df['comparable_text_db'] = (df['brand'] + ' ' + df['name']).str.lower().str.strip()
-        df['comparable_text_db'] = df['comparable_text_db'].apply(lambda x: ' '.join(x.split()))
+        df['comparable_text_db'] = df['comparable_text_db'].str.split().str.join(' ')
 
         print(f"\nBase de dados de produtos carregada com sucesso. {len(df)} registros.")
         
-        empty_comparable_count = df['comparable_text_db'].apply(len).eq(0).sum()
+        empty_comparable_count = df['comparable_text_db'].str.len().eq(0).sum()
         if empty_comparable_count > 0:
             print(f"AVISO: {empty_comparable_count} registros em 'comparable_text_db' estão vazios após o processamento.")
             print("Isso pode indicar que as colunas 'brand' e 'name' no seu CSV original estavam vazias ou não continham dados relevantes.")
@@ -85,23 +95,11 @@ def carregar_base_dados_produtos(csv_database_path):
         traceback.print_exc()
         return None
 
-def inferir_ean(dados_extraidos, df_produtos, threshold_fuzzy):
-    # --- Essa função permanece a mesma ---
+def montar_texto_busca(dados_extraidos):
+    """Monta o texto de busca normalizado (marca + produto) usado no fuzzy match."""
     marca_extraida = dados_extraidos.get('marca', '').strip()
     produto_extraido = dados_extraidos.get('produto', '').strip()
 
-    print(f"\n--- Tentando inferir EAN para: '{produto_extraido}' (Marca: '{marca_extraida}') ---")
-
-    ean_do_gemma = dados_extraidos.get('códigos_de_barras', '').strip()
-    if ean_do_gemma and ean_do_gemma.isdigit() and len(ean_do_gemma) >= 8: 
-        match_ean_df = df_produtos[df_produtos['ean'] == ean_do_gemma]
-        if not match_ean_df.empty:
-            infered_ean = match_ean_df.iloc[0]['ean']
-            print(f"✅ EAN inferido por código de barras direto: {infered_ean}")
-            return infered_ean, "Correspondência Direta por EAN"
-        else:
-            print(f"🔍 Código de barras '{ean_do_gemma}' não encontrado na base de dados. Tentando fuzzy match...")
-
     texto_busca_extraido = ""
     if marca_extraida and produto_extraido:
         texto_busca_extraido = (marca_extraida + ' ' + produto_extraido).lower().strip()
@@ -109,129 +107,214 @@ def inferir_ean(dados_extraidos, df_produtos, threshold_fuzzy):
         texto_busca_extraido = produto_extraido.lower().strip()
     elif marca_extraida:
         texto_busca_extraido = marca_extraida.lower().strip()
-    
-    texto_busca_extraido = ' '.join(texto_busca_extraido.split())
+
+    return ' '.join(texto_busca_extraido.split())
+
+def _sem_log(*args, **kwargs):
+    pass
+
+def inferir_ean(dados_extraidos, df_produtos, threshold_fuzzy, indice=None, correspondencias=None, verboso=True):
+    """
+    Infere o EAN de um registro extraído pelo Gemma, primeiro pelo código de barras lido
+    (normalizado para GTIN-14 e com dígito verificador validado) e depois por fuzzy match
+    de marca + produto contra o catálogo.
+
+    'indice' é um ProductIndex construído uma vez a partir de df_produtos. Se não for
+    informado, um índice exaustivo é construído a cada chamada (comportamento antigo).
+    'correspondencias' é um dicionário opcional texto de busca -> resultado de
+    ProductIndex.buscar já calculado (ver inferir_eans_em_lote). Com verboso=False nada
+    é impresso (ex.: no serviço residente).
+    """
+    log = print if verboso else _sem_log
+    marca_extraida = dados_extraidos.get('marca', '').strip()
+    produto_extraido = dados_extraidos.get('produto', '').strip()
+
+    log(f"\n--- Tentando inferir EAN para: '{produto_extraido}' (Marca: '{marca_extraida}') ---")
+
+    if indice is None:
+        indice = ProductIndex(df_produtos, exaustivo=True)
+
+    ean_do_gemma = dados_extraidos.get('códigos_de_barras', '').strip()
+    posicao_ean = indice.buscar_gtin(ean_do_gemma) if ean_do_gemma else None
+    if posicao_ean is not None:
+        infered_ean = df_produtos.iloc[posicao_ean]['ean']
+        log(f"✅ EAN inferido por código de barras direto: {infered_ean}")
+        return infered_ean, "Correspondência Direta por EAN"
+    elif ean_do_gemma and normalizar_gtin(ean_do_gemma) is not None:
+        log(f"🔍 Código de barras '{ean_do_gemma}' não encontrado na base de dados. Tentando fuzzy match...")
+    elif ean_do_gemma.replace(' ', '').replace('-', '').isdigit():
+        log(f"🔍 Código de barras '{ean_do_gemma}' inválido (tamanho ou dígito verificador). Tentando fuzzy match...")
+
+    texto_busca_extraido = montar_texto_busca(dados_extraidos)
 
     if not texto_busca_extraido:
-        print("❌ Não foi possível inferir EAN: Nome do produto e/ou marca não extraídos ou vazios para fuzzy match.")
+        log("❌ Não foi possível inferir EAN: Nome do produto e/ou marca não extraídos ou vazios para fuzzy match.")
         return None, "Dados insuficientes do Gemma para Fuzzy Match"
 
-    choices_to_search = df_produtos['comparable_text_db'].tolist()
-    
-    choices_to_search = [choice for choice in choices_to_search if choice.strip()] 
-    
-    if not choices_to_search:
-        print("❌ Nenhuma opção de busca VÁLIDA disponível na base de dados para fuzzy match (todos os valores são vazios ou irrelevantes).")
+    if len(indice) == 0:
+        log("❌ Nenhuma opção de busca VÁLIDA disponível na base de dados para fuzzy match (todos os valores são vazios ou irrelevantes).")
         return None, "Base de Dados Inválida para Fuzzy Match"
     
-    print(f"DEBUG: Texto de busca para fuzzy match: '{texto_busca_extraido}'")
-    print(f"DEBUG: Total de escolhas válidas na base de dados para fuzzy match: {len(choices_to_search)}")
-    if len(choices_to_search) > 0:
-        print(f"DEBUG: Primeiras 5 escolhas válidas na base de dados: {choices_to_search[:min(5, len(choices_to_search))]}")
+    log(f"DEBUG: Texto de busca para fuzzy match: '{texto_busca_extraido}'")
+    log(f"DEBUG: Total de escolhas válidas na base de dados para fuzzy match: {len(indice)}")
 
-    best_match_info = process.extractOne(texto_busca_extraido, choices_to_search)
+    if correspondencias is not None and texto_busca_extraido in correspondencias:
+        best_match_info = correspondencias[texto_busca_extraido]
+    else:
+        best_match_info = indice.buscar(texto_busca_extraido, score_minimo=threshold_fuzzy)
 
     if best_match_info:
-        if len(best_match_info) == 3:
-            matched_text_db, score, index_in_list = best_match_info
-        elif len(best_match_info) == 2:
-            matched_text_db, score = best_match_info
-            index_in_list = None 
-            print(f"AVISO: process.extractOne retornou apenas 2 valores. Prosseguindo sem o índice direto.")
-        else:
-            print(f"ERRO CRÍTICO: process.extractOne retornou um número inesperado de valores: {best_match_info}")
-            return None, "Erro Interno: Retorno inesperado de fuzzywuzzy"
+        posicao_db, matched_text_db, score = best_match_info
 
         if score >= threshold_fuzzy:
-            original_row = df_produtos.loc[df_produtos['comparable_text_db'] == matched_text_db]
-            
-            if not original_row.empty:
-                best_match_ean = original_row.iloc[0]['ean']
-                print(f"✅ EAN inferido por fuzzy match: {best_match_ean} (Score: {score})")
-                return best_match_ean, f"Fuzzy Match (Score: {score})"
-            else:
-                print(f"❌ Erro interno: Correspondência fuzzy encontrada ('{matched_text_db}'), mas não foi possível localizá-la na base de dados original.")
-                return None, "Erro Interno de Correspondência DB"
+            best_match_ean = df_produtos.iloc[posicao_db]['ean']
+            log(f"✅ EAN inferido por fuzzy match: {best_match_ean} (Score: {score})")
+            return best_match_ean, f"Fuzzy Match (Score: {score})"
         else:
-            print(f"❌ Não foi possível inferir EAN com alta confiança. Melhor score: {score} < {threshold_fuzzy}.")
-            print(f"   Melhor correspondência DB: '{matched_text_db}'")
+            log(f"❌ Não foi possível inferir EAN com alta confiança. Melhor score: {score} < {threshold_fuzzy}.")
+            log(f"   Melhor correspondência DB: '{matched_text_db}'")
             return None, f"Baixa Confiança (Score: {score})"
     else:
-        print("❌ Nenhuma correspondência fuzzy relevante encontrada na base de dados para o produto.")
+        log("❌ Nenhuma correspondência fuzzy relevante encontrada na base de dados para o produto.")
         return None, "Nenhuma Correspondência Fuzzy Encontrada"
 
+# Índice usado pelos processos do modo em lote (definido no initializer de cada worker)
+_indice_worker = None
+
+def _iniciar_worker(indice):
+    global _indice_worker
+    _indice_worker = indice
+
+def _buscar_em_worker(args):
+    texto_busca, threshold_fuzzy, limitada = args
+    return _indice_worker.buscar(texto_busca, score_minimo=threshold_fuzzy, limitada=limitada)
+
+def inferir_eans_em_lote(lista_dados_extraidos, df_produtos, threshold_fuzzy, indice, workers=None, verboso=True):
+    """
+    Infere os EANs de vários registros de uma vez.
+
+    Os textos de busca são coletados e de-duplicados antes do fuzzy match, e cada texto
+    único é pontuado uma única vez, distribuído entre 'workers' processos (padrão: todos
+    os núcleos). O resultado de cada registro é idêntico ao de inferir_ean.
+    """
+    textos_unicos = []
+    vistos = set()
+    for dados_extraidos in lista_dados_extraidos:
+        ean_do_gemma = dados_extraidos.get('códigos_de_barras', '').strip()
+        if ean_do_gemma and indice.buscar_gtin(ean_do_gemma) is not None:
+            continue
+        texto_busca = montar_texto_busca(dados_extraidos)
+        if texto_busca and texto_busca not in vistos:
+            vistos.add(texto_busca)
+            textos_unicos.append(texto_busca)
+
+    correspondencias = {}
+    if textos_unicos and len(indice) > 0:
+        workers = workers or os.cpu_count() or 1
+        if verboso:
+            print(f"Modo em lote: {len(lista_dados_extraidos)} registros, {len(textos_unicos)} textos de busca únicos, {workers} processos.")
+        argumentos = [(texto, threshold_fuzzy, False) for texto in textos_unicos]
+        if workers == 1:
+            resultados = [indice.buscar(texto, score_minimo=threshold_fuzzy) for texto in textos_unicos]
+        else:
+            tamanho_bloco = max(1, len(argumentos) // (workers * 8))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_worker, initargs=(indice,)) as executor:
+                resultados = list(executor.map(_buscar_em_worker, argumentos, chunksize=tamanho_bloco))
+        correspondencias = dict(zip(textos_unicos, resultados))
+
+    return [
+        inferir_ean(dados_extraidos, df_produtos, threshold_fuzzy, indice, correspondencias, verboso)
+        for dados_extraidos in lista_dados_extraidos
+    ]
+
+def ler_blocos_resultados(results_file_path):
+    """
+    Lê um arquivo de resultados do extract_data.py e gera (nome da imagem, saída do Gemma)
+    para cada bloco 'Imagem: ...' terminado por '====...' ou pelo início do próximo bloco.
+    """
+    current_image_name = None
+    current_gemma_output_lines = []
+    is_reading_gemma_output = False
+
+    with open(results_file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+
+            if line.startswith("Imagem: "):
+                if current_image_name and current_gemma_output_lines and is_reading_gemma_output:
+                    yield current_image_name, "\n".join(current_gemma_output_lines).strip()
+
+                current_image_name = line.replace("Imagem: ", "")
+                current_gemma_output_lines = []
+                is_reading_gemma_output = True
+
+            elif line.startswith("========================================"):
+                if current_image_name and current_gemma_output_lines and is_reading_gemma_output:
+                    yield current_image_name, "\n".join(current_gemma_output_lines).strip()
+                current_image_name = None
+                current_gemma_output_lines = []
+                is_reading_gemma_output = False
+
+            elif is_reading_gemma_output and line and not line.startswith("Aqui estão as informações"):
+                current_gemma_output_lines.append(line)
+
+    if current_image_name and current_gemma_output_lines and is_reading_gemma_output:
+        yield current_image_name, "\n".join(current_gemma_output_lines).strip()
+
+def ler_registros(results_file_path):
+    """
+    Gera (nome da imagem, dados extraídos) de um arquivo de resultados: JSONL do
+    ResultStore (saída estruturada) ou texto com blocos 'Imagem: ...'.
+    """
+    if results_file_path.endswith(".jsonl"):
+        if not os.path.exists(results_file_path):
+            raise FileNotFoundError(results_file_path)
+        for registro in ResultStore(results_file_path):
+            yield registro['imagem'], registro['dados']
+    else:
+        for current_image_name, gemma_full_output in ler_blocos_resultados(results_file_path):
+            yield current_image_name, parse_gemma_output(gemma_full_output)
+
 def processar_resultados_e_inferir_eans(
     results_file_path,
     csv_database_path,
     inference_output_file,
-    fuzzy_threshold
+    fuzzy_threshold,
+    match_exaustivo=False,
+    modo_lote=False,
+    workers=None,
+    usar_snapshot=True
 ):
-    # --- Essa função permanece a mesma ---
-    df_produtos = carregar_base_dados_produtos(csv_database_path)
+    if usar_snapshot:
+        df_produtos, indice = carregar_catalogo(csv_database_path, match_exaustivo)
+    else:
+        df_produtos = carregar_base_dados_produtos(csv_database_path)
+        indice = ProductIndex(df_produtos, exaustivo=match_exaustivo) if df_produtos is not None else None
     if df_produtos is None:
         print("Não foi possível carregar a base de dados de produtos. Abortando inferência.")
         return
 
-    inferences = []
+    print(f"Índice de produtos construído: {len(indice)} textos únicos (modo {'exaustivo' if match_exaustivo else 'bloqueado'}).")
 
-    current_image_name = None
-    current_gemma_output_lines = []
-    is_reading_gemma_output = False 
+    inferences = []
 
     try:
-        with open(results_file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-
-                if line.startswith("Imagem: "):
-                    if current_image_name and current_gemma_output_lines and is_reading_gemma_output:
-                        gemma_full_output = "\n".join(current_gemma_output_lines).strip()
-                        dados_extraidos = parse_gemma_output(gemma_full_output)
-                        
-                        print(f"DEBUG: Dados extraídos para imagem '{current_image_name}': {dados_extraidos}")
-                        
-                        ean, status = inferir_ean(dados_extraidos, df_produtos, fuzzy_threshold)
-                        inferences.append({
-                            'Imagem': current_image_name,
-                            'Produto Extraído': dados_extraidos.get('produto', 'N/A'),
-                            'Marca Extraída': dados_extraidos.get('marca', 'N/A'),
-                            'EAN Inferido': ean if ean else 'NÃO ENCONTRADO',
-                            'Status Inferência': status
-                        })
-
-                    current_image_name = line.replace("Imagem: ", "")
-                    current_gemma_output_lines = []
-                    is_reading_gemma_output = True 
-                
-                elif line.startswith("========================================"):
-                    if current_image_name and current_gemma_output_lines and is_reading_gemma_output:
-                        gemma_full_output = "\n".join(current_gemma_output_lines).strip()
-                        dados_extraidos = parse_gemma_output(gemma_full_output)
-                        
-                        print(f"DEBUG: Dados extraídos para imagem '{current_image_name}': {dados_extraidos}")
-                        
-                        ean, status = inferir_ean(dados_extraidos, df_produtos, fuzzy_threshold)
-                        inferences.append({
-                            'Imagem': current_image_name,
-                            'Produto Extraído': dados_extraidos.get('produto', 'N/A'),
-                            'Marca Extraída': dados_extraidos.get('marca', 'N/A'),
-                            'EAN Inferido': ean if ean else 'NÃO ENCONTRADO',
-                            'Status Inferência': status
-                        })
-                    current_image_name = None
-                    current_gemma_output_lines = []
-                    is_reading_gemma_output = False
-                
-                elif is_reading_gemma_output and line and not line.startswith("Aqui estão as informações"):
-                    current_gemma_output_lines.append(line)
-        
-        if current_image_name and current_gemma_output_lines and is_reading_gemma_output:
-            gemma_full_output = "\n".join(current_gemma_output_lines).strip()
-            dados_extraidos = parse_gemma_output(gemma_full_output)
-            
-            print(f"DEBUG: Dados extraídos para imagem '{current_image_name}' (último bloco): {dados_extraidos}")
-            
-            ean, status = inferir_ean(dados_extraidos, df_produtos, fuzzy_threshold)
+        imagens = []
+        lista_dados_extraidos = []
+        for current_image_name, dados_extraidos in ler_registros(results_file_path):
+            print(f"DEBUG: Dados extraídos para imagem '{current_image_name}': {dados_extraidos}")
+            imagens.append(current_image_name)
+            lista_dados_extraidos.append(dados_extraidos)
+
+        if modo_lote:
+            resultados = inferir_eans_em_lote(lista_dados_extraidos, df_produtos, fuzzy_threshold, indice, workers)
+        else:
+            resultados = [
+                inferir_ean(dados_extraidos, df_produtos, fuzzy_threshold, indice)
+                for dados_extraidos in lista_dados_extraidos
+            ]
+
+        for current_image_name, dados_extraidos, (ean, status) in zip(imagens, lista_dados_extraidos, resultados):
             inferences.append({
                 'Imagem': current_image_name,
                 'Produto Extraído': dados_extraidos.get('produto', 'N/A'),
@@ -264,11 +347,19 @@ if __name__ == "__main__":
     CSV_DATABASE_FILE = os.getenv("CSV_DATABASE_FILE", "/app/data/ludiiprice_db_17012025.csv")
     INFERENCE_OUTPUT_FILE = os.getenv("INFERENCE_OUTPUT_FILE", "/app/inferences/ean_inferences.csv")
     FUZZY_THRESHOLD = int(os.getenv("FUZZY_THRESHOLD", 75))
+    MATCH_EXAUSTIVO = os.getenv("MATCH_EXAUSTIVO", "0") == "1"
+    MODO_LOTE = os.getenv("MODO_LOTE", "0") == "1"
+    WORKERS = int(os.getenv("WORKERS", 0)) or None
+    USAR_SNAPSHOT = os.getenv("USAR_SNAPSHOT", "1") == "1"
 
     print("Iniciando script de inferência de EAN...")
     processar_resultados_e_inferir_eans(
         RESULTS_FILE,
         CSV_DATABASE_FILE,
         INFERENCE_OUTPUT_FILE,
-        FUZZY_THRESHOLD
+        FUZZY_THRESHOLD,
+        MATCH_EXAUSTIVO,
+        MODO_LOTE,
+        WORKERS,
+        USAR_SNAPSHOT
     )
\ No newline at end of file
@@ -0,0 +1,144 @@
+# app/manifest.py
+
+import hashlib
+import json
+import os
+import time
+
+from result_store import truncar_resultados
+
+
+def _sha256_arquivo(caminho):
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+class Manifest:
+    """
+    Manifesto durável das imagens processadas pelo extract_data.py.
+
+    Cada resultado gera uma linha JSON (imagem, sha256, tamanho, mtime, status, arquivo
+    de resultados e seu fim após a gravação) gravada com uma única escrita seguida de
+    fsync. Ao abrir, a última entrada de cada imagem vale e uma linha final incompleta é
+    descartada. Vários arquivos de resultados (ex.: .jsonl e .txt, ou as respostas
+    gravadas pelo pipeline) podem compartilhar o mesmo manifesto. Uma
+    imagem só é considerada concluída se o status for 'ok' e o conteúdo não tiver mudado
+    (tamanho/mtime iguais ou, se mudaram, o mesmo SHA-256).
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.entradas = {}
+        # Maior fim confirmado de cada arquivo de resultados, em todo o histórico
+        self.fins = {}
+
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        tamanho_valido = 0
+        if os.path.exists(caminho):
+            with open(caminho, "rb") as f:
+                for linha in f:
+                    if not linha.endswith(b"\n"):
+                        break
+                    tamanho_valido += len(linha)
+                    try:
+                        entrada = json.loads(linha)
+                    except ValueError:
+                        continue
+                    self._acumular(entrada)
+            if os.path.getsize(caminho) > tamanho_valido:
+                # Processo interrompido no meio de uma linha: descarta o trecho incompleto
+                with open(caminho, "rb+") as f:
+                    f.truncate(tamanho_valido)
+
+        self._arquivo = open(caminho, "ab")
+
+    def _acumular(self, entrada):
+        # Uma entrada 'resposta' só confirma o arquivo de resultados: não é estado de conclusão
+        # e não pode substituir o 'ok' (ou a falha) da imagem de mesmo nome
+        if entrada.get("status") != "resposta":
+            self.entradas[entrada["imagem"]] = entrada
+        if "resultados" in entrada and "fim_resultados" in entrada:
+            arquivo = entrada["resultados"]
+            self.fins[arquivo] = max(self.fins.get(arquivo, 0), entrada["fim_resultados"])
+
+    def _gravar(self, entrada):
+        self._arquivo.write(json.dumps(entrada, ensure_ascii=False).encode("utf-8") + b"\n")
+        self._arquivo.flush()
+        os.fsync(self._arquivo.fileno())
+        self._acumular(entrada)
+
+    def _identidade(self, caminho):
+        """Retorna tamanho, mtime e SHA-256 do arquivo, reaproveitando o hash se nada mudou."""
+        estado = os.stat(caminho)
+        entrada = self.entradas.get(os.path.basename(caminho))
+        if entrada and entrada.get("tamanho") == estado.st_size and entrada.get("mtime_ns") == estado.st_mtime_ns:
+            sha256 = entrada["sha256"]
+        else:
+            sha256 = _sha256_arquivo(caminho)
+        return {"sha256": sha256, "tamanho": estado.st_size, "mtime_ns": estado.st_mtime_ns}
+
+    def concluida(self, caminho):
+        entrada = self.entradas.get(os.path.basename(caminho))
+        if entrada is None or entrada.get("status") != "ok":
+            return False
+        return self._identidade(caminho)["sha256"] == entrada["sha256"]
+
+    def pendentes(self, caminhos):
+        """Filtra os caminhos que ainda precisam ser processados (falhos, alterados ou ausentes)."""
+        return [caminho for caminho in caminhos if not self.concluida(caminho)]
+
+    def registrar(self, caminho, status, fim_resultados=None, erro=None, arquivo_resultados=None):
+        """
+        Grava atomicamente (uma escrita + fsync) o resultado do processamento de uma imagem.
+        'fim_resultados' é o tamanho de 'arquivo_resultados' logo após gravar o resultado.
+        """
+        entrada = {
+            "imagem": os.path.basename(caminho),
+            **self._identidade(caminho),
+            "status": status,
+            "ts": time.time(),
+        }
+        if fim_resultados is not None:
+            entrada["resultados"] = os.path.abspath(arquivo_resultados)
+            entrada["fim_resultados"] = fim_resultados
+        if erro is not None:
+            entrada["erro"] = str(erro)
+        self._gravar(entrada)
+
+    def registrar_resposta(self, nome_imagem, arquivo_resultados, fim_resultados):
+        """
+        Confirma um resultado gravado sem um arquivo de imagem em disco (ex.: recortes em
+        memória do pipeline). Sem SHA-256, a entrada protege o arquivo de resultados na
+        reconciliação, mas não altera o estado de conclusão da imagem de mesmo nome.
+        """
+        self._gravar({
+            "imagem": nome_imagem,
+            "status": "resposta",
+            "ts": time.time(),
+            "resultados": os.path.abspath(arquivo_resultados),
+            "fim_resultados": fim_resultados,
+        })
+
+    def reconciliar_resultados(self, caminho_resultados):
+        """
+        Trunca o arquivo de resultados no fim do último resultado confirmado no manifesto
+        para esse arquivo, descartando um bloco gravado pela metade (ou sem entrada no
+        manifesto) quando o processo foi interrompido. O índice .idx do ResultStore é
+        ajustado no mesmo passo. Sem nenhuma entrada do arquivo, nada é descartado.
+        """
+        fim = self.fins.get(os.path.abspath(caminho_resultados))
+        if fim is None or not os.path.exists(caminho_resultados):
+            return
+        tamanho = os.path.getsize(caminho_resultados)
+        if tamanho > fim:
+            print(f"AVISO: Descartando {tamanho - fim} bytes não confirmados no fim de '{caminho_resultados}'.")
+            truncar_resultados(caminho_resultados, fim)
+
+    def fechar(self):
+        self._arquivo.close()
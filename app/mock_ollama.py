@@ -0,0 +1,247 @@
+# app/mock_ollama.py
+# Servidor local que imita a API do Ollama (/api/generate e /api/tags) para testar
+# o extract_data.py sem GPU. Exemplo:
+#   python mock_ollama.py --porta 11435 --latencia 2 --jitter 0.5 --taxa-erro 0.05
+#   python mock_ollama.py --atraso-token 0.02 --replay results/resultado_train.txt
+#   OLLAMA_URL=http://localhost:11435/api/generate python extract_data.py
+# Vários mocks com latências diferentes simulam um pool de endpoints (--cair-apos derruba
+# o servidor no meio da execução, fechando as conexões em voo):
+#   python mock_ollama.py --porta 11435 --latencia 1 &
+#   python mock_ollama.py --porta 11436 --latencia 3 --cair-apos 20 &
+#   OLLAMA_ENDPOINTS=http://localhost:11435,http://localhost:11436 python extract_data.py
+
+import argparse
+import json
+import random
+import re
+import socket
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESPOSTA_PADRAO = """*   **Marca:** Sadia
+*   **Produto:** Peito de Frango
+*   **Preço:** R$ 19,90
+*   **Códigos de Barras:** Não encontrado"""
+
+RESPOSTA_JSON_PADRAO = json.dumps({
+    "marca": "Sadia", "produto": "Peito de Frango", "preço": "R$ 19,90",
+    "unidade": "kg", "códigos_de_barras": "",
+}, ensure_ascii=False)
+
+CAMPOS_JSON = ["marca", "produto", "preço", "unidade", "códigos_de_barras"]
+
+
+def carregar_respostas_replay(caminho_resultados):
+    """
+    Lê as respostas gravadas num resultado_*.txt e devolve uma lista de pares
+    (resposta em texto, resposta em JSON) para o servidor reproduzir.
+    """
+    from infer_ean import ler_blocos_resultados, parse_gemma_output
+
+    respostas = []
+    for _, texto in ler_blocos_resultados(caminho_resultados):
+        dados = parse_gemma_output(texto)
+        dados.setdefault("unidade", dados.get("peso/tamanho", ""))
+        respostas.append((texto, json.dumps({campo: dados.get(campo, "") for campo in CAMPOS_JSON}, ensure_ascii=False)))
+    return respostas
+
+
+def _dividir_em_tokens(texto):
+    """Quebra o texto em pedaços do tamanho aproximado de um token (palavra + espaço)."""
+    return re.findall(r"\S+\s*|\s+", texto)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _enviar_json(self, status, corpo):
+        dados = json.dumps(corpo).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _derrubado(self):
+        """Se o servidor foi derrubado, fecha a conexão sem terminar a resposta."""
+        if not self.server.fora_do_ar:
+            return False
+        self.close_connection = True
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        return True
+
+    def do_GET(self):
+        if self._derrubado():
+            return
+        if self.path == "/api/tags":
+            self._enviar_json(200, {"models": [{"name": m} for m in self.server.modelos]})
+        else:
+            self._enviar_json(404, {"error": "not found"})
+
+    def _enviar_pedaco(self, pedaco):
+        dados = (json.dumps(pedaco) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(dados):X}\r\n".encode() + dados + b"\r\n")
+        self.wfile.flush()
+
+    def _resposta_da_imagem(self, chave, estruturada):
+        """No modo replay, a mesma imagem recebe sempre a mesma resposta gravada."""
+        if self.server.respostas_replay:
+            texto, texto_json = self.server.respostas_replay[zlib.crc32(chave.encode("utf-8")) % len(self.server.respostas_replay)]
+            return texto_json if estruturada else texto
+        return RESPOSTA_JSON_PADRAO if estruturada else self.server.resposta
+
+    def _escolher_resposta(self, payload):
+        """
+        Escolhe a resposta do pedido. Pedidos com 'format' (saída estruturada) recebem JSON;
+        se o schema pedir a lista 'resultados' (lote), recebem um objeto por imagem.
+        """
+        formato = payload.get("format")
+        imagens = payload.get("images") or [payload.get("prompt", "")]
+        if isinstance(formato, dict) and "resultados" in formato.get("properties", {}):
+            resultados = [{"indice": i + 1, **json.loads(self._resposta_da_imagem(imagem, True))}
+                          for i, imagem in enumerate(imagens)]
+            return json.dumps({"resultados": resultados}, ensure_ascii=False)
+        return self._resposta_da_imagem(imagens[0], bool(formato))
+
+    def do_POST(self):
+        tamanho = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(tamanho) or b"{}")
+        if self.path != "/api/generate":
+            self._enviar_json(404, {"error": "not found"})
+            return
+
+        servidor = self.server
+        with servidor.lock:
+            servidor.requisicoes += 1
+            numero = servidor.requisicoes
+            servidor.em_voo += 1
+            servidor.pico_em_voo = max(servidor.pico_em_voo, servidor.em_voo)
+        inicio = time.perf_counter_ns()
+        try:
+            with servidor.lock:
+                carga = servidor.tempo_carga if payload.get("model") not in servidor.carregados else 0.0
+                servidor.carregados.add(payload.get("model"))
+            time.sleep(carga)
+            inicio_prompt = time.perf_counter_ns()
+            # Cada imagem além da primeira encarece a avaliação do prompt
+            imagens_extras = max(0, len(payload.get("images") or []) - 1)
+            time.sleep(max(0.0, random.gauss(servidor.latencia, servidor.jitter)) * (1 + servidor.custo_imagem_extra * imagens_extras))
+            if self._derrubado():
+                return
+            status = servidor.erro_forcado(payload, numero) if servidor.erro_forcado else None
+            if status or random.random() < servidor.taxa_erro:
+                self._enviar_json(status or 500, {"error": "erro simulado"})
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            resposta = self._escolher_resposta(payload)
+            tokens = _dividir_em_tokens(resposta)
+            inicio_geracao = time.perf_counter_ns()
+            for i, token in enumerate(tokens):
+                if i and servidor.atraso_token:
+                    time.sleep(servidor.atraso_token)
+                if self._derrubado():
+                    return
+                self._enviar_pedaco({"model": payload.get("model"), "response": token, "done": False})
+            fim = time.perf_counter_ns()
+            # Último chunk com os campos de tempo (ns) e contagens de tokens, como no Ollama
+            self._enviar_pedaco({
+                "model": payload.get("model"), "response": "", "done": True,
+                "total_duration": fim - inicio,
+                "load_duration": inicio_prompt - inicio,
+                "prompt_eval_count": len(_dividir_em_tokens(payload.get("prompt", ""))) + 256 * len(payload.get("images") or []),
+                "prompt_eval_duration": inicio_geracao - inicio_prompt,
+                "eval_count": len(tokens),
+                "eval_duration": fim - inicio_geracao,
+            })
+            self.wfile.write(b"0\r\n\r\n")
+        finally:
+            with servidor.lock:
+                servidor.em_voo -= 1
+
+
+def iniciar_servidor(porta=0, latencia=1.0, jitter=0.0, taxa_erro=0.0,
+                     resposta=RESPOSTA_PADRAO, modelos=("gemma3:4b",), atraso_token=0.0,
+                     respostas_replay=None, tempo_carga=0.0, custo_imagem_extra=0.3, erro_forcado=None):
+    """
+    Inicia o servidor em uma thread de fundo e o retorna (use server_address para a porta).
+
+    'latencia' simula o processamento do prompt; depois, cada token da resposta é enviado
+    num chunk NDJSON separado, com 'atraso_token' segundos entre eles. 'respostas_replay'
+    (ver carregar_respostas_replay) substitui a resposta fixa por respostas gravadas.
+    A primeira requisição de cada modelo espera mais 'tempo_carga' segundos (carga do modelo).
+    Em requisições com várias imagens, a latência cresce 'custo_imagem_extra' (fração) por
+    imagem além da primeira. 'erro_forcado(payload, n)', se informado, devolve o status HTTP
+    de erro a responder para a n-ésima requisição (ou None), para testes determinísticos.
+    """
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), _Handler)
+    servidor.daemon_threads = True
+    servidor.latencia = latencia
+    servidor.jitter = jitter
+    servidor.taxa_erro = taxa_erro
+    servidor.resposta = resposta
+    servidor.modelos = list(modelos)
+    servidor.atraso_token = atraso_token
+    servidor.respostas_replay = respostas_replay or []
+    servidor.tempo_carga = tempo_carga
+    servidor.custo_imagem_extra = custo_imagem_extra
+    servidor.erro_forcado = erro_forcado
+    servidor.carregados = set()
+    servidor.lock = threading.Lock()
+    servidor.requisicoes = 0
+    servidor.em_voo = 0
+    servidor.pico_em_voo = 0
+    servidor.fora_do_ar = False
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def derrubar_servidor(servidor):
+    """Simula a queda do servidor: para de aceitar conexões e corta as requisições em voo."""
+    servidor.fora_do_ar = True
+    servidor.shutdown()
+    servidor.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local que imita a API do Ollama.")
+    parser.add_argument("--porta", type=int, default=11435)
+    parser.add_argument("--latencia", type=float, default=1.0, help="latência média por requisição (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="desvio padrão da latência (s)")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="fração de requisições que respondem HTTP 500")
+    parser.add_argument("--modelo", action="append", help="modelo listado em /api/tags (pode repetir)")
+    parser.add_argument("--atraso-token", type=float, default=0.0, help="intervalo entre os tokens do streaming (s)")
+    parser.add_argument("--replay", help="resultado_*.txt cujas respostas serão reproduzidas")
+    parser.add_argument("--tempo-carga", type=float, default=0.0, help="atraso da 1ª requisição de cada modelo (s)")
+    parser.add_argument("--custo-imagem-extra", type=float, default=0.3,
+                        help="aumento relativo da latência por imagem extra num lote")
+    parser.add_argument("--cair-apos", type=float, help="derruba o servidor após este número de segundos")
+    args = parser.parse_args()
+
+    respostas_replay = carregar_respostas_replay(args.replay) if args.replay else None
+    servidor = iniciar_servidor(args.porta, args.latencia, args.jitter, args.taxa_erro,
+                                modelos=args.modelo or ("gemma3:4b",), atraso_token=args.atraso_token,
+                                respostas_replay=respostas_replay, tempo_carga=args.tempo_carga,
+                                custo_imagem_extra=args.custo_imagem_extra)
+    print(f"Mock do Ollama ouvindo em http://127.0.0.1:{servidor.server_address[1]} (latência {args.latencia}s)")
+    try:
+        if args.cair_apos is not None:
+            time.sleep(args.cair_apos)
+            derrubar_servidor(servidor)
+            print(f"Mock do Ollama na porta {servidor.server_address[1]} derrubado após {args.cair_apos}s.")
+        else:
+            while True:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
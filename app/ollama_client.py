@@ -0,0 +1,175 @@
+# app/ollama_client.py
+
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+TIMEOUT_CONEXAO = float(os.getenv("TIMEOUT_CONEXAO", 5))
+TIMEOUT_LEITURA = float(os.getenv("TIMEOUT_LEITURA", 300))
+MAX_TENTATIVAS = int(os.getenv("MAX_TENTATIVAS", 4))
+BACKOFF_BASE = float(os.getenv("BACKOFF_BASE", 1))
+BACKOFF_MAX = float(os.getenv("BACKOFF_MAX", 30))
+# Falhas consecutivas que abrem o circuito e tempo (s) até uma nova tentativa
+LIMITE_FALHAS_CIRCUITO = int(os.getenv("LIMITE_FALHAS_CIRCUITO", 5))
+ESPERA_CIRCUITO = float(os.getenv("ESPERA_CIRCUITO", 60))
+# Tempo que o Ollama mantém o modelo carregado na GPU após cada requisição
+KEEP_ALIVE = os.getenv("KEEP_ALIVE", "30m")
+
+# Campos de tempo e contagem de tokens enviados pelo Ollama no último chunk do streaming
+CAMPOS_METRICAS = ("total_duration", "load_duration", "prompt_eval_count", "prompt_eval_duration",
+                   "eval_count", "eval_duration")
+
+
+class OllamaError(Exception):
+    """Falha ao obter uma resposta do Ollama (após esgotar as tentativas)."""
+
+
+class RespostaInvalidaError(OllamaError):
+    """O modelo respondeu, mas a resposta não segue o formato pedido."""
+
+
+class RequisicaoRejeitadaError(OllamaError):
+    """O Ollama rejeitou a requisição (HTTP 4xx exceto 429); repetir não adianta."""
+
+
+class CircuitoAbertoError(OllamaError):
+    """O circuito está aberto: o Ollama falhou repetidamente e as chamadas estão suspensas."""
+
+
+class OllamaClient:
+    """
+    Cliente reutilizável para o /api/generate do Ollama.
+
+    Mantém um pool de conexões keep-alive (requests.Session), aplica timeouts de conexão
+    e leitura, repete falhas transitórias (erros de rede, timeouts, HTTP 429 e 5xx) com
+    backoff exponencial com jitter e abre um circuito após LIMITE_FALHAS_CIRCUITO falhas
+    consecutivas, recusando chamadas por ESPERA_CIRCUITO segundos. Erros são levantados
+    como OllamaError, nunca devolvidos como texto.
+    """
+
+    def __init__(self, url, modelo, tamanho_pool=10, timeout_conexao=TIMEOUT_CONEXAO,
+                 timeout_leitura=TIMEOUT_LEITURA, max_tentativas=MAX_TENTATIVAS,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX,
+                 limite_falhas_circuito=LIMITE_FALHAS_CIRCUITO, espera_circuito=ESPERA_CIRCUITO,
+                 keep_alive=KEEP_ALIVE):
+        self.url = url
+        self.modelo = modelo
+        self.timeout = (timeout_conexao, timeout_leitura)
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limite_falhas_circuito = limite_falhas_circuito
+        self.espera_circuito = espera_circuito
+        self.keep_alive = keep_alive
+
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=tamanho_pool)
+        self.sessao.mount("http://", adaptador)
+        self.sessao.mount("https://", adaptador)
+
+        self._lock = threading.Lock()
+        self._falhas_consecutivas = 0
+        self._circuito_aberto_ate = 0.0
+
+    def _verificar_circuito(self):
+        with self._lock:
+            if time.monotonic() < self._circuito_aberto_ate:
+                restante = self._circuito_aberto_ate - time.monotonic()
+                raise CircuitoAbertoError(f"Circuito aberto para {self.url}; nova tentativa em {restante:.0f}s.")
+
+    def _registrar_resultado(self, sucesso):
+        with self._lock:
+            if sucesso:
+                self._falhas_consecutivas = 0
+                return
+            self._falhas_consecutivas += 1
+            if self._falhas_consecutivas >= self.limite_falhas_circuito:
+                self._circuito_aberto_ate = time.monotonic() + self.espera_circuito
+                print(f"AVISO: {self._falhas_consecutivas} falhas consecutivas em {self.url}. Circuito aberto por {self.espera_circuito:.0f}s.")
+
+    def _espera_backoff(self, tentativa):
+        """Backoff exponencial com 'full jitter'."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** tentativa))
+
+    def _requisitar(self, payload):
+        """
+        Retorna o texto da resposta e o último chunk do streaming (com os campos de tempo).
+
+        Levanta OllamaError se o Ollama mandar um chunk com "error" no meio do streaming
+        (ex.: o runner do modelo caiu) ou se o streaming terminar sem o chunk com "done".
+        """
+        partes = []
+        final = None
+        with self.sessao.post(self.url, json=payload, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            for linha in response.iter_lines():
+                if not linha:
+                    continue
+                pedaco = json.loads(linha.decode("utf-8"))
+                if pedaco.get("error"):
+                    raise OllamaError(f"O Ollama interrompeu a resposta com erro: {pedaco['error']}")
+                partes.append(pedaco.get("response", ""))
+                if pedaco.get("done"):
+                    final = pedaco
+        if final is None:
+            raise OllamaError("O streaming do Ollama terminou sem o chunk final (done).")
+        return ''.join(partes).strip(), final
+
+    def gerar(self, prompt, imagens=None, modelo=None, **opcoes):
+        """Envia o prompt (e imagens em base64) ao modelo e retorna o texto completo da resposta."""
+        return self.gerar_com_metricas(prompt, imagens, modelo, **opcoes)[0]
+
+    def gerar_com_metricas(self, prompt, imagens=None, modelo=None, **opcoes):
+        """
+        Como gerar, mas retorna (texto, métricas). As métricas trazem os campos de tempo do
+        último chunk do Ollama (total_duration, load_duration, prompt_eval_count,
+        prompt_eval_duration, eval_count e eval_duration, em nanossegundos, quando presentes),
+        o modelo, o número de tentativas e a duração (s) da requisição bem-sucedida.
+        """
+        payload = {
+            "model": modelo or self.modelo,
+            "prompt": prompt,
+            "keep_alive": self.keep_alive,
+            **opcoes,
+        }
+        if imagens:
+            payload["images"] = list(imagens)
+
+        ultimo_erro = None
+        for tentativa in range(self.max_tentativas):
+            self._verificar_circuito()
+            inicio = time.perf_counter()
+            try:
+                resposta, final = self._requisitar(payload)
+            except requests.exceptions.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                self._registrar_resultado(False)
+                if status is not None and status != 429 and status < 500:
+                    raise RequisicaoRejeitadaError(f"Requisição rejeitada pelo Ollama (HTTP {status}): {e}") from e
+                ultimo_erro = e
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError, ValueError, OllamaError) as e:
+                # Resposta truncada ou com erro no streaming também é falha transitória
+                self._registrar_resultado(False)
+                ultimo_erro = e
+            else:
+                self._registrar_resultado(True)
+                metricas = {campo: final[campo] for campo in CAMPOS_METRICAS if campo in final}
+                metricas.update(modelo=payload["model"], tentativas=tentativa + 1,
+                                requisicao_s=time.perf_counter() - inicio)
+                return resposta, metricas
+
+            if tentativa + 1 < self.max_tentativas:
+                espera = self._espera_backoff(tentativa)
+                print(f"AVISO: Falha ao chamar {self.url} ({ultimo_erro}). Tentativa {tentativa + 2}/{self.max_tentativas} em {espera:.1f}s.")
+                time.sleep(espera)
+
+        raise OllamaError(f"Falha ao se comunicar com o Ollama em {self.url} após {self.max_tentativas} tentativas: {ultimo_erro}") from ultimo_erro
+
+    def fechar(self):
+        self.sessao.close()
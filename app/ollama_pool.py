@@ -0,0 +1,294 @@
+# app/ollama_pool.py
+
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+
+from ollama_client import (
+    BACKOFF_BASE, BACKOFF_MAX, MAX_TENTATIVAS, TIMEOUT_CONEXAO, OllamaClient, OllamaError,
+    RequisicaoRejeitadaError,
+)
+
+# Intervalo (s) entre as verificações de saúde (GET /api/tags) de cada endpoint
+INTERVALO_SAUDE = float(os.getenv("INTERVALO_SAUDE", 10))
+# Falhas consecutivas por sobrecarga (HTTP 429/5xx, timeout de leitura) que tiram um endpoint do pool
+LIMITE_FALHAS_ENDPOINT = int(os.getenv("LIMITE_FALHAS_ENDPOINT", 3))
+
+
+def carregar_endpoints(texto):
+    """
+    Interpreta a configuração do pool (OLLAMA_ENDPOINTS): uma lista JSON de objetos
+    {"url": ..., "peso": 2, "modelos": ["gemma3:4b"]} ou URLs separadas por vírgulas
+    (peso 1, qualquer modelo). Retorna uma lista de dicionários url/peso/modelos.
+    """
+    texto = texto.strip()
+    if texto.startswith("["):
+        endpoints = [
+            {"url": item["url"], "peso": float(item.get("peso", 1)), "modelos": list(item.get("modelos") or [])}
+            for item in json.loads(texto)
+        ]
+    else:
+        endpoints = [{"url": url.strip(), "peso": 1.0, "modelos": []} for url in texto.split(",") if url.strip()]
+    if not endpoints:
+        raise ValueError("OLLAMA_ENDPOINTS não define nenhum endpoint.")
+    for endpoint in endpoints:
+        if endpoint["peso"] <= 0:
+            raise ValueError(f"Peso inválido para {endpoint['url']}: {endpoint['peso']}")
+    return endpoints
+
+
+def _url_base(url):
+    """Aceita tanto http://host:11434 quanto http://host:11434/api/generate."""
+    url = url.rstrip("/")
+    if url.endswith("/api/generate"):
+        url = url[: -len("/api/generate")]
+    return url
+
+
+def _mesmo_modelo(nome, modelo):
+    return nome == modelo or nome == f"{modelo}:latest"
+
+
+class EndpointOllama:
+    """Um servidor do pool: cliente HTTP próprio, peso, modelos servidos e contadores."""
+
+    def __init__(self, url, peso=1.0, modelos=None, **opcoes_cliente):
+        self.url = _url_base(url)
+        self.peso = peso
+        self.modelos = list(modelos or [])
+        # Cada endpoint tenta uma única vez: quem repete (com backoff, em outro endpoint) é o
+        # pool. O circuito do cliente fica desligado; o pool faz esse papel (ver OllamaPool).
+        self.cliente = OllamaClient(self.url + "/api/generate", None, max_tentativas=1,
+                                    limite_falhas_circuito=float("inf"), **opcoes_cliente)
+        self.saudavel = True
+        self.disponiveis = None  # modelos listados no último /api/tags
+        self.em_voo = 0
+        self.requisicoes = 0
+        self.imagens = 0
+        self.falhas = 0
+        self.falhas_consecutivas = 0
+        self.reenfileiradas = 0
+        self.quedas = 0
+        self.ocupado_s = 0.0
+
+    def serve(self, modelo):
+        if self.modelos and modelo not in self.modelos:
+            return False
+        return self.disponiveis is None or any(_mesmo_modelo(nome, modelo) for nome in self.disponiveis)
+
+
+class OllamaPool:
+    """
+    Distribui as chamadas ao /api/generate entre vários servidores Ollama, com a mesma
+    interface do OllamaClient (gerar, gerar_com_metricas, fechar).
+
+    Cada requisição vai ao endpoint saudável que serve o modelo com menos requisições em
+    voo relativas ao peso ((em_voo + 1) / peso). A saúde de cada endpoint é verificada
+    com GET /api/tags a cada INTERVALO_SAUDE segundos, o que também informa os modelos
+    disponíveis.
+
+    Uma requisição que falha é reenviada, de preferência a outro endpoint, até
+    MAX_TENTATIVAS vezes no total; assim, as imagens em voo num servidor que cai voltam
+    para a fila dos demais. O tratamento depende da falha:
+
+    - queda (conexão recusada, derrubada ou sem resposta ao conectar): o endpoint sai do
+      pool na hora e a requisição é reenviada sem espera;
+    - sobrecarga (HTTP 429/5xx, timeout de leitura): o reenvio espera um backoff
+      exponencial com jitter, como no OllamaClient, e o endpoint só sai do pool após
+      LIMITE_FALHAS_ENDPOINT falhas consecutivas, para que um momento de pico num servidor
+      saudável não o tire de rotação.
+
+    Um endpoint fora do pool volta quando o /api/tags responde de novo, o que faz o papel
+    do circuito do OllamaClient (desligado nos clientes de cada endpoint). O custo: um
+    servidor que responde ao /api/tags mas falha em toda geração volta a cada
+    INTERVALO_SAUDE e gasta até LIMITE_FALHAS_ENDPOINT requisições antes de sair de novo.
+    """
+
+    def __init__(self, endpoints, modelo, tamanho_pool=10, max_tentativas=MAX_TENTATIVAS,
+                 intervalo_saude=INTERVALO_SAUDE, limite_falhas=LIMITE_FALHAS_ENDPOINT,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX, **opcoes_cliente):
+        self.modelo = modelo
+        self.max_tentativas = max_tentativas
+        self.intervalo_saude = intervalo_saude
+        self.limite_falhas = limite_falhas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.endpoints = [
+            EndpointOllama(e["url"], e.get("peso", 1.0), e.get("modelos"), tamanho_pool=tamanho_pool, **opcoes_cliente)
+            for e in endpoints
+        ]
+        self.url = ", ".join(e.url for e in self.endpoints)
+        self._lock = threading.Lock()
+        self._sessao_saude = requests.Session()
+        self._parar = threading.Event()
+        self._inicio = None
+        self._fim = None
+
+        self.verificar_saude()
+        if intervalo_saude > 0:
+            threading.Thread(target=self._vigiar_saude, daemon=True).start()
+
+    # --- Saúde ---
+
+    def _verificar_endpoint(self, endpoint):
+        try:
+            resposta = self._sessao_saude.get(endpoint.url + "/api/tags", timeout=TIMEOUT_CONEXAO)
+            resposta.raise_for_status()
+            disponiveis = [m.get("name") for m in resposta.json().get("models", [])]
+        except (requests.exceptions.RequestException, ValueError) as e:
+            with self._lock:
+                if endpoint.saudavel:
+                    endpoint.saudavel = False
+                    endpoint.quedas += 1
+                    print(f"AVISO: Endpoint {endpoint.url} fora do ar ({e}). Removido do pool.")
+            return
+
+        ausentes = [m for m in endpoint.modelos if not any(_mesmo_modelo(nome, m) for nome in disponiveis)]
+        with self._lock:
+            if not endpoint.saudavel:
+                print(f"✅ Endpoint {endpoint.url} voltou ao pool.")
+                endpoint.falhas_consecutivas = 0
+            if ausentes and disponiveis != endpoint.disponiveis:
+                print(f"AVISO: Endpoint {endpoint.url} não tem os modelos {', '.join(ausentes)}.")
+            endpoint.saudavel = True
+            endpoint.disponiveis = disponiveis
+
+    def verificar_saude(self):
+        """Consulta o /api/tags de todos os endpoints e atualiza o estado e os modelos de cada um."""
+        for endpoint in self.endpoints:
+            self._verificar_endpoint(endpoint)
+
+    def _vigiar_saude(self):
+        while not self._parar.wait(self.intervalo_saude):
+            self.verificar_saude()
+
+    # --- Despacho ---
+
+    def _escolher(self, modelo, excluidos):
+        """Reserva o endpoint saudável com menos requisições em voo por peso, ou retorna None."""
+        with self._lock:
+            candidatos = [e for e in self.endpoints if e.saudavel and e not in excluidos and e.serve(modelo)]
+            if not candidatos:
+                return None
+            # Empate (ex.: todos ociosos): o que recebeu menos requisições por peso
+            endpoint = min(candidatos, key=lambda e: ((e.em_voo + 1) / e.peso, e.requisicoes / e.peso))
+            endpoint.em_voo += 1
+            if self._inicio is None:
+                self._inicio = time.perf_counter()
+            return endpoint
+
+    def _liberar(self, endpoint, duracao, imagens, sucesso):
+        with self._lock:
+            endpoint.em_voo -= 1
+            endpoint.requisicoes += 1
+            endpoint.ocupado_s += duracao
+            if sucesso:
+                endpoint.imagens += imagens
+                endpoint.falhas_consecutivas = 0
+                self._fim = time.perf_counter()
+            else:
+                endpoint.falhas += 1
+
+    def _registrar_falha(self, endpoint, erro):
+        """
+        Contabiliza a falha de uma requisição no endpoint e o tira do pool se ele caiu ou
+        acumulou limite_falhas falhas consecutivas. Retorna True se a falha foi uma queda.
+        """
+        causa = erro.__cause__
+        queda = isinstance(causa, (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError))
+        with self._lock:
+            endpoint.reenfileiradas += 1
+            endpoint.falhas_consecutivas += 1
+            if endpoint.saudavel and (queda or endpoint.falhas_consecutivas >= self.limite_falhas):
+                endpoint.saudavel = False
+                endpoint.quedas += 1
+                motivo = "fora do ar" if queda else f"{endpoint.falhas_consecutivas} falhas consecutivas"
+                print(f"AVISO: Endpoint {endpoint.url} {motivo} ({erro}). Removido do pool até a próxima verificação de saúde.")
+        return queda
+
+    def _espera_backoff(self, tentativa):
+        """Backoff exponencial com 'full jitter', como no OllamaClient."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** tentativa))
+
+    def gerar(self, prompt, imagens=None, modelo=None, **opcoes):
+        return self.gerar_com_metricas(prompt, imagens, modelo, **opcoes)[0]
+
+    def gerar_com_metricas(self, prompt, imagens=None, modelo=None, **opcoes):
+        """Como OllamaClient.gerar_com_metricas; as métricas trazem também o endpoint usado."""
+        modelo = modelo or self.modelo
+        if not any(not e.modelos or modelo in e.modelos for e in self.endpoints):
+            raise OllamaError(f"Nenhum endpoint do pool está configurado para o modelo {modelo}.")
+
+        excluidos = set()
+        ultimo_erro = None
+        for tentativa in range(self.max_tentativas):
+            endpoint = self._escolher(modelo, excluidos)
+            if endpoint is None and excluidos:
+                # Todos os candidatos já falharam nesta requisição: volta a considerá-los
+                excluidos.clear()
+                endpoint = self._escolher(modelo, excluidos)
+            if endpoint is None:
+                # Todos fora do ar: espera um pouco e confere a saúde de novo
+                time.sleep(self._espera_backoff(tentativa))
+                self.verificar_saude()
+                endpoint = self._escolher(modelo, excluidos)
+                if endpoint is None:
+                    if any(e.saudavel for e in self.endpoints):
+                        raise OllamaError(f"Nenhum endpoint disponível no pool tem o modelo {modelo}.")
+                    ultimo_erro = ultimo_erro or "nenhum endpoint saudável"
+                    continue
+
+            inicio = time.perf_counter()
+            try:
+                resposta, metricas = endpoint.cliente.gerar_com_metricas(prompt, imagens, modelo, **opcoes)
+            except RequisicaoRejeitadaError:
+                self._liberar(endpoint, time.perf_counter() - inicio, 0, False)
+                raise
+            except OllamaError as e:
+                self._liberar(endpoint, time.perf_counter() - inicio, 0, False)
+                queda = self._registrar_falha(endpoint, e)
+                excluidos.add(endpoint)
+                ultimo_erro = e
+                if tentativa + 1 < self.max_tentativas:
+                    espera = 0.0 if queda else self._espera_backoff(tentativa)
+                    print(f"AVISO: Falha em {endpoint.url}. Reenviando a requisição "
+                          f"(tentativa {tentativa + 2}/{self.max_tentativas}) em {espera:.1f}s.")
+                    time.sleep(espera)
+                continue
+
+            self._liberar(endpoint, time.perf_counter() - inicio, len(imagens or []) or 1, True)
+            metricas.update(endpoint=endpoint.url, tentativas=tentativa + 1)
+            return resposta, metricas
+
+        raise OllamaError(f"Falha ao se comunicar com o pool de endpoints após {self.max_tentativas} tentativas: {ultimo_erro}")
+
+    # --- Resumo ---
+
+    def resumo(self):
+        """Contadores e vazão (imagens/s no período em que o pool esteve ativo) por endpoint."""
+        with self._lock:
+            duracao = (self._fim - self._inicio) if self._inicio is not None and self._fim is not None else 0.0
+            return {
+                endpoint.url: {
+                    "peso": endpoint.peso,
+                    "saudavel": endpoint.saudavel,
+                    "requisicoes": endpoint.requisicoes,
+                    "imagens": endpoint.imagens,
+                    "falhas": endpoint.falhas,
+                    "reenfileiradas": endpoint.reenfileiradas,
+                    "quedas": endpoint.quedas,
+                    "imagens_por_s": round(endpoint.imagens / duracao, 2) if duracao else None,
+                    "media_requisicao_s": round(endpoint.ocupado_s / endpoint.requisicoes, 3) if endpoint.requisicoes else None,
+                }
+                for endpoint in self.endpoints
+            }
+
+    def fechar(self):
+        self._parar.set()
+        self._sessao_saude.close()
+        for endpoint in self.endpoints:
+            endpoint.cliente.fechar()
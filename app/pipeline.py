@@ -0,0 +1,214 @@
+# app/pipeline.py
+# Pipeline contínuo: recorte -> extração (Ollama) -> inferência de EAN, com as etapas
+# ligadas por filas limitadas em memória, sem arquivos intermediários obrigatórios.
+
+import csv
+import os
+import queue
+import sys
+import threading
+import time
+
+FIM = object()
+
+
+class _Erro:
+    """Embrulha uma exceção de uma etapa para que seja relançada no consumidor."""
+
+    def __init__(self, excecao):
+        self.excecao = excecao
+
+
+def _produzir(gerador, fila):
+    """Consome um gerador numa thread, colocando cada item na fila limitada."""
+    try:
+        for item in gerador:
+            fila.put(item)
+    except Exception as e:
+        fila.put(_Erro(e))
+    finally:
+        fila.put(FIM)
+
+
+def consumir_fila(fila):
+    """Gera os itens de uma fila até o marcador de fim, relançando erros da etapa anterior."""
+    while True:
+        item = fila.get()
+        if item is FIM:
+            return
+        if isinstance(item, _Erro):
+            raise item.excecao
+        yield item
+
+
+def em_thread(gerador, tamanho_fila):
+    """Executa 'gerador' numa thread própria e devolve um gerador que lê de uma fila limitada."""
+    fila = queue.Queue(maxsize=tamanho_fila)
+    threading.Thread(target=_produzir, args=(gerador, fila), daemon=True).start()
+    return consumir_fila(fila)
+
+
+def recortes_do_dataset(dataset_dir, pasta_recortes=None):
+    """Gera (nome, bytes JPEG) dos recortes das anotações YOLO, gravando-os opcionalmente em disco."""
+    import cv2
+    from crop_plates import gerar_recortes
+
+    if pasta_recortes:
+        os.makedirs(pasta_recortes, exist_ok=True)
+    for nome_recorte, recorte in gerar_recortes(dataset_dir):
+        ok, buffer = cv2.imencode(".jpg", recorte)
+        if not ok:
+            print(f"Erro: Não foi possível codificar o recorte {nome_recorte}. Pulando.")
+            continue
+        recorte_bytes = buffer.tobytes()
+        if pasta_recortes:
+            with open(os.path.join(pasta_recortes, nome_recorte), "wb") as f:
+                f.write(recorte_bytes)
+        yield nome_recorte, recorte_bytes
+
+
+def imagens_da_pasta(pasta):
+    """Gera (nome, bytes) das imagens já recortadas de uma pasta."""
+    for nome in sorted(os.listdir(pasta)):
+        caminho = os.path.join(pasta, nome)
+        if os.path.isfile(caminho) and nome.lower().endswith(('.png', '.jpg', '.jpeg')):
+            with open(caminho, "rb") as f:
+                yield nome, f.read()
+
+
+def executar_pipeline(imagens, csv_database_path, inference_output_file, fuzzy_threshold,
+                      max_em_voo=None, tamanho_fila=16, salvar_respostas=False):
+    """
+    Executa extração e inferência de EAN sobre um iterável de (nome, bytes da imagem).
+
+    Cada etapa roda em paralelo com as demais e as filas entre elas têm no máximo
+    'tamanho_fila' itens, de modo que a memória fica limitada independentemente do
+    tamanho do dataset. Cada resposta é casada com um EAN assim que chega e a linha
+    correspondente é gravada imediatamente no CSV de saída (mesmas colunas do infer_ean.py).
+    Com salvar_respostas=True, as respostas também são gravadas no arquivo de resultados
+    e confirmadas no manifesto do extract_data.py, para que um run seguinte não as
+    descarte como gravações incompletas.
+    """
+    import extract_data
+    from catalog_snapshot import carregar_catalogo
+    from infer_ean import inferir_ean, limpar_saida_gemma, parse_gemma_output
+    from manifest import Manifest
+
+    df_produtos, indice = carregar_catalogo(csv_database_path)
+    if df_produtos is None:
+        print("Não foi possível carregar a base de dados de produtos. Abortando pipeline.")
+        return
+
+    max_em_voo = max_em_voo or extract_data.MAX_EM_VOO
+
+    manifesto = None
+    if salvar_respostas:
+        manifesto = Manifest(os.path.join(extract_data.OUTPUT_DIR, "manifesto.jsonl"))
+        manifesto.reconciliar_resultados(extract_data.ARQUIVO_RESULTADOS)
+
+    # No modo cascata, a resposta do modelo pequeno sem EAN acima do threshold é escalada.
+    # A inferência feita na avaliação é reaproveitada ao gravar a linha da imagem.
+    inferencias = {}
+
+    def avaliar(nome_imagem, resultado_gemma):
+        dados_extraidos = extract_data.dados_da_resposta(resultado_gemma)
+        with extract_data.telemetria.medir(nome_imagem, "ean"):
+            ean, status = inferir_ean(dados_extraidos, df_produtos, fuzzy_threshold, indice)
+        inferencias[nome_imagem] = (resultado_gemma, dados_extraidos, ean, status)
+        return None if ean else "ean"
+
+    respostas = em_thread(
+        extract_data.extrair_em_fluxo(em_thread(imagens, tamanho_fila), max_em_voo,
+                                      avaliar if extract_data.MODELO_GRANDE else None),
+        tamanho_fila,
+    )
+
+    output_dir = os.path.dirname(inference_output_file)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    inicio = time.monotonic()
+    total = falhas = 0
+    with open(inference_output_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(['Imagem', 'Produto Extraído', 'Marca Extraída', 'EAN Inferido', 'Status Inferência'])
+
+        for nome_imagem, resultado_gemma, erro, modelo in respostas:
+            if resultado_gemma is None:
+                inferencias.pop(nome_imagem, None)
+                extract_data.registrar_falha(nome_imagem, erro)
+                falhas += 1
+                continue
+            if manifesto is not None:
+                fim_resultados = extract_data.salvar_resultado(nome_imagem, resultado_gemma, modelo)
+                manifesto.registrar_resposta(nome_imagem, extract_data.ARQUIVO_RESULTADOS, fim_resultados)
+
+            inferencia = inferencias.pop(nome_imagem, None)
+            if inferencia is not None and inferencia[0] == resultado_gemma:
+                _, dados_extraidos, ean, status = inferencia
+            else:
+                with extract_data.telemetria.medir(nome_imagem, "parse"):
+                    if extract_data.SAIDA_ESTRUTURADA:
+                        dados_extraidos = extract_data.interpretar_resposta_json(resultado_gemma)
+                    else:
+                        dados_extraidos = parse_gemma_output(limpar_saida_gemma(resultado_gemma))
+                with extract_data.telemetria.medir(nome_imagem, "ean"):
+                    ean, status = inferir_ean(dados_extraidos, df_produtos, fuzzy_threshold, indice)
+            writer.writerow([
+                nome_imagem,
+                dados_extraidos.get('produto', 'N/A'),
+                dados_extraidos.get('marca', 'N/A'),
+                ean if ean else 'NÃO ENCONTRADO',
+                status,
+            ])
+            f.flush()
+
+            total += 1
+            if total == 1:
+                print(f"Primeiro EAN inferido após {time.monotonic() - inicio:.1f}s.")
+
+    if manifesto is not None:
+        manifesto.fechar()
+
+    duracao = time.monotonic() - inicio
+    print(f"\nPipeline concluído: {total} imagens inferidas, {falhas} falhas, em {duracao:.1f}s.")
+    print(f"Resultados da inferência salvos em '{inference_output_file}'")
+    extract_data.imprimir_resumo_endpoints()
+    extract_data.imprimir_resumo_cascata()
+    extract_data.salvar_telemetria()
+
+
+if __name__ == "__main__":
+    DATASET_ANOTADO = os.getenv("DATASET_ANOTADO")
+    PASTA_IMAGENS_INPUT = os.getenv("PASTA_IMAGENS_INPUT", "/app/dataset-images")
+    PASTA_RECORTES = os.getenv("PASTA_RECORTES")
+    CROP_PLATES_DIR = os.getenv(
+        "CROP_PLATES_DIR",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "object_detection_project"),
+    )
+    CSV_DATABASE_FILE = os.getenv("CSV_DATABASE_FILE", "/app/data/ludiiprice_db_17012025.csv")
+    INFERENCE_OUTPUT_FILE = os.getenv("INFERENCE_OUTPUT_FILE", "/app/inferences/ean_inferences.csv")
+    FUZZY_THRESHOLD = int(os.getenv("FUZZY_THRESHOLD", 75))
+    TAMANHO_FILA = int(os.getenv("TAMANHO_FILA", 16))
+    SALVAR_RESPOSTAS = os.getenv("SALVAR_RESPOSTAS", "0") == "1"
+
+    if DATASET_ANOTADO:
+        sys.path.insert(0, CROP_PLATES_DIR)
+        print(f"Recortando em memória as anotações de: {DATASET_ANOTADO}")
+        imagens = recortes_do_dataset(DATASET_ANOTADO, PASTA_RECORTES)
+    else:
+        print(f"Lendo imagens já recortadas de: {PASTA_IMAGENS_INPUT}")
+        imagens = imagens_da_pasta(PASTA_IMAGENS_INPUT)
+
+    import extract_data
+    if extract_data.METRICAS_PORTA:
+        extract_data.telemetria.iniciar_servidor_metricas(extract_data.METRICAS_PORTA)
+
+    executar_pipeline(
+        imagens,
+        CSV_DATABASE_FILE,
+        INFERENCE_OUTPUT_FILE,
+        FUZZY_THRESHOLD,
+        tamanho_fila=TAMANHO_FILA,
+        salvar_respostas=SALVAR_RESPOSTAS,
+    )
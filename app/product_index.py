@@ -0,0 +1,447 @@
+# app/product_index.py
+
+import os
+import re
+from collections import defaultdict
+from functools import partial
+
+import numpy as np
+from fuzzywuzzy import fuzz, utils
+
+# Mesmo pré-processamento que process.extractOne aplica às escolhas quando o scorer é WRatio
+_pre_processar = partial(utils.full_process, force_ascii=True)
+
+
+def _pre_processar_consulta(texto):
+    """
+    Pré-processa a consulta como process.extractOne: primeiro o processor padrão
+    (full_process sem force_ascii) e depois o mesmo passo das escolhas. Os dois passos não
+    equivalem a um só: 'Leite® Integral 1L' vira 'leite  integral 1l' (com espaço duplo).
+    """
+    return _pre_processar(utils.full_process(texto))
+
+# Textos pontuados antes de refinar os limites superiores dos demais
+TAMANHO_SEMENTE = int(os.getenv("TAMANHO_SEMENTE", 16))
+# Busca limitada (serviço de EAN): acima de LIMITE_REFINAMENTO textos ainda alcançáveis depois
+# da semente, pontua só os LIMITE_PONTUADOS mais promissores em vez de provar qual é o melhor
+LIMITE_REFINAMENTO = int(os.getenv("LIMITE_REFINAMENTO", 1000))
+LIMITE_PONTUADOS = int(os.getenv("LIMITE_PONTUADOS", 128))
+
+# EAN-8, UPC-A, EAN-13 e GTIN-14
+TAMANHOS_GTIN = (8, 12, 13, 14)
+_RE_CODIGO_NUMERICO = re.compile(r"^[\d\s\-]+$")
+
+
+def digito_verificador_gtin_valido(gtin):
+    """Valida o dígito verificador GS1 (módulo 10) de um GTIN numérico de qualquer tamanho."""
+    corpo, verificador = gtin[:-1], int(gtin[-1])
+    soma = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(corpo)))
+    return (10 - soma % 10) % 10 == verificador
+
+
+def normalizar_gtin(codigo):
+    """
+    Normaliza um código de barras (EAN-8, UPC-A, EAN-13 ou GTIN-14) para GTIN-14.
+
+    Aceita espaços e hífens entre os dígitos e o sufixo '.0' que o pandas deixa em colunas
+    numéricas. Retorna None se o código não tiver um tamanho de GTIN ou se o dígito
+    verificador for inválido.
+    """
+    if codigo is None:
+        return None
+    codigo = str(codigo).strip()
+    if codigo.endswith(".0"):
+        codigo = codigo[:-2]
+    if not codigo or not _RE_CODIGO_NUMERICO.match(codigo):
+        return None
+    digitos = re.sub(r"\D", "", codigo)
+    if len(digitos) not in TAMANHOS_GTIN or not digito_verificador_gtin_valido(digitos):
+        return None
+    return digitos.zfill(14)
+
+
+def _codigo_bruto(codigo):
+    """Retorna o código como string de dígitos (sem o sufixo '.0' do pandas), ou None se não for numérico."""
+    if codigo is None:
+        return None
+    codigo = str(codigo).strip()
+    if codigo.endswith(".0"):
+        codigo = codigo[:-2]
+    return codigo if codigo.isdigit() else None
+
+
+# Colunas da contagem de caracteres: a-z, 0-9 e "outros" (espaços são contados à parte)
+_COLUNA_CARACTERE = np.full(256, 36, dtype=np.int64)
+_COLUNA_CARACTERE[np.frombuffer(b"abcdefghijklmnopqrstuvwxyz0123456789", dtype=np.uint8)] = np.arange(36)
+_COLUNA_CARACTERE[ord(" ")] = 37
+_COLUNAS_BOLSA = 37
+
+
+def _bolsa_de_caracteres(textos_processados):
+    """Matriz (textos x 37) com a contagem de cada caractere não-espaço de cada texto."""
+    bolsas = np.zeros((len(textos_processados), _COLUNAS_BOLSA + 1), dtype=np.int64)
+    passo = 100_000
+    for inicio in range(0, len(textos_processados), passo):
+        bloco = textos_processados[inicio:inicio + passo]
+        codigos = np.frombuffer("".join(bloco).encode("ascii", "replace"), dtype=np.uint8)
+        linhas = np.repeat(np.arange(len(bloco)), [len(texto) for texto in bloco])
+        bolsas[inicio:inicio + len(bloco)] = np.bincount(
+            linhas * (_COLUNAS_BOLSA + 1) + _COLUNA_CARACTERE[codigos],
+            minlength=len(bloco) * (_COLUNAS_BOLSA + 1),
+        ).reshape(len(bloco), _COLUNAS_BOLSA + 1)
+    bolsas = bolsas[:, :_COLUNAS_BOLSA]
+    return bolsas.astype(np.uint8 if bolsas.size == 0 or bolsas.max() < 256 else np.uint16)
+
+
+def _medidas(texto_processado):
+    """
+    (tamanho, espaços, tokens, caracteres dos tokens únicos, tokens únicos) de um texto já
+    processado: o que o limite superior do WRatio precisa saber além da bolsa de caracteres.
+    """
+    tokens = texto_processado.split()
+    unicos = set(tokens)
+    return (len(texto_processado), texto_processado.count(" "), len(tokens),
+            sum(len(token) for token in unicos), len(unicos))
+
+
+def _razao_maxima(comum, tamanho_1, tamanho_2):
+    """Maior ratio possível entre dois textos com no máximo 'comum' caracteres em comum."""
+    comum = np.minimum(comum, np.minimum(tamanho_1, tamanho_2))
+    return 2 * comum / np.maximum(tamanho_1 + tamanho_2, 1)
+
+
+def _parcial_maxima(comum, tamanho_1, tamanho_2):
+    """
+    Maior partial_ratio possível: o menor texto contra uma janela do maior de até o mesmo
+    tamanho (menor no fim do texto), com no máximo 'comum' caracteres em comum.
+    """
+    menor = np.minimum(tamanho_1, tamanho_2)
+    comum = np.minimum(comum, menor)
+    return 2 * comum / np.maximum(menor + comum, 1)
+
+
+def _score_maximo(razao):
+    """
+    Maior inteiro que utils.intr pode devolver para uma razão de no máximo 'razao' (o
+    arredondamento é para o par mais próximo, nunca acima de x + 0.5). A folga absorve as
+    diferenças de ponto flutuante entre este cálculo e o do Levenshtein.
+    """
+    return np.floor(100 * razao + 0.5 + 1e-9)
+
+
+def _primeiros(indices, prioridade, quantidade):
+    """Os 'quantidade' índices de maior prioridade (valores distintos), do maior para o menor."""
+    if len(indices) > quantidade:
+        indices = indices[np.argpartition(-prioridade[indices], quantidade)[:quantidade]]
+    return indices[np.argsort(-prioridade[indices])]
+
+
+class _ListasInvertidas:
+    """
+    Listas invertidas compactadas (formato CSR): chave -> fatia de um único array de
+    posições. Ocupa bem menos memória que um dict de listas e é serializada rapidamente.
+    """
+
+    def __init__(self, listas):
+        self.chaves = {}
+        inicios = [0]
+        valores = []
+        for chave, posicoes in listas.items():
+            self.chaves[chave] = len(inicios) - 1
+            valores.extend(posicoes)
+            inicios.append(len(valores))
+        self.inicios = np.asarray(inicios, dtype=np.int64)
+        self.valores = np.asarray(valores, dtype=np.int32)
+
+    def get(self, chave):
+        k = self.chaves.get(chave)
+        if k is None:
+            return self.valores[:0]
+        return self.valores[self.inicios[k]:self.inicios[k + 1]]
+
+
+class ProductIndex:
+    """
+    Índice de busca fuzzy sobre a coluna 'comparable_text_db' do catálogo de produtos.
+
+    É construído uma única vez a partir do DataFrame carregado. Textos repetidos são
+    pontuados uma só vez e cada texto aponta diretamente para a posição (iloc) da
+    primeira linha do catálogo onde aparece, dispensando a segunda varredura do DataFrame.
+
+    Também mantém uma tabela hash de códigos de barras normalizados para GTIN-14, para
+    que EANs lidos das etiquetas sejam resolvidos em tempo constante.
+
+    No modo bloqueado (padrão), o WRatio de cada texto tem um limite superior calculado de
+    uma vez para o catálogo inteiro, com contagens de caracteres e de tokens em comum (ver
+    _limites_superiores). Os textos são pontuados em ordem decrescente desse limite e a busca
+    para quando nenhum texto restante pode superar o melhor (ou empatar com ele antes na
+    ordem do catálogo). O resultado é, portanto, o mesmo de process.extractOne. No modo
+    exaustivo, todos os textos são pontuados e as contagens nem são construídas.
+    """
+
+    def __init__(self, df_produtos, exaustivo=False):
+        self.exaustivo = exaustivo
+
+        # Textos únicos e não vazios, na ordem da primeira ocorrência no catálogo
+        self.textos = []
+        self.posicoes = []
+        vistos = set()
+        for posicao, texto in enumerate(df_produtos['comparable_text_db'].tolist()):
+            if not texto.strip() or texto in vistos:
+                continue
+            vistos.add(texto)
+            self.textos.append(texto)
+            self.posicoes.append(posicao)
+
+        # GTIN-14 -> posição da primeira linha do catálogo com esse código. Códigos numéricos
+        # que não passam na normalização (tamanho ou dígito verificador inválidos) ficam num
+        # mapa à parte, pela string exata, para continuarem casando como antes da normalização.
+        self.por_gtin = {}
+        self.por_codigo_bruto = {}
+        for posicao, ean in enumerate(df_produtos['ean'].tolist()):
+            gtin = normalizar_gtin(ean)
+            if gtin is not None:
+                self.por_gtin.setdefault(gtin, posicao)
+            elif _codigo_bruto(ean) is not None:
+                self.por_codigo_bruto.setdefault(_codigo_bruto(ean), posicao)
+
+        self.textos_processados = [_pre_processar(texto) for texto in self.textos]
+
+        self.indice_tokens = None
+        if not exaustivo:
+            self._construir_listas_invertidas()
+
+    def _construir_listas_invertidas(self):
+        indice_tokens = defaultdict(list)
+        for i, texto_processado in enumerate(self.textos_processados):
+            for token in set(texto_processado.split()):
+                indice_tokens[token].append(i)
+        self.indice_tokens = _ListasInvertidas(indice_tokens)
+
+        self.bolsas = _bolsa_de_caracteres(self.textos_processados)
+        medidas = np.array([_medidas(texto) for texto in self.textos_processados], dtype=np.int32).reshape(-1, 5)
+        (self.tamanhos, self.espacos, self.qtd_tokens,
+         self.tamanhos_unicos, self.qtd_tokens_unicos) = medidas.T.copy()
+
+    def __len__(self):
+        return len(self.textos)
+
+    def buscar_gtin(self, codigo):
+        """
+        Retorna a posição no DataFrame do produto com o código de barras informado, ou None.
+
+        GTINs válidos são comparados já normalizados; os demais códigos numéricos só casam
+        com a mesma string exata no catálogo.
+        """
+        gtin = normalizar_gtin(codigo)
+        if gtin is not None and gtin in self.por_gtin:
+            return self.por_gtin[gtin]
+        bruto = _codigo_bruto(codigo)
+        if bruto is None:
+            return None
+        return self.por_codigo_bruto.get(bruto)
+
+    def _tokens_em_comum(self, consulta_processada):
+        """(tokens únicos em comum, caracteres desses tokens) de cada texto com a consulta."""
+        quantidade = np.zeros(len(self.textos), dtype=np.int64)
+        caracteres = np.zeros(len(self.textos), dtype=np.int64)
+        for token in set(consulta_processada.split()):
+            posicoes = self.indice_tokens.get(token)
+            quantidade[posicoes] += 1
+            caracteres[posicoes] += len(token)
+        return quantidade, caracteres
+
+    def _parcial_por_janelas(self, consulta_processada, indices):
+        """
+        Maior partial_ratio possível da consulta contra cada texto em 'indices', que devem ser
+        pelo menos tão longos quanto ela: o partial_ratio compara a consulta com janelas do
+        texto do mesmo tamanho, e em cada janela a maior subsequência comum não passa da
+        interseção da bolsa de caracteres da janela com a da consulta.
+        """
+        tamanho = len(consulta_processada)
+        colunas = _COLUNA_CARACTERE[np.frombuffer(consulta_processada.encode("ascii", "replace"), dtype=np.uint8)]
+        colunas_consulta, contagens_consulta = np.unique(colunas, return_counts=True)
+        maximos = np.zeros(len(indices), dtype=np.float64)
+        passo = 2_000
+        for inicio in range(0, len(indices), passo):
+            bloco = [self.textos_processados[i] for i in indices[inicio:inicio + passo]]
+            tamanhos = np.array([len(texto) for texto in bloco], dtype=np.int64)
+            # Caracteres de cada texto em uma linha, completada com a coluna "espaço extra"
+            # (que nunca casa) até o maior tamanho mais o da janela
+            largura = int(tamanhos.max()) + tamanho
+            caracteres = np.full((len(bloco), largura), _COLUNAS_BOLSA + 1, dtype=np.uint8)
+            codigos = np.frombuffer("".join(bloco).encode("ascii", "replace"), dtype=np.uint8)
+            linhas = np.repeat(np.arange(len(bloco)), tamanhos)
+            deslocamentos = np.arange(len(codigos)) - np.repeat(np.cumsum(tamanhos) - tamanhos, tamanhos)
+            caracteres[linhas, deslocamentos] = _COLUNA_CARACTERE[codigos]
+
+            # Contagens acumuladas em uint8: a diferença módulo 256 ainda é exata, já que
+            # nenhuma janela tem 256 caracteres iguais (consultas longas caem no limite geral)
+            comum = np.zeros((len(bloco), largura - tamanho), dtype=np.int16)
+            acumulado = np.zeros((len(bloco), largura + 1), dtype=np.uint8)
+            for coluna, contagem in zip(colunas_consulta, contagens_consulta):
+                np.cumsum(caracteres == coluna, axis=1, dtype=np.uint8, out=acumulado[:, 1:])
+                comum += np.minimum(acumulado[:, tamanho:largura] - acumulado[:, :largura - tamanho], contagem)
+            # A janela que começa em 'inicio_janela' tem min(tamanho, resto do texto) caracteres
+            janelas = np.minimum(tamanho, tamanhos[:, None] - np.arange(largura - tamanho)[None, :])
+            razoes = np.where(janelas > 0, 2 * comum / np.maximum(tamanho + janelas, 1), 0)
+            maximos[inicio:inicio + passo] = razoes.max(axis=1)
+        return maximos
+
+    def _limites_superiores(self, consulta_processada, indices=None):
+        """
+        Limite superior do score WRatio de cada texto do catálogo (ou só dos textos em
+        'indices') contra a consulta.
+
+        Todas as razões do WRatio (ratio, partial_ratio e as versões por tokens) valem no
+        máximo 2 * LCS / (soma dos tamanhos), e a maior subsequência comum não passa da
+        interseção das bolsas de caracteres. O token_set_ratio compara também a interseção
+        dos tokens com cada texto inteiro, o que os tokens em comum limitam. Com 'indices',
+        o partial_ratio da consulta contra textos mais longos é limitado janela a janela
+        (ver _parcial_por_janelas), o que custa mais mas descarta muito mais textos. Os
+        arredondamentos e as escalas são aplicados na mesma ordem que no WRatio.
+        """
+        tamanho, espacos, tokens, tamanho_unicos, tokens_unicos = _medidas(consulta_processada)
+        selecao = slice(None) if indices is None else indices
+        quantidade = len(self.textos) if indices is None else len(indices)
+        if tamanho == 0:
+            return np.zeros(quantidade, dtype=np.int64)
+        bolsa = _bolsa_de_caracteres([consulta_processada])[0]
+        comum = np.minimum(self.bolsas[selecao], bolsa.astype(self.bolsas.dtype)).sum(axis=1, dtype=np.int64)
+        em_comum, caracteres_em_comum = (valores[selecao] for valores in self._tokens_em_comum(consulta_processada))
+
+        tamanhos = self.tamanhos[selecao].astype(np.int64)
+        espacos_texto, qtd_tokens = self.espacos[selecao], self.qtd_tokens[selecao]
+        tamanhos_unicos, qtd_tokens_unicos = self.tamanhos_unicos[selecao], self.qtd_tokens_unicos[selecao]
+
+        letras, letras_texto = tamanho - espacos, tamanhos - espacos_texto
+        base = _razao_maxima(comum + np.minimum(espacos, espacos_texto), tamanho, tamanhos)
+        # Tokens ordenados e unidos por um espaço
+        comum_ordenado = np.minimum(comum, np.minimum(letras, letras_texto)) + np.minimum(tokens, qtd_tokens) - 1
+        ordenado_1, ordenado_2 = letras + tokens - 1, letras_texto + qtd_tokens - 1
+        # Tokens únicos ordenados (as duas combinações do token_set comparadas entre si)
+        comum_unicos = (np.minimum(comum, np.minimum(tamanho_unicos, tamanhos_unicos))
+                        + np.minimum(tokens_unicos, qtd_tokens_unicos) - 1)
+        unicos_1, unicos_2 = tamanho_unicos + tokens_unicos - 1, tamanhos_unicos + qtd_tokens_unicos - 1
+        # Interseção dos tokens contra cada combinação (da qual ela é prefixo)
+        intersecao = np.where(em_comum > 0, caracteres_em_comum + em_comum - 1, 0)
+        conjunto = np.maximum.reduce([
+            _razao_maxima(comum_unicos, unicos_1, unicos_2),
+            2 * intersecao / np.maximum(intersecao + unicos_1, 1),
+            2 * intersecao / np.maximum(intersecao + unicos_2, 1),
+        ])
+        sem_parcial = np.maximum.reduce([
+            _score_maximo(base),
+            _score_maximo(_razao_maxima(comum_ordenado, ordenado_1, ordenado_2)) * 0.95,
+            _score_maximo(conjunto) * 0.95,
+        ])
+
+        proporcao = np.maximum(tamanho, tamanhos) / np.maximum(np.minimum(tamanho, tamanhos), 1)
+        escala = np.where(proporcao > 8, 0.6, 0.9)
+        parcial = _parcial_maxima(comum + np.minimum(espacos, espacos_texto), tamanho, tamanhos)
+        if indices is not None:
+            mais_longos = np.flatnonzero((proporcao >= 1.5) & (tamanhos >= tamanho) & (tamanho < 256))
+            if len(mais_longos):
+                parcial[mais_longos] = self._parcial_por_janelas(consulta_processada, indices[mais_longos])
+        # Com um token em comum, a interseção é um trecho exato de cada combinação do token_set
+        parcial_conjunto = np.where(em_comum > 0, 1.0, _parcial_maxima(comum_unicos, unicos_1, unicos_2))
+        com_parcial = np.maximum.reduce([
+            _score_maximo(base),
+            _score_maximo(parcial) * escala,
+            _score_maximo(_parcial_maxima(comum_ordenado, ordenado_1, ordenado_2)) * 0.95 * escala,
+            _score_maximo(parcial_conjunto) * 0.95 * escala,
+        ])
+        limite = _score_maximo(np.where(proporcao < 1.5, sem_parcial, com_parcial) / 100)
+        # Textos que o pré-processamento esvazia têm score 0
+        return np.maximum(limite, 0).astype(np.int64)
+
+    def _melhor(self, consulta_processada, candidatos):
+        melhor_i, melhor_score = None, -1
+        for i in candidatos:
+            score = fuzz.WRatio(consulta_processada, self.textos_processados[i], full_process=False)
+            if score > melhor_score:
+                melhor_i, melhor_score = i, score
+        return melhor_i, melhor_score
+
+    def _pontuar_em_ordem(self, consulta_processada, indices, limites, melhor, minimo, maximo=None):
+        """
+        Pontua os textos em 'indices' em ordem decrescente de limite superior (e, no empate,
+        na ordem do catálogo), parando quando nenhum dos restantes pode superar o 'melhor'
+        (índice, score) nem alcançar 'minimo'. Com 'maximo', pontua no máximo esse número de
+        textos. Retorna o novo melhor e os índices pontuados.
+        """
+        melhor_i, melhor_score = melhor
+        pontuados = []
+        for i in indices[np.lexsort((indices, -limites[indices]))].tolist():
+            if limites[i] < melhor_score or limites[i] < minimo or len(pontuados) == maximo:
+                break
+            if limites[i] == melhor_score and i > melhor_i:
+                continue
+            score = fuzz.WRatio(consulta_processada, self.textos_processados[i], full_process=False)
+            pontuados.append(i)
+            if score > melhor_score or (score == melhor_score and i < melhor_i):
+                melhor_i, melhor_score = i, score
+        return (melhor_i, melhor_score), pontuados
+
+    def buscar(self, texto_busca, exaustivo=None, score_minimo=None, limitada=False):
+        """
+        Retorna (posição no DataFrame, texto do catálogo, score) da melhor correspondência
+        para texto_busca, ou None se o índice estiver vazio.
+
+        Em caso de empate, vence o texto que aparece primeiro no catálogo, como em process.extractOne.
+
+        A busca limitada (limitada=True, usada pelo serviço de EAN) troca a garantia por
+        latência: textos que não podem alcançar score_minimo não são pontuados, e se depois
+        da semente ainda restarem mais de LIMITE_REFINAMENTO textos que poderiam superá-la,
+        só os LIMITE_PONTUADOS com mais caracteres de tokens em comum com a consulta são
+        pontuados. Isso acontece com consultas genéricas ou curtas, sem correspondência
+        clara no catálogo; nelas a melhor correspondência (e a decisão em relação ao
+        score_minimo) pode diferir da busca completa.
+        """
+        if not self.textos:
+            return None
+
+        if exaustivo is None:
+            exaustivo = self.exaustivo
+
+        consulta_processada = _pre_processar_consulta(texto_busca)
+
+        if exaustivo or self.indice_tokens is None:
+            melhor_i, melhor_score = self._melhor(consulta_processada, range(len(self.textos)))
+            return self.posicoes[melhor_i], self.textos[melhor_i], melhor_score
+
+        minimo = score_minimo if limitada and score_minimo is not None else 0
+        quantidade = len(self.textos)
+        todos = np.arange(quantidade)
+        limites = self._limites_superiores(consulta_processada)
+        # Prioridade: caracteres de tokens em comum com a consulta, limite superior e ordem do catálogo
+        _, caracteres_em_comum = self._tokens_em_comum(consulta_processada)
+        prioridade = (caracteres_em_comum * 128 + limites) * quantidade + (quantidade - 1 - todos)
+        semente = _primeiros(todos, prioridade, TAMANHO_SEMENTE)
+        melhor, pontuados = self._pontuar_em_ordem(consulta_processada, semente, limites, (None, -1), 0)
+
+        # Textos não pontuados que ainda podem superar a semente (ou empatar antes dela)
+        melhor_i, melhor_score = melhor
+        alvo = max(melhor_score, minimo)
+        if alvo > melhor_score:
+            alcancaveis = limites >= alvo
+        else:
+            alcancaveis = (limites > alvo) | ((limites == alvo) & (todos < melhor_i))
+        alcancaveis[pontuados] = False
+        restantes = np.flatnonzero(alcancaveis)
+
+        if limitada and len(restantes) > LIMITE_REFINAMENTO:
+            for i in _primeiros(restantes, prioridade, LIMITE_PONTUADOS).tolist():
+                score = fuzz.WRatio(consulta_processada, self.textos_processados[i], full_process=False)
+                if score > melhor_score or (score == melhor_score and i < melhor_i):
+                    melhor_i, melhor_score = i, score
+        elif len(restantes):
+            # Refina os limites dos restantes e continua a busca só por eles
+            limites[restantes] = np.minimum(limites[restantes], self._limites_superiores(consulta_processada, restantes))
+            melhor, _ = self._pontuar_em_ordem(consulta_processada, restantes, limites, melhor, minimo)
+            melhor_i, melhor_score = melhor
+
+        if melhor_i is None:
+            # Na busca limitada, nenhum texto pode alcançar o mínimo: reporta o primeiro com score 0
+            melhor_i, melhor_score = 0, 0
+        return self.posicoes[melhor_i], self.textos[melhor_i], melhor_score
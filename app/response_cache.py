@@ -0,0 +1,120 @@
+# app/response_cache.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_MAX_ENTRADAS = int(os.getenv("CACHE_MAX_ENTRADAS", 200000))
+# Idade máxima (s) de uma resposta no cache; 0 desativa a expiração
+CACHE_MAX_IDADE = float(os.getenv("CACHE_MAX_IDADE", 90 * 24 * 3600))
+# A limpeza por idade/tamanho roda a cada N inserções
+CACHE_INTERVALO_LIMPEZA = 500
+
+
+def chave_cache(imagem_bytes, modelo, prompt, opcoes=None):
+    """Calcula a chave do cache: SHA-256 dos bytes da imagem, modelo, prompt e opções."""
+    h = hashlib.sha256()
+    h.update(hashlib.sha256(imagem_bytes).digest())
+    h.update(b"\0" + modelo.encode("utf-8"))
+    h.update(b"\0" + prompt.encode("utf-8"))
+    h.update(b"\0" + json.dumps(opcoes or {}, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache persistente (SQLite) de respostas do modelo de visão, endereçado pelo conteúdo.
+
+    Entradas mais antigas que max_idade segundos são descartadas e, acima de
+    max_entradas, as menos usadas recentemente são removidas. Conta acertos e falhas
+    de consulta para o resumo da execução.
+    """
+
+    def __init__(self, caminho, max_entradas=CACHE_MAX_ENTRADAS, max_idade=CACHE_MAX_IDADE):
+        self.caminho = caminho
+        self.max_entradas = max_entradas
+        self.max_idade = max_idade
+        self.acertos = 0
+        self.falhas = 0
+        self._insercoes = 0
+        self._lock = threading.Lock()
+
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute("PRAGMA synchronous=NORMAL")
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS respostas ("
+            " chave TEXT PRIMARY KEY,"
+            " resposta TEXT NOT NULL,"
+            " criado_em REAL NOT NULL,"
+            " usado_em REAL NOT NULL)"
+        )
+        self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_usado_em ON respostas (usado_em)")
+        self._conexao.commit()
+        self.limpar()
+
+    def obter(self, chave, *alternativas):
+        """
+        Retorna a resposta guardada para a chave, ou None. Se houver chaves alternativas
+        (ex.: a mesma imagem extraída com outro prompt), vale a primeira encontrada na
+        ordem informada; a consulta conta como um único acerto ou falha.
+        """
+        chaves = (chave, *alternativas)
+        agora = time.time()
+        with self._lock:
+            linhas = dict((c, (resposta, criado_em)) for c, resposta, criado_em in self._conexao.execute(
+                f"SELECT chave, resposta, criado_em FROM respostas WHERE chave IN ({', '.join('?' * len(chaves))})",
+                chaves,
+            ))
+            for c in chaves:
+                if c in linhas and not (self.max_idade and agora - linhas[c][1] > self.max_idade):
+                    self._conexao.execute("UPDATE respostas SET usado_em = ? WHERE chave = ?", (agora, c))
+                    self._conexao.commit()
+                    self.acertos += 1
+                    return linhas[c][0]
+            self.falhas += 1
+            return None
+
+    def guardar(self, chave, resposta):
+        agora = time.time()
+        with self._lock:
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO respostas (chave, resposta, criado_em, usado_em) VALUES (?, ?, ?, ?)",
+                (chave, resposta, agora, agora),
+            )
+            self._conexao.commit()
+            self._insercoes += 1
+            limpar = self._insercoes % CACHE_INTERVALO_LIMPEZA == 0
+        if limpar:
+            self.limpar()
+
+    def limpar(self):
+        """Remove entradas expiradas e as menos usadas além de max_entradas."""
+        with self._lock:
+            if self.max_idade:
+                self._conexao.execute("DELETE FROM respostas WHERE criado_em < ?", (time.time() - self.max_idade,))
+            excedente = self._conexao.execute("SELECT COUNT(*) FROM respostas").fetchone()[0] - self.max_entradas
+            if excedente > 0:
+                self._conexao.execute(
+                    "DELETE FROM respostas WHERE chave IN"
+                    " (SELECT chave FROM respostas ORDER BY usado_em LIMIT ?)",
+                    (excedente,),
+                )
+            self._conexao.commit()
+
+    def estatisticas(self):
+        with self._lock:
+            entradas = self._conexao.execute("SELECT COUNT(*) FROM respostas").fetchone()[0]
+        consultas = self.acertos + self.falhas
+        taxa = self.acertos / consultas if consultas else 0.0
+        return {"acertos": self.acertos, "falhas": self.falhas, "taxa_acerto": taxa, "entradas": entradas}
+
+    def fechar(self):
+        with self._lock:
+            self._conexao.close()
@@ -0,0 +1,190 @@
+# app/result_store.py
+
+import json
+import os
+import sys
+import threading
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional; sem ele usa o json da biblioteca padrão
+    orjson = None
+
+
+def _carregar_json(linha):
+    return orjson.loads(linha) if orjson is not None else json.loads(linha)
+
+
+def _serializar_json(registro):
+    if orjson is not None:
+        return orjson.dumps(registro)
+    return json.dumps(registro, ensure_ascii=False).encode("utf-8")
+
+
+def _filtrar_indice(caminho_indice, tamanho):
+    """Regrava o índice lateral só com as entradas completas que terminam até 'tamanho'."""
+    validas = []
+    with open(caminho_indice, "r", encoding="utf-8") as f:
+        for linha in f:
+            partes = linha.rstrip("\n").split("\t")
+            if linha.endswith("\n") and len(partes) == 3 and int(partes[2]) <= tamanho:
+                validas.append(linha)
+    caminho_temp = caminho_indice + ".tmp"
+    with open(caminho_temp, "w", encoding="utf-8") as f:
+        f.writelines(validas)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(caminho_temp, caminho_indice)
+
+
+def truncar_resultados(caminho, tamanho):
+    """
+    Trunca um arquivo de resultados em 'tamanho' bytes e, se for um JSONL do ResultStore,
+    remove do índice .idx as entradas que apontavam para o trecho descartado.
+    """
+    with open(caminho, "rb+") as f:
+        f.truncate(tamanho)
+        os.fsync(f.fileno())
+    if os.path.exists(caminho + ".idx"):
+        _filtrar_indice(caminho + ".idx", tamanho)
+
+
+class ResultStore:
+    """
+    Armazena os resultados da extração em JSONL (um registro por linha, só acréscimo).
+
+    Cada registro tem ao menos 'imagem' e 'dados' (marca, produto, preço, ...). Um índice
+    lateral (<arquivo>.idx, linhas 'imagem<TAB>início<TAB>fim') permite ir direto ao registro de
+    uma imagem sem reler o arquivo. Se o índice estiver ausente ou desatualizado, é
+    reconstruído a partir do JSONL. Uma linha final incompleta (processo interrompido
+    no meio da escrita) é descartada ao abrir o arquivo.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.caminho_indice = caminho + ".idx"
+        self._lock = threading.Lock()
+        self.offsets = {}
+
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        if not os.path.exists(caminho):
+            open(caminho, "wb").close()
+        self._descartar_linha_incompleta()
+        self._carregar_indice()
+
+    def _descartar_linha_incompleta(self):
+        tamanho = os.path.getsize(self.caminho)
+        if tamanho == 0:
+            return
+        with open(self.caminho, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) == b"\n":
+                return
+            # Procura o último '\n' de trás para frente e trunca logo depois dele
+            posicao = tamanho
+            while posicao > 0:
+                bloco = min(65536, posicao)
+                posicao -= bloco
+                f.seek(posicao)
+                dados = f.read(bloco)
+                ultimo = dados.rfind(b"\n")
+                if ultimo != -1:
+                    f.truncate(posicao + ultimo + 1)
+                    return
+            f.truncate(0)
+
+    def _carregar_indice(self):
+        tamanho_jsonl = os.path.getsize(self.caminho)
+        fim_indexado = 0
+        descartadas = False
+        if os.path.exists(self.caminho_indice):
+            with open(self.caminho_indice, "r", encoding="utf-8") as f:
+                for linha in f:
+                    partes = linha.rstrip("\n").split("\t")
+                    if not linha.endswith("\n") or len(partes) != 3 or int(partes[2]) > tamanho_jsonl:
+                        descartadas = True
+                        continue
+                    imagem, offset, fim = partes[0], int(partes[1]), int(partes[2])
+                    self.offsets[imagem] = offset
+                    fim_indexado = max(fim_indexado, fim)
+        if descartadas:
+            # Entradas além do fim do JSONL (arquivo truncado) seriam reaproveitadas por
+            # engano quando novos registros ocupassem esses offsets: regrava o índice sem elas
+            _filtrar_indice(self.caminho_indice, tamanho_jsonl)
+        if fim_indexado < tamanho_jsonl:
+            self._indexar_a_partir_de(fim_indexado)
+
+    def _indexar_a_partir_de(self, inicio):
+        """Indexa os registros do JSONL a partir de 'inicio' e acrescenta-os ao índice lateral."""
+        novas = []
+        with open(self.caminho, "rb") as f:
+            f.seek(inicio)
+            offset = inicio
+            for linha in f:
+                fim = offset + len(linha)
+                if linha.strip():
+                    imagem = _carregar_json(linha)["imagem"]
+                    self.offsets[imagem] = offset
+                    novas.append(f"{imagem}\t{offset}\t{fim}\n")
+                offset = fim
+        if novas:
+            with open(self.caminho_indice, "a", encoding="utf-8") as f:
+                f.writelines(novas)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, imagem):
+        return imagem in self.offsets
+
+    def adicionar(self, imagem, dados, **extras):
+        """Acrescenta o registro de uma imagem com uma única escrita e atualiza o índice."""
+        linha = _serializar_json({"imagem": imagem, "dados": dados, **extras}) + b"\n"
+        with self._lock:
+            with open(self.caminho, "ab") as f:
+                offset = f.tell()
+                f.write(linha)
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.caminho_indice, "a", encoding="utf-8") as f:
+                f.write(f"{imagem}\t{offset}\t{offset + len(linha)}\n")
+            self.offsets[imagem] = offset
+        return offset
+
+    def obter(self, imagem):
+        """Retorna o registro mais recente da imagem, ou None."""
+        offset = self.offsets.get(imagem)
+        if offset is None:
+            return None
+        with open(self.caminho, "rb") as f:
+            f.seek(offset)
+            return _carregar_json(f.readline())
+
+    def __iter__(self):
+        """Percorre todos os registros na ordem em que foram gravados."""
+        with open(self.caminho, "rb") as f:
+            for linha in f:
+                if linha.strip():
+                    yield _carregar_json(linha)
+
+
+def importar_resultados_txt(caminho_txt, store):
+    """Importa um arquivo resultado_*.txt (blocos 'Imagem: ...') para um ResultStore."""
+    from infer_ean import ler_blocos_resultados, parse_gemma_output
+
+    total = 0
+    for imagem, gemma_full_output in ler_blocos_resultados(caminho_txt):
+        store.adicionar(imagem, parse_gemma_output(gemma_full_output), resposta=gemma_full_output)
+        total += 1
+    return total
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Uso: python result_store.py <resultado_*.txt> <saida.jsonl>")
+        sys.exit(1)
+
+    total = importar_resultados_txt(sys.argv[1], ResultStore(sys.argv[2]))
+    print(f"{total} registros importados de '{sys.argv[1]}' para '{sys.argv[2]}'.")
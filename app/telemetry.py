@@ -0,0 +1,213 @@
+# app/telemetry.py
+
+import contextlib
+import csv
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ollama_client import CAMPOS_METRICAS
+
+ETAPAS = ["codificacao", "requisicao", "rede", "parse", "ean"]
+CAMPOS_RELATORIO = [
+    "imagem", "modelo", "endpoint", "cache", "lote", "escalada", "tentativas",
+    *(f"{etapa}_ms" for etapa in ETAPAS),
+    "total_duration_ms", "load_duration_ms", "prompt_eval_count", "prompt_eval_duration_ms",
+    "eval_count", "eval_duration_ms", "tokens_por_s",
+]
+# load_duration acima deste valor indica que o Ollama (re)carregou o modelo na requisição
+LIMITE_RECARGA_MS = float(os.getenv("LIMITE_RECARGA_MS", 500))
+
+DESCRICOES_PROMETHEUS = {
+    "ollama_requisicoes_total": "Requisições respondidas pelo Ollama.",
+    "ollama_recargas_total": "Requisições em que o Ollama (re)carregou o modelo.",
+    "ollama_carga_segundos_total": "Soma de load_duration.",
+    "ollama_prompt_tokens_total": "Soma de prompt_eval_count.",
+    "ollama_prompt_segundos_total": "Soma de prompt_eval_duration.",
+    "ollama_tokens_gerados_total": "Soma de eval_count.",
+    "ollama_geracao_segundos_total": "Soma de eval_duration.",
+}
+
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    if not valores:
+        return None
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+
+def _soma(registros, campo):
+    return sum(r.get(campo) or 0 for r in registros)
+
+
+class Telemetria:
+    """
+    Registra, por imagem, o tempo de cada etapa (codificação, requisição, rede, parse e
+    match de EAN) e os campos de tempo que o Ollama devolve no último chunk do streaming
+    (total_duration, load_duration, prompt_eval_* e eval_*), para saber se recargas do
+    modelo, a avaliação do prompt ou a geração de tokens dominam o tempo.
+
+    Os registros podem ser exportados em JSON/CSV e, opcionalmente, expostos no formato
+    de texto do Prometheus em /metrics.
+    """
+
+    def __init__(self):
+        self.registros = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, imagem, **campos):
+        with self._lock:
+            self.registros.setdefault(imagem, {"imagem": imagem}).update(campos)
+
+    def _acumular(self, imagem, campo, valor):
+        with self._lock:
+            registro = self.registros.setdefault(imagem, {"imagem": imagem})
+            registro[campo] = round(registro.get(campo, 0) + valor, 3)
+
+    @contextlib.contextmanager
+    def medir(self, imagem, etapa):
+        """Soma ao registro da imagem o tempo (ms) gasto no bloco, no campo '<etapa>_ms'."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._acumular(imagem, f"{etapa}_ms", (time.perf_counter() - inicio) * 1000)
+
+    def registrar_ollama(self, imagem, metricas):
+        """
+        Registra as métricas devolvidas por OllamaClient.gerar_com_metricas. O tempo de rede
+        é a duração da requisição vista pelo cliente menos o total_duration do servidor.
+        """
+        campos = {"modelo": metricas.get("modelo"), "tentativas": metricas.get("tentativas")}
+        if metricas.get("endpoint"):
+            campos["endpoint"] = metricas["endpoint"]
+        requisicao_ms = metricas.get("requisicao_s", 0) * 1000
+        campos["requisicao_ms"] = round(requisicao_ms, 3)
+        for campo in CAMPOS_METRICAS:
+            valor = metricas.get(campo)
+            if valor is None:
+                continue
+            if campo.endswith("_duration"):
+                campos[f"{campo}_ms"] = round(valor / 1e6, 3)
+            else:
+                campos[campo] = valor
+        if "total_duration_ms" in campos:
+            campos["rede_ms"] = round(max(0.0, requisicao_ms - campos["total_duration_ms"]), 3)
+        if campos.get("eval_count") and campos.get("eval_duration_ms"):
+            campos["tokens_por_s"] = round(campos["eval_count"] / (campos["eval_duration_ms"] / 1000), 2)
+        self.registrar(imagem, **campos)
+
+    def _copiar_registros(self):
+        with self._lock:
+            return [dict(r) for r in self.registros.values()]
+
+    def resumo(self):
+        """Agrega os registros: estatísticas por etapa e, por modelo, tokens/s e composição do tempo."""
+        registros = self._copiar_registros()
+        etapas = {}
+        for etapa in ETAPAS:
+            valores = [r[f"{etapa}_ms"] for r in registros if r.get(f"{etapa}_ms") is not None]
+            if valores:
+                etapas[etapa] = {
+                    "imagens": len(valores),
+                    "media_ms": round(sum(valores) / len(valores), 3),
+                    "p50_ms": _percentil(valores, 50),
+                    "p95_ms": _percentil(valores, 95),
+                }
+
+        modelos = {}
+        for modelo in sorted({r["modelo"] for r in registros if r.get("modelo")}):
+            do_modelo = [r for r in registros if r.get("modelo") == modelo]
+            total_ms = _soma(do_modelo, "total_duration_ms")
+            eval_ms = _soma(do_modelo, "eval_duration_ms")
+            prompt_ms = _soma(do_modelo, "prompt_eval_duration_ms")
+            carga_ms = _soma(do_modelo, "load_duration_ms")
+            modelos[modelo] = {
+                "imagens": len(do_modelo),
+                "recargas": sum(1 for r in do_modelo if (r.get("load_duration_ms") or 0) > LIMITE_RECARGA_MS),
+                "tokens_gerados": _soma(do_modelo, "eval_count"),
+                "tokens_por_s": round(_soma(do_modelo, "eval_count") / (eval_ms / 1000), 2) if eval_ms else None,
+                "tokens_prompt_por_s": round(_soma(do_modelo, "prompt_eval_count") / (prompt_ms / 1000), 2) if prompt_ms else None,
+                "fracao_carga": round(carga_ms / total_ms, 4) if total_ms else None,
+                "fracao_prompt": round(prompt_ms / total_ms, 4) if total_ms else None,
+                "fracao_geracao": round(eval_ms / total_ms, 4) if total_ms else None,
+            }
+
+        return {
+            "imagens": len(registros),
+            "do_cache": sum(1 for r in registros if r.get("cache")),
+            "etapas": etapas,
+            "modelos": modelos,
+        }
+
+    def salvar_json(self, caminho):
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump({"resumo": self.resumo(), "imagens": self._copiar_registros()}, f, ensure_ascii=False, indent=2)
+
+    def salvar_csv(self, caminho):
+        """Grava um registro por imagem em CSV."""
+        with open(caminho, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=CAMPOS_RELATORIO, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(self._copiar_registros())
+
+    def texto_prometheus(self):
+        """Exporta os totais no formato de texto do Prometheus."""
+        registros = self._copiar_registros()
+        linhas = [
+            "# HELP extracao_imagens_total Imagens com telemetria registrada.",
+            "# TYPE extracao_imagens_total counter",
+            f"extracao_imagens_total {len(registros)}",
+            "# HELP extracao_etapa_segundos Tempo gasto por etapa da extração.",
+            "# TYPE extracao_etapa_segundos summary",
+        ]
+        for etapa in ETAPAS:
+            valores = [r[f"{etapa}_ms"] for r in registros if r.get(f"{etapa}_ms") is not None]
+            linhas.append(f'extracao_etapa_segundos_sum{{etapa="{etapa}"}} {sum(valores) / 1000:.6f}')
+            linhas.append(f'extracao_etapa_segundos_count{{etapa="{etapa}"}} {len(valores)}')
+
+        por_modelo = {}
+        for modelo in sorted({r["modelo"] for r in registros if r.get("modelo") and r.get("total_duration_ms") is not None}):
+            do_modelo = [r for r in registros if r.get("modelo") == modelo and r.get("total_duration_ms") is not None]
+            por_modelo[modelo] = {
+                "ollama_requisicoes_total": len(do_modelo),
+                "ollama_recargas_total": sum(1 for r in do_modelo if (r.get("load_duration_ms") or 0) > LIMITE_RECARGA_MS),
+                "ollama_carga_segundos_total": _soma(do_modelo, "load_duration_ms") / 1000,
+                "ollama_prompt_tokens_total": _soma(do_modelo, "prompt_eval_count"),
+                "ollama_prompt_segundos_total": _soma(do_modelo, "prompt_eval_duration_ms") / 1000,
+                "ollama_tokens_gerados_total": _soma(do_modelo, "eval_count"),
+                "ollama_geracao_segundos_total": _soma(do_modelo, "eval_duration_ms") / 1000,
+            }
+        for nome, descricao in DESCRICOES_PROMETHEUS.items():
+            linhas.append(f"# HELP {nome} {descricao}")
+            linhas.append(f"# TYPE {nome} counter")
+            for modelo, valores in por_modelo.items():
+                linhas.append(f'{nome}{{modelo="{modelo}"}} {valores[nome]:g}')
+        return "\n".join(linhas) + "\n"
+
+    def iniciar_servidor_metricas(self, porta, host="0.0.0.0"):
+        """Serve texto_prometheus() em http://<host>:<porta>/metrics numa thread de fundo."""
+        telemetria = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                dados = telemetria.texto_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+
+        servidor = ThreadingHTTPServer((host, porta), _Handler)
+        servidor.daemon_threads = True
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        print(f"Métricas no formato Prometheus em http://{host}:{servidor.server_address[1]}/metrics")
+        return servidor
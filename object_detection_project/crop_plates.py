@@ -1,20 +1,40 @@
 import cv2
 import os
 import glob
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-def crop_plates_from_annotations(base_dataset_dir, output_cropped_dir):
-    """
-    Recorta as placas das imagens usando as anotações YOLO,
-    assumindo que imagens e labels (.txt) estão na mesma subpasta.
+import numpy as np
 
-    Args:
-        base_dataset_dir (str): Caminho para o diretório base que contém as pastas 'train', 'valid', 'test'.
-        output_cropped_dir (str): Caminho para o diretório onde as imagens recortadas serão salvas.
+def converter_caixas(linhas, img_width, img_height):
     """
-    os.makedirs(output_cropped_dir, exist_ok=True)
+    Converte de uma vez todas as anotações YOLO de uma imagem (classe, x_centro, y_centro,
+    largura, altura normalizados) em caixas de pixels (x1, y1, x2, y2) já limitadas à imagem.
 
-    subsets = ['train', 'valid', 'test']
+    Returns:
+        numpy.ndarray: matriz (N, 4) de inteiros, uma linha por anotação.
+    """
+    linhas = [linha.split() for linha in linhas if linha.strip()]
+    if not linhas:
+        return np.empty((0, 4), dtype=np.int64)
+    anotacoes = np.array(linhas, dtype=np.float64)
+    centros, tamanhos = anotacoes[:, 1:3], anotacoes[:, 3:5]
+    escala = np.array([img_width, img_height], dtype=np.float64)
+    # int() trunca em direção a zero; np.trunc mantém o mesmo arredondamento
+    caixas = np.trunc(np.hstack([(centros - tamanhos / 2) * escala,
+                                 (centros + tamanhos / 2) * escala])).astype(np.int64)
+    np.clip(caixas, 0, [img_width, img_height, img_width, img_height], out=caixas)
+    return caixas
+
+
+def listar_imagens_anotadas(base_dataset_dir, subsets=('train', 'valid', 'test')):
+    """
+    Lista as imagens do dataset que têm arquivo de anotação ao lado.
 
+    Yields:
+        tuple: (subset, caminho da imagem, caminho do .txt de anotação).
+    """
     for subset in subsets:
         current_subset_path = os.path.join(base_dataset_dir, subset)
 
@@ -37,39 +57,174 @@ def crop_plates_from_annotations(base_dataset_dir, output_cropped_dir):
                 print(f"Aviso: Arquivo de anotação '{label_file}' não encontrado para {img_file}. Pulando.")
                 continue
 
-            # Carregar imagem
-            img = cv2.imread(img_file)
-            if img is None:
-                print(f"Erro: Não foi possível carregar a imagem {img_file}. Pulando.")
-                continue
+            yield subset, img_file, label_file
+
+
+class ImagemIlegivelError(OSError):
+    """O OpenCV não conseguiu carregar a imagem (arquivo ausente, truncado ou em formato inválido)."""
+
+
+def recortar_imagem(subset, img_file, label_file):
+    """
+    Recorta todas as placas anotadas de uma imagem.
+
+    Yields:
+        tuple: (nome do arquivo de saída, recorte como array BGR do OpenCV).
+
+    Raises:
+        ImagemIlegivelError: se a imagem não puder ser carregada.
+    """
+    img_name_without_ext = os.path.splitext(os.path.basename(img_file))[0]
+
+    # Carregar imagem
+    img = cv2.imread(img_file)
+    if img is None:
+        raise ImagemIlegivelError(f"Não foi possível carregar a imagem {img_file}")
+
+    img_height, img_width = img.shape[:2]
+    with open(label_file, 'r') as f:
+        annotations = f.readlines()
+
+    for i, (x1, y1, x2, y2) in enumerate(converter_caixas(annotations, img_width, img_height)):
+        cropped_plate = img[y1:y2, x1:x2]
+
+        if cropped_plate.shape[0] > 0 and cropped_plate.shape[1] > 0:
+            yield f"{subset}_{img_name_without_ext}_cropped_{i}.jpg", cropped_plate
+        else:
+            print(f"Aviso: Recorte vazio para {img_file}, anotação {i+1}. Verifique as coordenadas.")
+
+
+def gerar_recortes(base_dataset_dir, subsets=('train', 'valid', 'test')):
+    """
+    Gera os recortes das placas a partir das anotações YOLO, sem gravá-los em disco.
+
+    Args:
+        base_dataset_dir (str): Caminho para o diretório base que contém as pastas 'train', 'valid', 'test'.
+        subsets (tuple): Subpastas a percorrer, nesta ordem.
+
+    Yields:
+        tuple: (nome do arquivo de saída, recorte como array BGR do OpenCV).
+    """
+    for subset, img_file, label_file in listar_imagens_anotadas(base_dataset_dir, subsets):
+        try:
+            yield from recortar_imagem(subset, img_file, label_file)
+        except ImagemIlegivelError as e:
+            print(f"Erro: {e}. Pulando.")
+
+
+PASTA_MARCAS = '.recortes_feitos'
+
+# '<subset>_<imagem>_cropped_<i>.jpg'; o grupo guloso pega sempre o último '_cropped_',
+# então 'train_a_cropped_1_cropped_0.jpg' pertence à imagem 'a_cropped_1', e não à 'a'
+_RE_RECORTE = re.compile(r'^(.*)_cropped_\d+\.jpg$')
+
+
+def _caminho_marca(subset, img_file, output_cropped_dir):
+    img_name_without_ext = os.path.splitext(os.path.basename(img_file))[0]
+    return os.path.join(output_cropped_dir, PASTA_MARCAS, f"{subset}_{img_name_without_ext}")
+
 
-            img_height, img_width = img.shape[:2]
-            with open(label_file, 'r') as f:
-                annotations = f.readlines()
+def _indexar_recortes(output_cropped_dir):
+    """Agrupa os recortes já gravados pelo prefixo '<subset>_<imagem>' de origem."""
+    recortes = {}
+    for nome in os.listdir(output_cropped_dir):
+        encontrado = _RE_RECORTE.match(nome)
+        if encontrado:
+            recortes.setdefault(encontrado.group(1), []).append(nome)
+    return recortes
 
-            for i, line in enumerate(annotations):
-                parts = list(map(float, line.strip().split(' ')))
-                x_center, y_center, width, height = parts[1:]
 
-                x1 = int((x_center - width / 2) * img_width)
-                y1 = int((y_center - height / 2) * img_height)
-                x2 = int((x_center + width / 2) * img_width)
-                y2 = int((y_center + height / 2) * img_height)
+def _recortes_atualizados(subset, img_file, label_file, output_cropped_dir):
+    """
+    Verifica se os recortes da imagem já foram gravados depois da última alteração da
+    imagem e do .txt. Usa uma marca por imagem (gravada após todos os recortes), pois
+    anotações que geram recorte vazio não têm arquivo de saída.
+    """
+    try:
+        mtime_marca = os.path.getmtime(_caminho_marca(subset, img_file, output_cropped_dir))
+    except OSError:
+        return False
+    return mtime_marca >= max(os.path.getmtime(img_file), os.path.getmtime(label_file))
+
 
-                x1 = max(0, x1)
-                y1 = max(0, y1)
-                x2 = min(img_width, x2)
-                y2 = min(img_height, y2)
+def _processar_imagem(tarefa):
+    """
+    Recorta e grava as placas de uma imagem e apaga os recortes anteriores dela que não
+    foram regravados (ex.: anotações removidas). Retorna (recortes gravados, imagem pulada).
+    Se a imagem não puder ser carregada, os recortes anteriores e a marca ficam como
+    estão, e ela é tentada de novo na próxima execução.
+    """
+    subset, img_file, label_file, output_cropped_dir, incremental, anteriores = tarefa
+    if incremental and _recortes_atualizados(subset, img_file, label_file, output_cropped_dir):
+        return 0, True
+
+    gravados = set()
+    try:
+        for output_name, cropped_plate in recortar_imagem(subset, img_file, label_file):
+            cv2.imwrite(os.path.join(output_cropped_dir, output_name), cropped_plate)
+            gravados.add(output_name)
+    except ImagemIlegivelError as e:
+        print(f"Erro: {e}. Pulando.")
+        return len(gravados), False
+    for nome in anteriores:
+        if nome not in gravados:
+            try:
+                os.remove(os.path.join(output_cropped_dir, nome))
+            except FileNotFoundError:
+                pass
+    open(_caminho_marca(subset, img_file, output_cropped_dir), 'w').close()
+    return len(gravados), False
+
+
+def crop_plates_from_annotations(base_dataset_dir, output_cropped_dir, workers=None, incremental=True):
+    """
+    Recorta as placas das imagens usando as anotações YOLO,
+    assumindo que imagens e labels (.txt) estão na mesma subpasta.
 
-                cropped_plate = img[y1:y2, x1:x2]
+    As imagens são distribuídas entre 'workers' processos (padrão: todos os núcleos;
+    1 processa tudo no processo atual). No modo incremental, imagens cujos recortes já
+    existem e são mais novos que a imagem e o .txt de origem são puladas. Ao recortar de
+    novo uma imagem, os recortes antigos dela que não forem regravados são apagados.
 
-                if cropped_plate.shape[0] > 0 and cropped_plate.shape[1] > 0:
+    Args:
+        base_dataset_dir (str): Caminho para o diretório base que contém as pastas 'train', 'valid', 'test'.
+        output_cropped_dir (str): Caminho para o diretório onde as imagens recortadas serão salvas.
+        workers (int): Número de processos. None usa os.cpu_count().
+        incremental (bool): Pula imagens cujos recortes já estão atualizados.
 
-                    output_filename = os.path.join(output_cropped_dir, f"{subset}_{img_name_without_ext}_cropped_{i}.jpg")
-                    cv2.imwrite(output_filename, cropped_plate)
-                    print(f"Salvo: {output_filename}")
-                else:
-                    print(f"Aviso: Recorte vazio para {img_file}, anotação {i+1}. Verifique as coordenadas.")
+    Returns:
+        dict: imagens, imagens puladas, recortes gravados, segundos e recortes por segundo.
+    """
+    os.makedirs(os.path.join(output_cropped_dir, PASTA_MARCAS), exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    inicio = time.perf_counter()
+    recortes_existentes = _indexar_recortes(output_cropped_dir)
+    tarefas = [(subset, img_file, label_file, output_cropped_dir, incremental,
+                recortes_existentes.get(f"{subset}_{os.path.splitext(os.path.basename(img_file))[0]}", []))
+               for subset, img_file, label_file in listar_imagens_anotadas(base_dataset_dir)]
+
+    if workers == 1:
+        resultados = [_processar_imagem(tarefa) for tarefa in tarefas]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(tarefas) // (workers * 8))
+            resultados = list(executor.map(_processar_imagem, tarefas, chunksize=chunksize))
+
+    segundos = time.perf_counter() - inicio
+    recortes = sum(gravados for gravados, _ in resultados)
+    puladas = sum(1 for _, pulada in resultados if pulada)
+    resumo = {
+        "imagens": len(tarefas),
+        "imagens_puladas": puladas,
+        "recortes": recortes,
+        "segundos": segundos,
+        "recortes_por_segundo": recortes / segundos if segundos > 0 else 0.0,
+    }
+    print(f"\n{recortes} recortes gravados de {len(tarefas) - puladas} imagens "
+          f"({puladas} já atualizadas) em {segundos:.1f}s com {workers} processo(s): "
+          f"{resumo['recortes_por_segundo']:.1f} recortes/s.")
+    return resumo
 
 
 DATASET_BASE_DIR = 'my_raw_annotated_dataset'
@@ -85,5 +240,7 @@ if __name__ == "__main__":
     print(f"Processando dataset de: {dataset_full_path}")
     print(f"Imagens recortadas serão salvas em: {output_cropped_full_path}")
 
-    crop_plates_from_annotations(dataset_full_path, output_cropped_full_path)
+    workers = int(os.getenv("WORKERS_RECORTE", 0)) or None
+    incremental = os.getenv("RECORTE_INCREMENTAL", "1") == "1"
+    crop_plates_from_annotations(dataset_full_path, output_cropped_full_path, workers, incremental)
     print("\nProcesso de recorte concluído!")
\ No newline at end of file
@@ -6,7 +6,8 @@ ollama serve &
 # Aguarda o servidor iniciar
 sleep 5
 
-# Baixa o modelo
+# Baixa os modelos: o pequeno (MODEL) e o grande (MODELO_GRANDE, usado no modo cascata)
+ollama pull gemma3:4b
 ollama pull gemma3:27b-it-qat
 
 # Aguarda o servidor Ollama (mantém o container rodando)
@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAIZ, "app"))
+sys.path.insert(0, os.path.join(RAIZ, "object_detection_project"))
+
+# extract_data.py lê a configuração do ambiente ao ser importado: sem GPU, sem cache e
+# com a saída num diretório temporário
+os.environ.setdefault("OUTPUT_DIR", tempfile.mkdtemp(prefix="testes_precos_"))
+os.environ.setdefault("USAR_CACHE", "0")
+os.environ.setdefault("PREPROCESSAR", "0")
+os.environ.setdefault("BACKOFF_BASE", "0.01")
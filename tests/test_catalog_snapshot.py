@@ -0,0 +1,85 @@
+import json
+import os
+
+import pytest
+
+import catalog_snapshot
+from catalog_snapshot import carregar_catalogo, carregar_snapshot, compilar_catalogo
+
+CATALOGO = """ean,brand,name
+7891000100103,Sadia,Peito de Frango Congelado 1kg
+7896005800010,Piracanjuba,Leite Integral 1L
+7891910000197,Pilão,Café Tradicional 500g
+"""
+
+
+@pytest.fixture
+def catalogo(tmp_path):
+    caminho = tmp_path / "catalogo.csv"
+    caminho.write_text(CATALOGO, encoding="utf-8")
+    diretorio = tmp_path / "snapshot"
+    compilar_catalogo(str(caminho), str(diretorio))
+    return str(caminho), diretorio
+
+
+def _arquivo_de_dados(diretorio):
+    return diretorio / ("catalogo.arrow" if catalog_snapshot.pa is not None else "catalogo.pkl")
+
+
+def test_snapshot_valido_e_carregado(catalogo):
+    caminho, diretorio = catalogo
+    df_produtos, indice = carregar_snapshot(caminho, str(diretorio))
+    assert len(df_produtos) == 3 and len(indice) == 3
+    assert indice.buscar_gtin("7891910000197") == 2
+
+
+@pytest.mark.parametrize("estrago", ["dados_ausentes", "dados_truncados", "indice_ausente", "indice_corrompido",
+                                     "meta_corrompido"])
+def test_snapshot_danificado_e_recompilado(catalogo, estrago):
+    caminho, diretorio = catalogo
+    if estrago == "dados_ausentes":
+        os.remove(_arquivo_de_dados(diretorio))
+    elif estrago == "dados_truncados":
+        dados = _arquivo_de_dados(diretorio).read_bytes()
+        _arquivo_de_dados(diretorio).write_bytes(dados[:len(dados) // 2])
+    elif estrago == "indice_ausente":
+        os.remove(diretorio / "indice.pkl")
+    elif estrago == "indice_corrompido":
+        (diretorio / "indice.pkl").write_bytes(b"nao e um pickle")
+    else:
+        (diretorio / "meta.json").write_text("{", encoding="utf-8")
+
+    assert carregar_snapshot(caminho, str(diretorio)) == (None, None)
+    df_produtos, indice = carregar_catalogo(caminho, diretorio=str(diretorio))
+    assert len(df_produtos) == 3 and indice.buscar_gtin("7896005800010") == 1
+    assert carregar_snapshot(caminho, str(diretorio))[0] is not None
+
+
+def test_snapshot_de_outro_codigo_e_invalidado(catalogo):
+    caminho, diretorio = catalogo
+    meta = json.loads((diretorio / "meta.json").read_text(encoding="utf-8"))
+    meta["codigo"] = "assinatura de uma versão anterior do ProductIndex"
+    (diretorio / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+    assert carregar_snapshot(caminho, str(diretorio)) == (None, None)
+
+
+def test_atualizacao_do_mtime_nao_deixa_meta_pela_metade(catalogo, monkeypatch):
+    caminho, diretorio = catalogo
+    original = (diretorio / "meta.json").read_text(encoding="utf-8")
+    os.utime(caminho, ns=(0, 1_000_000_000))
+
+    def dump_interrompido(meta, f, **opcoes):
+        f.write('{"versao": ')
+        raise OSError("disco cheio")
+
+    monkeypatch.setattr(catalog_snapshot.json, "dump", dump_interrompido)
+    with pytest.raises(OSError):
+        carregar_snapshot(caminho, str(diretorio))
+    assert (diretorio / "meta.json").read_text(encoding="utf-8") == original
+
+    monkeypatch.undo()
+    assert carregar_snapshot(caminho, str(diretorio))[0] is not None
+    meta = json.loads((diretorio / "meta.json").read_text(encoding="utf-8"))
+    assert meta["mtime_ns"] == 1_000_000_000
+    assert not (diretorio / "meta.json.tmp").exists()
@@ -0,0 +1,59 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+from crop_plates import PASTA_MARCAS, crop_plates_from_annotations
+
+TRES_PLACAS = "0 0.25 0.25 0.2 0.2\n0 0.75 0.25 0.2 0.2\n0 0.5 0.75 0.2 0.2\n"
+
+
+def _anotar(pasta, nome, anotacoes):
+    cv2.imwrite(str(pasta / f"{nome}.jpg"), np.full((100, 100, 3), 128, dtype=np.uint8))
+    (pasta / f"{nome}.txt").write_text(anotacoes)
+
+
+def test_recorte_refeito_apaga_recortes_antigos(tmp_path):
+    treino = tmp_path / "dataset" / "train"
+    treino.mkdir(parents=True)
+    saida = tmp_path / "recortes"
+    _anotar(treino, "a", TRES_PLACAS)
+    # Nome que começa como os recortes de 'a': os recortes dele não podem ser apagados
+    _anotar(treino, "a_cropped_1", TRES_PLACAS)
+
+    crop_plates_from_annotations(str(tmp_path / "dataset"), str(saida), workers=1)
+    assert len(list(saida.glob("*.jpg"))) == 6
+
+    (treino / "a.txt").write_text("0 0.5 0.5 0.2 0.2\n")
+    os.utime(treino / "a.txt", (time.time() + 5, time.time() + 5))
+    resumo = crop_plates_from_annotations(str(tmp_path / "dataset"), str(saida), workers=1)
+
+    assert resumo["imagens_puladas"] == 1 and resumo["recortes"] == 1
+    assert sorted(p.name for p in saida.glob("*.jpg")) == [
+        "train_a_cropped_0.jpg",
+        "train_a_cropped_1_cropped_0.jpg",
+        "train_a_cropped_1_cropped_1.jpg",
+        "train_a_cropped_1_cropped_2.jpg",
+    ]
+
+
+def test_imagem_ilegivel_mantem_recortes_e_nao_grava_marca(tmp_path):
+    treino = tmp_path / "dataset" / "train"
+    treino.mkdir(parents=True)
+    saida = tmp_path / "recortes"
+    _anotar(treino, "a", TRES_PLACAS)
+    crop_plates_from_annotations(str(tmp_path / "dataset"), str(saida), workers=1)
+    marca = saida / PASTA_MARCAS / "train_a"
+    mtime_marca = marca.stat().st_mtime_ns
+
+    # Imagem corrompida depois do primeiro recorte
+    (treino / "a.jpg").write_bytes(b"nao e um jpeg")
+    os.utime(treino / "a.jpg", (time.time() + 5, time.time() + 5))
+    resumo = crop_plates_from_annotations(str(tmp_path / "dataset"), str(saida), workers=1)
+
+    assert resumo["recortes"] == 0 and resumo["imagens_puladas"] == 0
+    assert len(list(saida.glob("*.jpg"))) == 3
+    assert marca.stat().st_mtime_ns == mtime_marca
+    # Sem marca nova, a imagem é tentada de novo na próxima execução
+    assert crop_plates_from_annotations(str(tmp_path / "dataset"), str(saida), workers=1)["imagens_puladas"] == 0
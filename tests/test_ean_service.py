@@ -0,0 +1,101 @@
+import http.client
+import json
+
+import pytest
+
+from ean_service import ServicoEAN, iniciar_servidor
+from infer_ean import inferir_ean
+
+CATALOGO = """ean,brand,name
+7891000100103,Sadia,Peito de Frango Congelado 1kg
+7896005800010,Piracanjuba,Leite Integral 1L
+7891910000197,Pilão,Café Tradicional 500g
+7896036090244,Camil,Arroz Branco Tipo 1 5kg
+"""
+
+
+@pytest.fixture
+def servico(tmp_path, monkeypatch):
+    monkeypatch.setenv("CATALOGO_SNAPSHOT_DIR", str(tmp_path / "snapshot"))
+    caminho = tmp_path / "catalogo.csv"
+    caminho.write_text(CATALOGO, encoding="utf-8")
+    servico = ServicoEAN(str(caminho), janela_ms=20, intervalo_recarga=0)
+    servidor = iniciar_servidor(servico, porta=0, host="127.0.0.1")
+    servico.porta = servidor.server_address[1]
+    yield servico
+    servidor.shutdown()
+    servico.parar()
+
+
+def _post(servico, caminho, corpo, cabecalhos=None):
+    conexao = http.client.HTTPConnection("127.0.0.1", servico.porta, timeout=10)
+    conexao.request("POST", caminho, body=corpo, headers=cabecalhos or {})
+    resposta = conexao.getresponse()
+    dados = json.loads(resposta.read())
+    conexao.close()
+    return resposta.status, dados
+
+
+def test_content_length_invalido_responde_400(servico):
+    conexao = http.client.HTTPConnection("127.0.0.1", servico.porta, timeout=10)
+    conexao.putrequest("POST", "/inferir")
+    conexao.putheader("Content-Length", "abc")
+    conexao.endheaders()
+    resposta = conexao.getresponse()
+    assert resposta.status == 400
+    assert "Content-Length" in json.loads(resposta.read())["erro"]
+    conexao.close()
+
+    # O servidor continua respondendo normalmente
+    status, dados = _post(servico, "/inferir", json.dumps({"marca": "Sadia", "produto": "peito de frango"}))
+    assert status == 200 and dados["ean"] == "7891000100103"
+
+
+def test_lote_igual_a_inferir_ean_e_pontua_textos_repetidos_uma_vez(servico):
+    consultas = [
+        {"marca": "Piracanjuba", "produto": "Leite Integral"},
+        {"marca": "Pilão", "produto": "Café 500g"},
+        {"produto": "Leite Integral", "marca": "Piracanjuba"},
+        {"códigos_de_barras": "7896036090244"},
+        {"produto": "produto inexistente xyz"},
+    ]
+    catalogo = servico.catalogo
+    esperados = []
+    for consulta in consultas:
+        dados = {campo: consulta.get(campo, "") for campo in ("marca", "produto", "códigos_de_barras")}
+        ean, status = inferir_ean(dados, catalogo.df_produtos, 75, catalogo.indice, verboso=False)
+        esperados.append({"ean": None if ean is None else str(ean), "status": status})
+
+    status, dados = _post(servico, "/inferir/lote", json.dumps({"consultas": consultas}))
+
+    assert status == 200 and dados["resultados"] == esperados
+    estatisticas = servico.saude()["estatisticas"]
+    # Quatro consultas vão para o micro-lote, mas só três textos distintos são pontuados
+    assert (estatisticas["em_lote"], estatisticas["textos_pontuados"]) == (4, 3)
+
+    # Repetida, a requisição é respondida pelo cache, sem passar pelo micro-lote
+    assert _post(servico, "/inferir/lote", json.dumps({"consultas": consultas}))[1]["resultados"] == esperados
+    assert servico.saude()["estatisticas"]["textos_pontuados"] == 3
+
+
+def test_lote_distribuido_entre_processos_igual_ao_sequencial(tmp_path, monkeypatch):
+    monkeypatch.setenv("CATALOGO_SNAPSHOT_DIR", str(tmp_path / "snapshot"))
+    caminho = tmp_path / "catalogo.csv"
+    caminho.write_text(CATALOGO, encoding="utf-8")
+    consultas = [
+        {"marca": "Sadia", "produto": "Peito de Frango"},
+        {"marca": "Camil", "produto": "Arroz Branco 5kg"},
+        {"produto": "cafe tradicional"},
+        {"produto": "produto inexistente xyz"},
+    ]
+
+    resultados = {}
+    for processos in (1, 2):
+        servico = ServicoEAN(str(caminho), janela_ms=20, intervalo_recarga=0, processos=processos)
+        try:
+            resultados[processos] = servico.inferir(consultas)
+        finally:
+            servico.parar()
+
+    assert resultados[2] == resultados[1]
+    assert [r["ean"] for r in resultados[2]] == ["7891000100103", "7896036090244", "7891910000197", None]
@@ -0,0 +1,224 @@
+import json
+import os
+
+import pytest
+
+import extract_data
+import mock_ollama
+from infer_ean import ler_blocos_resultados
+from ollama_client import OllamaClient, OllamaError, RespostaInvalidaError
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def servidor():
+    servidores = []
+
+    def iniciar(**opcoes):
+        s = mock_ollama.iniciar_servidor(**{"latencia": 0.02, **opcoes})
+        servidores.append(s)
+        return s
+
+    yield iniciar
+    for s in servidores:
+        s.shutdown()
+
+
+@pytest.fixture
+def texto_livre(monkeypatch, tmp_path):
+    """Extração em texto livre (blocos 'Imagem: ...') gravada num diretório temporário."""
+    monkeypatch.setattr(extract_data, "SAIDA_ESTRUTURADA", False)
+    monkeypatch.setattr(extract_data, "OPCOES_GERACAO", {})
+    monkeypatch.setattr(extract_data, "OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(extract_data, "ARQUIVO_RESULTADOS", str(tmp_path / "resultado_gemma3:27b-it-qat.txt"))
+    return tmp_path
+
+
+class ControleRapido(extract_data.ControleAdaptativo):
+    """Janela AIMD real, mas sem os segundos de atraso entre envios após falhas."""
+
+    def __init__(self, max_em_voo):
+        super().__init__(max_em_voo, atraso_max=0.01)
+
+
+def _usar_servidor(monkeypatch, servidor, max_tentativas=1, max_em_voo=8):
+    cliente = OllamaClient(f"http://127.0.0.1:{servidor.server_address[1]}/api/generate", extract_data.MODEL,
+                           tamanho_pool=max_em_voo, max_tentativas=max_tentativas, backoff_base=0.01,
+                           limite_falhas_circuito=10_000)
+    monkeypatch.setattr(extract_data, "cliente_ollama", cliente)
+    monkeypatch.setattr(extract_data, "ControleAdaptativo", ControleRapido)
+
+
+def _imagens(quantidade):
+    return [(f"img_{i:03d}.jpg", f"conteudo {i}".encode()) for i in range(quantidade)]
+
+
+def _escrever_imagens(diretorio, imagens):
+    pasta = diretorio / "imagens"
+    pasta.mkdir()
+    caminhos = []
+    for nome, conteudo in imagens:
+        (pasta / nome).write_bytes(conteudo)
+        caminhos.append(str(pasta / nome))
+    return caminhos
+
+
+def test_um_bloco_inteiro_por_imagem_na_ordem(monkeypatch, servidor, texto_livre):
+    mock = servidor(latencia=0.03, jitter=0.03, atraso_token=0.001)
+    _usar_servidor(monkeypatch, mock)
+    imagens = _imagens(40)
+
+    extract_data.processar_imagens_concorrente(_escrever_imagens(texto_livre, imagens), max_em_voo=8)
+
+    blocos = list(ler_blocos_resultados(extract_data.ARQUIVO_RESULTADOS))
+    assert [nome for nome, _ in blocos] == [nome for nome, _ in imagens]
+    assert all(texto == mock_ollama.RESPOSTA_PADRAO for _, texto in blocos)
+    assert mock.pico_em_voo > 1
+
+
+def test_ordem_e_falhas(monkeypatch, servidor, texto_livre):
+    # Imagens de número múltiplo de 5 sempre falham; as demais respondem com latências variadas
+    imagens = [(f"img_{i:03d}.jpg" if i % 5 else f"falha_{i:03d}.jpg", f"conteudo {i}".encode()) for i in range(30)]
+    mock = servidor(latencia=0.03, jitter=0.03)
+    _usar_servidor(monkeypatch, mock, max_tentativas=2)
+    # O mock vê a imagem em base64: marca as que devem falhar pelo conteúdo
+    falhar = {extract_data.base64.b64encode(conteudo).decode() for nome, conteudo in imagens if nome.startswith("falha_")}
+    mock.erro_forcado = lambda payload, numero: 500 if payload.get("images", [""])[0] in falhar else None
+
+    saida = list(extract_data.extrair_em_fluxo(imagens, max_em_voo=6, tamanho_lote=1))
+    assert [nome for nome, _, _, _ in saida] == [nome for nome, _ in imagens]
+    for nome, resposta, erro, modelo in saida:
+        if nome.startswith("falha_"):
+            assert resposta is None and isinstance(erro, OllamaError) and modelo is None
+        else:
+            assert resposta == mock_ollama.RESPOSTA_PADRAO and erro is None and modelo == extract_data.MODEL
+
+    extract_data.processar_imagens_concorrente(_escrever_imagens(texto_livre, imagens), max_em_voo=6)
+    gravadas = [nome for nome, _ in ler_blocos_resultados(extract_data.ARQUIVO_RESULTADOS)]
+    assert gravadas == [nome for nome, _ in imagens if not nome.startswith("falha_")]
+    with open(os.path.join(texto_livre, "falhas.txt"), encoding="utf-8") as f:
+        assert sorted(linha.split("\t")[0] for linha in f) == sorted(n for n, _ in imagens if n.startswith("falha_"))
+
+
+def test_janela_aimd_reduz_com_erros_e_volta_a_crescer(monkeypatch, servidor):
+    limites = []
+
+    class ControleRegistrado(ControleRapido):
+        def registrar(self, latencia, ok):
+            super().registrar(latencia, ok)
+            limites.append((ok, self.limite))
+
+    # Requisições 11 a 16 recebem 429 ou 503; antes e depois o servidor está saudável
+    mock = servidor(erro_forcado=lambda payload, n: (429 if n % 2 else 503) if 11 <= n <= 16 else None)
+    _usar_servidor(monkeypatch, mock, max_tentativas=1)
+    monkeypatch.setattr(extract_data, "ControleAdaptativo", ControleRegistrado)
+
+    saida = list(extract_data.extrair_em_fluxo(_imagens(60), max_em_voo=8, tamanho_lote=1))
+
+    assert sum(resposta is None for _, resposta, _, _ in saida) == 6
+    primeira_falha = next(i for i, (ok, _) in enumerate(limites) if not ok)
+    ultima_falha = max(i for i, (ok, _) in enumerate(limites) if not ok)
+    assert limites[primeira_falha][1] == 4.0  # metade da janela cheia
+    assert min(limite for _, limite in limites) <= 2.0
+    assert limites[ultima_falha][1] < 8.0
+    assert limites[-1][1] == 8.0  # respostas normais devolvem a janela ao máximo
+
+
+@pytest.mark.parametrize("tamanho_lote", [1, 3])
+def test_cascata_grava_o_modelo_que_respondeu(monkeypatch, servidor, tmp_path, tamanho_lote):
+    monkeypatch.setattr(extract_data, "SAIDA_ESTRUTURADA", True)
+    monkeypatch.setattr(extract_data, "OPCOES_GERACAO", {"format": extract_data.SCHEMA_EXTRACAO})
+    monkeypatch.setattr(extract_data, "ARQUIVO_RESULTADOS", str(tmp_path / "resultados.jsonl"))
+    monkeypatch.setattr(extract_data, "store_resultados", None)
+    monkeypatch.setattr(extract_data, "MODELO_GRANDE", "gemma3:27b-it-qat")
+    _usar_servidor(monkeypatch, servidor())
+    imagens = [(f"escalar_{i}.jpg" if i % 2 else f"img_{i}.jpg", f"conteudo {i}".encode()) for i in range(6)]
+
+    def avaliar(nome_imagem, resposta):
+        return "ean" if nome_imagem.startswith("escalar_") else None
+
+    for nome, resposta, erro, modelo in extract_data.extrair_em_fluxo(imagens, max_em_voo=4, avaliar=avaliar,
+                                                                      tamanho_lote=tamanho_lote):
+        extract_data.salvar_resultado(nome, resposta, modelo)
+
+    registros = {r["imagem"]: r["modelo"] for r in extract_data.store_resultados}
+    assert registros == {nome: "gemma3:27b-it-qat" if nome.startswith("escalar_") else extract_data.MODEL
+                         for nome, _ in imagens}
+
+
+def test_cache_consultado_uma_vez_por_imagem_no_lote(monkeypatch, servidor, tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(extract_data, "cache_respostas", cache)
+    _usar_servidor(monkeypatch, servidor())
+    imagens = _imagens(7)
+
+    def extrair(imagens):
+        return [resposta for _, resposta, _, _ in extract_data.extrair_em_fluxo(imagens, max_em_voo=2, tamanho_lote=3)]
+
+    assert None not in extrair(imagens)
+    assert (cache.acertos, cache.falhas) == (0, 7)
+
+    # Lote com uma única imagem fora do cache: ela é extraída sozinha sem nova consulta
+    assert None not in extrair(imagens[:2] + _imagens(9)[8:])
+    assert (cache.acertos, cache.falhas) == (2, 8)
+
+    assert None not in extrair(imagens)
+    assert (cache.acertos, cache.falhas) == (9, 8)
+
+
+def _resultado_lote(indice, produto):
+    return {"indice": indice, "marca": "Marca", "produto": produto, "preço": "1,00",
+            "unidade": "un", "códigos_de_barras": ""}
+
+
+@pytest.mark.parametrize("indices", [[1, 1, 3], [1, 2, 4], ["1", "2", "3"], [True, 2, 3], [1, None, 3]])
+def test_lote_com_indices_que_nao_sao_permutacao_e_rejeitado(indices):
+    resposta = json.dumps({"resultados": [_resultado_lote(i, f"p{k}") for k, i in enumerate(indices)]})
+
+    with pytest.raises(RespostaInvalidaError):
+        extract_data._respostas_do_lote(resposta, 3)
+
+
+def test_lote_reordenado_pelo_indice():
+    resposta = json.dumps({"resultados": [_resultado_lote(2, "b"), _resultado_lote(1, "a")]})
+
+    assert [r["produto"] for r in extract_data._respostas_do_lote(resposta, 2)] == ["a", "b"]
+
+
+@pytest.mark.parametrize("resultado", [{}, {"indice": 1}])
+def test_item_do_lote_sem_campos_e_rejeitado(resultado):
+    with pytest.raises(RespostaInvalidaError):
+        extract_data._resposta_do_item(resultado)
+
+
+class _ClienteLote:
+    """Responde o prompt de lote com 'resposta_lote' e cada imagem sozinha com um JSON próprio."""
+
+    def __init__(self, resposta_lote):
+        self.resposta_lote = resposta_lote
+        self.individuais = []
+
+    def gerar_com_metricas(self, prompt, imagens=None, modelo=None, **opcoes):
+        if len(imagens) > 1:
+            return self.resposta_lote, {}
+        self.individuais.append(imagens[0])
+        return json.dumps(_resultado_lote(0, "individual")), {}
+
+
+@pytest.mark.parametrize("resultados, individuais", [
+    # Índice repetido: o lote todo volta para a extração individual
+    ([_resultado_lote(1, "a"), _resultado_lote(1, "b"), _resultado_lote(3, "c")], 3),
+    # Itens sem os campos: só eles são extraídos sozinhos
+    ([_resultado_lote(1, "a"), {"indice": 2}, {"indice": 3, "marca": "Marca"}], 2),
+])
+def test_lote_invalido_cai_na_extracao_individual(monkeypatch, resultados, individuais):
+    cliente = _ClienteLote(json.dumps({"resultados": resultados}))
+    monkeypatch.setattr(extract_data, "cliente_ollama", cliente)
+    monkeypatch.setattr(extract_data, "MODELO_GRANDE", None)
+
+    saida = extract_data.extrair_lote_com_cascata(_imagens(3))
+
+    assert len(cliente.individuais) == individuais
+    produtos = [json.loads(resposta)["produto"] for _, resposta, erro, _ in saida]
+    assert [erro for _, _, erro, _ in saida] == [None] * 3
+    assert produtos == (["individual"] * 3 if individuais == 3 else ["a", "individual", "individual"])
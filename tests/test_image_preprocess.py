@@ -0,0 +1,35 @@
+import io
+
+from PIL import Image
+
+from image_preprocess import PreProcessadorImagem
+
+
+def _jpeg(lado):
+    saida = io.BytesIO()
+    Image.new("RGB", (lado, lado), (200, 30, 30)).save(saida, format="JPEG", quality=100)
+    return saida.getvalue()
+
+
+def test_reduz_e_usa_cache(tmp_path):
+    preprocessador = PreProcessadorImagem(str(tmp_path), lado_max=64, qualidade=50)
+    original = _jpeg(512)
+
+    primeira = preprocessador.processar(original, "a.jpg")
+    segunda = preprocessador.processar(original, "a.jpg")
+
+    assert primeira == segunda and len(primeira) < len(original)
+    with Image.open(io.BytesIO(primeira)) as imagem:
+        assert max(imagem.size) == 64
+    assert [r["do_cache"] for r in preprocessador.registros] == [False, True]
+
+
+def test_imagem_corrompida_segue_original(tmp_path):
+    preprocessador = PreProcessadorImagem(str(tmp_path), lado_max=64)
+    corrompida = b"isto nao e uma imagem"
+    truncada = _jpeg(512)[:200]
+
+    assert preprocessador.processar(corrompida, "ruim.jpg") == corrompida
+    assert preprocessador.processar(truncada, "truncada.jpg") == truncada
+    assert preprocessador.processar(_jpeg(512), "boa.jpg") != _jpeg(512)
+    assert len(list(tmp_path.glob("*.jpg"))) == 1
@@ -0,0 +1,30 @@
+import benchmark
+from infer_ean import carregar_base_dados_produtos, processar_resultados_e_inferir_eans
+from result_store import ResultStore
+
+
+def test_modo_lote_com_processos_gera_o_mesmo_csv_que_o_sequencial(tmp_path):
+    catalogo = str(tmp_path / "catalogo.csv")
+    benchmark.gerar_catalogo_sintetico(catalogo, 300, semente=3)
+    consultas = benchmark._consultas_sinteticas(carregar_base_dados_produtos(catalogo), 60, None, 7)
+    # Textos repetidos, sem correspondência confiável e sem marca/produto também passam pelo lote
+    consultas += consultas[:5] + [
+        {"marca": "", "produto": "biscoito", "códigos_de_barras": ""},
+        {"marca": "Desconhecida", "produto": "produto que não existe", "códigos_de_barras": "123"},
+        {"marca": "", "produto": "", "códigos_de_barras": ""},
+    ]
+    resultados = str(tmp_path / "resultados.jsonl")
+    store = ResultStore(resultados)
+    for i, dados in enumerate(consultas):
+        store.adicionar(f"imagem_{i}.jpg", dados)
+
+    saidas = {}
+    for nome, opcoes in {"sequencial": {}, "lote": {"modo_lote": True, "workers": 2}}.items():
+        saidas[nome] = tmp_path / "inferencias" / f"{nome}.csv"
+        processar_resultados_e_inferir_eans(resultados, catalogo, str(saidas[nome]), 75,
+                                            usar_snapshot=False, **opcoes)
+
+    sequencial = saidas["sequencial"].read_bytes()
+    assert sequencial.count(b"\n") == len(consultas) + 1
+    assert "Baixa Confiança".encode() in sequencial and b"Direta por EAN" in sequencial
+    assert saidas["lote"].read_bytes() == sequencial
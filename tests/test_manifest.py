@@ -0,0 +1,118 @@
+import os
+
+from manifest import Manifest
+from result_store import ResultStore
+
+
+def _imagem(diretorio, nome, conteudo=b"imagem"):
+    caminho = os.path.join(diretorio, nome)
+    with open(caminho, "wb") as f:
+        f.write(conteudo)
+    return caminho
+
+
+def test_reconciliar_so_usa_entradas_do_proprio_arquivo(tmp_path):
+    manifesto = Manifest(str(tmp_path / "manifesto.jsonl"))
+    jsonl = str(tmp_path / "resultados.jsonl")
+    txt = str(tmp_path / "resultados.txt")
+    with open(txt, "w") as f:
+        f.write("Imagem: a.jpg\n" + "x" * 500 + "\n")
+    manifesto.registrar(_imagem(tmp_path, "a.jpg"), "ok", os.path.getsize(txt), arquivo_resultados=txt)
+
+    store = ResultStore(jsonl)
+    store.adicionar("b.jpg", {"produto": "Café"})
+    manifesto.registrar(_imagem(tmp_path, "b.jpg"), "ok", os.path.getsize(jsonl), arquivo_resultados=jsonl)
+
+    tamanho_txt = os.path.getsize(txt)
+    manifesto.reconciliar_resultados(txt)
+    assert os.path.getsize(txt) == tamanho_txt
+    manifesto.reconciliar_resultados(jsonl)
+    assert ResultStore(jsonl).obter("b.jpg")["dados"] == {"produto": "Café"}
+
+
+def test_respostas_do_pipeline_nao_sao_descartadas(tmp_path):
+    manifesto = Manifest(str(tmp_path / "manifesto.jsonl"))
+    jsonl = str(tmp_path / "resultados.jsonl")
+    store = ResultStore(jsonl)
+    store.adicionar("a.jpg", {"produto": "A"})
+    manifesto.registrar(_imagem(tmp_path, "a.jpg"), "ok", os.path.getsize(jsonl), arquivo_resultados=jsonl)
+    store.adicionar("recorte_0.jpg", {"produto": "B"})
+    manifesto.registrar_resposta("recorte_0.jpg", jsonl, os.path.getsize(jsonl))
+    manifesto.fechar()
+
+    reaberto = Manifest(str(tmp_path / "manifesto.jsonl"))
+    reaberto.reconciliar_resultados(jsonl)
+    assert ResultStore(jsonl).obter("recorte_0.jpg")["dados"] == {"produto": "B"}
+    assert not reaberto.concluida(_imagem(tmp_path, "recorte_0.jpg"))
+
+
+def test_truncar_ajusta_indice(tmp_path):
+    manifesto = Manifest(str(tmp_path / "manifesto.jsonl"))
+    jsonl = str(tmp_path / "resultados.jsonl")
+    store = ResultStore(jsonl)
+    store.adicionar("a.jpg", {"produto": "A"})
+    manifesto.registrar(_imagem(tmp_path, "a.jpg"), "ok", os.path.getsize(jsonl), arquivo_resultados=jsonl)
+    # Gravado mas não confirmado no manifesto (processo interrompido)
+    store.adicionar("perdida.jpg", {"produto": "não confirmado"})
+
+    manifesto.reconciliar_resultados(jsonl)
+    store = ResultStore(jsonl)
+    assert "perdida.jpg" not in store
+    # Um novo registro ocupa os offsets do trecho descartado
+    store.adicionar("c.jpg", {"produto": "C com um nome bem mais longo"})
+    store = ResultStore(jsonl)
+    assert "perdida.jpg" not in store
+    assert store.obter("c.jpg")["dados"]["produto"] == "C com um nome bem mais longo"
+    assert [r["imagem"] for r in store] == ["a.jpg", "c.jpg"]
+
+
+def test_imagens_concluidas_sao_puladas_e_falhas_voltam_para_a_fila(tmp_path):
+    manifesto = Manifest(str(tmp_path / "manifesto.jsonl"))
+    jsonl = str(tmp_path / "resultados.jsonl")
+    store = ResultStore(jsonl)
+    ok, falha, nova = (_imagem(tmp_path, nome) for nome in ("ok.jpg", "falha.jpg", "nova.jpg"))
+    store.adicionar("ok.jpg", {"produto": "A"})
+    manifesto.registrar(ok, "ok", os.path.getsize(jsonl), arquivo_resultados=jsonl)
+    manifesto.registrar(falha, "erro", erro="timeout")
+    manifesto.fechar()
+
+    reaberto = Manifest(str(tmp_path / "manifesto.jsonl"))
+    assert reaberto.pendentes([ok, falha, nova]) == [falha, nova]
+    # Conteúdo alterado: a imagem volta a ser processada
+    _imagem(tmp_path, "ok.jpg", b"outra imagem")
+    assert reaberto.pendentes([ok]) == [ok]
+
+
+def test_resposta_do_pipeline_nao_substitui_imagem_concluida(tmp_path):
+    manifesto = Manifest(str(tmp_path / "manifesto.jsonl"))
+    jsonl = str(tmp_path / "resultados.jsonl")
+    store = ResultStore(jsonl)
+    imagem = _imagem(tmp_path, "a.jpg")
+    store.adicionar("a.jpg", {"produto": "A"})
+    manifesto.registrar(imagem, "ok", os.path.getsize(jsonl), arquivo_resultados=jsonl)
+    store.adicionar("a.jpg", {"produto": "A pelo pipeline"})
+    manifesto.registrar_resposta("a.jpg", jsonl, os.path.getsize(jsonl))
+    assert manifesto.pendentes([imagem]) == []
+    manifesto.fechar()
+
+    reaberto = Manifest(str(tmp_path / "manifesto.jsonl"))
+    assert reaberto.pendentes([imagem]) == []
+    assert reaberto.fins[os.path.abspath(jsonl)] == os.path.getsize(jsonl)
+
+
+def test_ultima_linha_incompleta_do_manifesto_e_descartada(tmp_path):
+    caminho = str(tmp_path / "manifesto.jsonl")
+    manifesto = Manifest(caminho)
+    a, b = _imagem(tmp_path, "a.jpg"), _imagem(tmp_path, "b.jpg")
+    manifesto.registrar(a, "ok")
+    manifesto.fechar()
+    tamanho = os.path.getsize(caminho)
+    with open(caminho, "ab") as f:
+        f.write(b'{"imagem": "b.jpg", "status": "o')
+
+    reaberto = Manifest(caminho)
+    assert os.path.getsize(caminho) == tamanho
+    assert reaberto.pendentes([a, b]) == [b]
+    reaberto.registrar(b, "ok")
+    reaberto.fechar()
+    assert Manifest(caminho).pendentes([a, b]) == []
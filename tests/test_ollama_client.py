@@ -0,0 +1,64 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ollama_client import OllamaClient, OllamaError
+
+
+class _Streaming(BaseHTTPRequestHandler):
+    """Responde ao /api/generate com as linhas NDJSON da próxima resposta da fila do servidor."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        linhas = self.server.respostas.pop(0)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for linha in linhas:
+            self.wfile.write(json.dumps(linha).encode("utf-8") + b"\n")
+        self.close_connection = True
+
+
+@pytest.fixture
+def servidor():
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _Streaming)
+    servidor.respostas = []
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield servidor
+    servidor.shutdown()
+
+
+def _cliente(servidor, max_tentativas):
+    url = f"http://127.0.0.1:{servidor.server_address[1]}/api/generate"
+    return OllamaClient(url, "gemma3:4b", max_tentativas=max_tentativas, backoff_base=0.01)
+
+
+COMPLETA = [{"response": "ok", "done": False}, {"response": "", "done": True, "eval_count": 1}]
+
+
+def test_chunk_com_erro_levanta_ollama_error(servidor):
+    servidor.respostas = [[{"response": "meia ", "done": False}, {"error": "model runner has unexpectedly stopped"}]]
+
+    with pytest.raises(OllamaError, match="unexpectedly stopped"):
+        _cliente(servidor, 1).gerar("extraia")
+
+
+def test_streaming_sem_done_levanta_ollama_error(servidor):
+    servidor.respostas = [[{"response": "resposta truncada", "done": False}]]
+
+    with pytest.raises(OllamaError, match="done"):
+        _cliente(servidor, 1).gerar("extraia")
+
+
+def test_resposta_incompleta_e_repetida(servidor):
+    servidor.respostas = [[{"error": "erro no meio"}], [{"response": "truncada", "done": False}], COMPLETA]
+
+    resposta, metricas = _cliente(servidor, 3).gerar_com_metricas("extraia")
+
+    assert resposta == "ok"
+    assert metricas["tentativas"] == 3 and metricas["eval_count"] == 1
@@ -0,0 +1,167 @@
+import threading
+import time
+
+import pytest
+
+import mock_ollama
+from ollama_client import OllamaError
+from ollama_pool import OllamaPool, carregar_endpoints
+
+
+@pytest.fixture
+def servidor():
+    servidores = []
+
+    def iniciar(**opcoes):
+        s = mock_ollama.iniciar_servidor(**{"latencia": 0.02, **opcoes})
+        servidores.append(s)
+        return s
+
+    yield iniciar
+    for s in servidores:
+        if not s.fora_do_ar:
+            s.shutdown()
+
+
+def _url(servidor):
+    return f"http://127.0.0.1:{servidor.server_address[1]}"
+
+
+def _pool(endpoints, **opcoes):
+    opcoes = {"intervalo_saude": 0, "backoff_base": 0.01, "timeout_leitura": 10, **opcoes}
+    return OllamaPool(endpoints, "gemma3:4b", tamanho_pool=16, **opcoes)
+
+
+def _em_paralelo(pool, quantidade):
+    resultados = [None] * quantidade
+
+    def chamar(i):
+        try:
+            resultados[i] = pool.gerar_com_metricas("extraia", [f"imagem {i}"])
+        except OllamaError as e:
+            resultados[i] = e
+
+    threads = [threading.Thread(target=chamar, args=(i,)) for i in range(quantidade)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return resultados
+
+
+def test_carregar_endpoints():
+    assert carregar_endpoints("http://a:11434, http://b:11434/api/generate") == [
+        {"url": "http://a:11434", "peso": 1.0, "modelos": []},
+        {"url": "http://b:11434/api/generate", "peso": 1.0, "modelos": []},
+    ]
+    assert carregar_endpoints('[{"url": "http://a", "peso": 2, "modelos": ["gemma3:4b"]}]') == [
+        {"url": "http://a", "peso": 2.0, "modelos": ["gemma3:4b"]},
+    ]
+    with pytest.raises(ValueError):
+        carregar_endpoints('[{"url": "http://a", "peso": 0}]')
+
+
+def test_despacho_menos_em_voo_por_peso(servidor):
+    leve, pesado = servidor(latencia=0.4), servidor(latencia=0.4)
+    pool = _pool([{"url": _url(leve), "peso": 1}, {"url": _url(pesado), "peso": 3}])
+
+    resultados = _em_paralelo(pool, 8)
+
+    assert all(not isinstance(r, Exception) for r in resultados)
+    # Com 8 requisições simultâneas, (em_voo + 1) / peso equilibra em 2 contra 6
+    assert (leve.pico_em_voo, pesado.pico_em_voo) == (2, 6)
+    assert (leve.requisicoes, pesado.requisicoes) == (2, 6)
+
+
+def test_endpoint_mais_rapido_recebe_mais_requisicoes(servidor):
+    rapido, lento = servidor(latencia=0.02), servidor(latencia=0.3)
+    pool = _pool([{"url": _url(rapido)}, {"url": _url(lento)}])
+
+    def trabalhar():
+        for _ in range(10):
+            pool.gerar("extraia", ["imagem"])
+
+    threads = [threading.Thread(target=trabalhar) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert rapido.requisicoes + lento.requisicoes == 40
+    assert rapido.requisicoes > 2 * lento.requisicoes
+    assert lento.pico_em_voo <= 2
+
+
+def test_imagens_em_voo_num_endpoint_derrubado_sao_reenviadas(servidor):
+    vitima = servidor(latencia=1.0)
+    outros = [servidor(latencia=0.05), servidor(latencia=0.05)]
+    pool = _pool([{"url": _url(vitima), "peso": 4}] + [{"url": _url(s)} for s in outros])
+    threading.Timer(0.3, mock_ollama.derrubar_servidor, args=(vitima,)).start()
+
+    inicio = time.monotonic()
+    resultados = _em_paralelo(pool, 12)
+
+    assert all(not isinstance(r, Exception) for r in resultados), resultados
+    assert all(metricas["endpoint"] != _url(vitima) for _, metricas in resultados)
+    assert time.monotonic() - inicio < 5
+    resumo = pool.resumo()
+    assert resumo[_url(vitima)]["reenfileiradas"] == vitima.requisicoes > 0
+    assert resumo[_url(vitima)]["quedas"] == 1
+    assert not resumo[_url(vitima)]["saudavel"]
+    assert sum(resumo[_url(s)]["imagens"] for s in outros) == 12
+
+
+def test_endpoint_volta_ao_pool_quando_api_tags_responde(servidor):
+    primeiro, segundo = servidor(), servidor()
+    porta = primeiro.server_address[1]
+    pool = _pool([{"url": _url(primeiro)}, {"url": _url(segundo)}], intervalo_saude=0.2)
+
+    mock_ollama.derrubar_servidor(primeiro)
+    time.sleep(0.6)
+    assert not pool.resumo()[_url(primeiro)]["saudavel"]
+    for _ in range(4):
+        pool.gerar("extraia", ["imagem"])
+    assert segundo.requisicoes == 4
+
+    de_volta = servidor(porta=porta)
+    time.sleep(0.6)
+    assert pool.resumo()[_url(de_volta)]["saudavel"]
+    for _ in range(4):
+        pool.gerar("extraia", ["imagem"])
+    assert de_volta.requisicoes > 0
+
+
+def test_falha_isolada_nao_tira_endpoint_do_pool(servidor):
+    # Só a 1ª requisição do endpoint falha (ex.: pico momentâneo)
+    instavel = servidor(erro_forcado=lambda payload, n: 503 if n == 1 else None)
+    pool = _pool([{"url": _url(instavel)}], limite_falhas=3)
+
+    resposta = pool.gerar("extraia", ["imagem"])
+
+    assert resposta == mock_ollama.RESPOSTA_PADRAO
+    resumo = pool.resumo()[_url(instavel)]
+    assert resumo["saudavel"] and resumo["falhas"] == 1 and resumo["quedas"] == 0
+
+
+def test_falhas_consecutivas_tiram_endpoint_do_pool(servidor):
+    sobrecarregado = servidor(erro_forcado=lambda payload, n: 429)
+    saudavel = servidor()
+    pool = _pool([{"url": _url(sobrecarregado), "peso": 10}, {"url": _url(saudavel)}], limite_falhas=2)
+
+    for _ in range(6):
+        pool.gerar("extraia", ["imagem"])
+
+    resumo = pool.resumo()[_url(sobrecarregado)]
+    assert resumo["falhas"] == 2 and resumo["quedas"] == 1 and not resumo["saudavel"]
+    assert saudavel.requisicoes == 6
+
+
+def test_modelo_sem_endpoint(servidor):
+    grande = servidor(modelos=("gemma3:27b-it-qat",))
+    pequeno = servidor()
+    pool = _pool([{"url": _url(grande), "modelos": ["gemma3:27b-it-qat"]}, {"url": _url(pequeno)}])
+
+    _, metricas = pool.gerar_com_metricas("extraia", ["imagem"], "gemma3:27b-it-qat")
+    assert metricas["endpoint"] == _url(grande)
+    with pytest.raises(OllamaError):
+        pool.gerar("extraia", ["imagem"], "llava")
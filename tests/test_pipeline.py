@@ -0,0 +1,100 @@
+import csv
+import itertools
+import json
+import os
+import time
+
+import pytest
+
+import benchmark
+import extract_data
+import pipeline
+from infer_ean import carregar_base_dados_produtos
+from manifest import Manifest
+from ollama_client import OllamaError
+from result_store import ResultStore
+
+
+@pytest.fixture
+def catalogo(tmp_path):
+    caminho = str(tmp_path / "catalogo.csv")
+    benchmark.gerar_catalogo_sintetico(caminho, 50, semente=5)
+    return caminho, carregar_base_dados_produtos(caminho)
+
+
+@pytest.fixture
+def saida(monkeypatch, tmp_path):
+    pasta = tmp_path / "resultados"
+    pasta.mkdir()
+    monkeypatch.setattr(extract_data, "OUTPUT_DIR", str(pasta))
+    monkeypatch.setattr(extract_data, "ARQUIVO_RESULTADOS", str(pasta / "resultados.jsonl"))
+    monkeypatch.setattr(extract_data, "store_resultados", None)
+    monkeypatch.setattr(extract_data, "MODELO_GRANDE", "")
+    return pasta
+
+
+def _usar_extrator(monkeypatch, respostas):
+    """Substitui a extração pelo Ollama: 'respostas' mapeia nome -> resposta (None = falha)."""
+    def extrair_em_fluxo(imagens, max_em_voo=None, avaliar=None):
+        for nome, _ in imagens:
+            resposta = respostas[nome]
+            yield nome, resposta, None if resposta else OllamaError("servidor fora do ar"), extract_data.MODEL
+    monkeypatch.setattr(extract_data, "extrair_em_fluxo", extrair_em_fluxo)
+
+
+def _resposta(linha):
+    return json.dumps({"marca": linha["brand"], "produto": linha["name"], "preço": "9,99",
+                       "unidade": "un", "códigos_de_barras": ""}, ensure_ascii=False)
+
+
+def test_fila_limitada_segura_o_produtor():
+    produzidos = []
+    infinito = (produzidos.append(i) or (i, b"") for i in itertools.count())
+
+    consumidor = pipeline.em_thread(infinito, 4)
+    next(consumidor)
+    time.sleep(0.2)
+
+    # 4 na fila, 1 consumido e no máximo 1 esperando vaga
+    assert len(produzidos) <= 4 + 2
+
+
+def test_pipeline_grava_csv_resultados_e_manifesto(monkeypatch, catalogo, saida, tmp_path):
+    caminho_catalogo, df = catalogo
+    respostas = {f"recorte_{i}.jpg": _resposta(df.iloc[i]) for i in range(5)}
+    respostas["recorte_falho.jpg"] = None
+    _usar_extrator(monkeypatch, respostas)
+    inferencias = tmp_path / "inferencias" / "eans.csv"
+
+    pipeline.executar_pipeline(((nome, b"jpeg") for nome in respostas), caminho_catalogo,
+                               str(inferencias), 75, tamanho_fila=2, salvar_respostas=True)
+
+    with open(inferencias, encoding="utf-8") as f:
+        linhas = list(csv.DictReader(f))
+    assert [linha["Imagem"] for linha in linhas] == [f"recorte_{i}.jpg" for i in range(5)]
+    assert [linha["EAN Inferido"] for linha in linhas] == [str(df.iloc[i]["ean"]) for i in range(5)]
+
+    store = ResultStore(extract_data.ARQUIVO_RESULTADOS)
+    assert [r["imagem"] for r in store] == [f"recorte_{i}.jpg" for i in range(5)]
+    assert "recorte_falho.jpg" in (saida / "falhas.txt").read_text(encoding="utf-8")
+
+    # O manifesto confirma tudo o que foi gravado: um run seguinte não descarta nada
+    tamanho = os.path.getsize(extract_data.ARQUIVO_RESULTADOS)
+    manifesto = Manifest(str(saida / "manifesto.jsonl"))
+    assert manifesto.fins[os.path.abspath(extract_data.ARQUIVO_RESULTADOS)] == tamanho
+    manifesto.reconciliar_resultados(extract_data.ARQUIVO_RESULTADOS)
+    assert os.path.getsize(extract_data.ARQUIVO_RESULTADOS) == tamanho
+
+
+def test_erro_de_uma_etapa_e_relancado(monkeypatch, catalogo, saida, tmp_path):
+    caminho_catalogo, df = catalogo
+    _usar_extrator(monkeypatch, {"a.jpg": _resposta(df.iloc[0])})
+
+    def imagens():
+        yield "a.jpg", b"jpeg"
+        raise OSError("dataset ilegível")
+
+    with pytest.raises(OSError, match="dataset ilegível"):
+        pipeline.executar_pipeline(imagens(), caminho_catalogo, str(tmp_path / "eans.csv"), 75, tamanho_fila=2)
+    # A linha da imagem anterior ao erro já foi gravada
+    assert "a.jpg" in (tmp_path / "eans.csv").read_text(encoding="utf-8")
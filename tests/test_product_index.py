@@ -0,0 +1,154 @@
+import pandas as pd
+import pytest
+from fuzzywuzzy import process
+
+import benchmark
+import product_index
+from infer_ean import carregar_base_dados_produtos
+from product_index import TAMANHO_SEMENTE, ProductIndex
+
+CATALOGO = [
+    "leite integral piracanjuba 1l",
+    "leite® integral 1l°",
+    "leite desnatado italac 1l",
+    "café pilão tradicional 500g",
+    "cafe pilao extra forte 500g",
+    "açúcar refinado união 1kg",
+    "arroz tio joão tipo 1 5kg",
+    "arroz camil branco 5kg",
+    "feijão carioca kicaldo 1kg",
+    "óleo de soja soya 900ml",
+    "sabão em pó omo lavagem perfeita 1,6kg",
+    "refrigerante coca-cola 2l",
+    "refrigerante coca cola zero 2l",
+    "biscoito recheado passatempo chocolate 130g",
+    "  ",
+    "leite integral piracanjuba 1l",
+    "macarrão espaguete renata nº 8 500g",
+    "água mineral crystal 1,5l",
+    "cerveja brahma chopp lata 350ml",
+    "chocolate lacta ao leite 90g",
+]
+
+CONSULTAS = [
+    "Leite® Integral 1L°",
+    "leite integral",
+    "LEITE INTEGRAL PIRACANJUBA 1 L",
+    "Café Pilão 500g",
+    "cafe pilao",
+    "açucar uniao refinado",
+    "arroz tio joao 5kg",
+    "feijao kicaldo",
+    "oleo soya",
+    "omo lavagem perfeita",
+    "Coca-Cola Zero 2L",
+    "coca cola",
+    "passatempo recheado chocolate",
+    "macarrao renata n° 8",
+    "agua crystal",
+    "brahma chopp 350 ml",
+    "lacta",
+    "®°",
+    "produto que não existe",
+]
+
+
+@pytest.fixture(scope="module")
+def df_produtos():
+    return pd.DataFrame({
+        "comparable_text_db": CATALOGO,
+        "ean": [f"789{i:010d}" for i in range(len(CATALOGO))],
+    })
+
+
+@pytest.mark.parametrize("consulta", CONSULTAS)
+def test_modo_exaustivo_igual_ao_extract_one(df_produtos, consulta):
+    indice = ProductIndex(df_produtos, exaustivo=True)
+    escolhas = [texto for texto in CATALOGO if texto.strip()]
+
+    texto_esperado, score_esperado = process.extractOne(consulta, escolhas)
+    posicao, texto, score = indice.buscar(consulta)
+
+    assert (texto, score) == (texto_esperado, score_esperado)
+    assert posicao == CATALOGO.index(texto_esperado)
+
+
+@pytest.mark.parametrize("consulta", CONSULTAS)
+def test_modo_bloqueado_acima_do_minimo_igual_ao_exaustivo(df_produtos, consulta):
+    exaustivo = ProductIndex(df_produtos, exaustivo=True).buscar(consulta)
+    bloqueado = ProductIndex(df_produtos).buscar(consulta, score_minimo=75)
+
+    assert bloqueado[2] == exaustivo[2]
+    if bloqueado[2] >= 75:
+        assert bloqueado == exaustivo
+
+
+@pytest.fixture(scope="module")
+def indice_grande(tmp_path_factory):
+    # Catálogo bem maior que a semente
+    caminho = tmp_path_factory.mktemp("catalogo") / "catalogo.csv"
+    benchmark.gerar_catalogo_sintetico(str(caminho), 1200, semente=11)
+    df = carregar_base_dados_produtos(str(caminho))
+    indice = ProductIndex(df)
+    assert len(indice) > 50 * TAMANHO_SEMENTE
+    return df, indice
+
+
+def test_modo_bloqueado_igual_ao_extract_one_em_catalogo_grande(indice_grande, monkeypatch):
+    # Consultas ruidosas (palavras omitidas) e curtas, que só têm scores baixos e empatados.
+    # Sem o limite de refinamento, a busca limitada só deixa de pontuar o que não alcança o mínimo.
+    df, indice = indice_grande
+    monkeypatch.setattr(product_index, "LIMITE_REFINAMENTO", len(indice))
+
+    consultas = [f"{c['marca']} {c['produto']}" for c in benchmark._consultas_sinteticas(df, 30, None, 5)]
+    consultas += ["leite", "1kg", "sadia zzz", "x"]
+    for consulta in consultas:
+        texto_esperado, score_esperado = process.extractOne(consulta, indice.textos)
+        posicao, texto, score = indice.buscar(consulta)
+        assert (texto, score) == (texto_esperado, score_esperado), consulta
+        assert posicao == indice.posicoes[indice.textos.index(texto_esperado)]
+
+        _, texto, score = indice.buscar(consulta, score_minimo=75, limitada=True)
+        assert (score >= 75) == (score_esperado >= 75), consulta
+        if score_esperado >= 75:
+            assert (texto, score) == (texto_esperado, score_esperado), consulta
+
+
+def test_busca_limitada_pontua_no_maximo_a_semente_e_o_limite(indice_grande, monkeypatch):
+    _, indice = indice_grande
+    monkeypatch.setattr(product_index, "LIMITE_REFINAMENTO", 10)
+    monkeypatch.setattr(product_index, "LIMITE_PONTUADOS", 5)
+    pontuados = []
+    wratio = product_index.fuzz.WRatio
+    monkeypatch.setattr(product_index.fuzz, "WRatio", lambda *args, **kwargs: pontuados.append(args[1]) or wratio(*args, **kwargs))
+
+    # Consulta genérica: muitos textos poderiam superar a semente
+    resultado = indice.buscar("oreo oreo", score_minimo=75, limitada=True)
+
+    assert resultado is not None and len(pontuados) <= TAMANHO_SEMENTE + 5
+    pontuados.clear()
+    assert indice.buscar("oreo oreo") == indice.buscar("oreo oreo", exaustivo=True)
+    assert len(pontuados) > TAMANHO_SEMENTE + 5
+
+
+def test_modo_exaustivo_nao_constroi_listas_invertidas(df_produtos):
+    indice = ProductIndex(df_produtos, exaustivo=True)
+
+    assert indice.indice_tokens is None
+    # Pedir o modo bloqueado a um índice exaustivo recai na varredura completa
+    assert indice.buscar("cafe pilao", exaustivo=False) == indice.buscar("cafe pilao")
+
+
+def test_gtin_normalizado_e_codigo_bruto():
+    df = pd.DataFrame({
+        "comparable_text_db": ["leite", "cafe", "arroz", "feijao"],
+        # EAN-13 válido, UPC-A válido, código interno com dígito verificador inválido e texto
+        "ean": ["7891000100103", "012345678905", "7891234567890", "sem codigo"],
+    })
+    indice = ProductIndex(df)
+
+    assert indice.buscar_gtin("7891000100103") == 0
+    assert indice.buscar_gtin("0012345678905") == 1
+    assert indice.buscar_gtin("7891234567890") == 2
+    assert indice.buscar_gtin("789123456789") is None
+    assert indice.buscar_gtin("sem codigo") is None
@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, chave_cache
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1_000_000.0
+
+    def __call__(self):
+        return self.agora
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(response_cache, "time", SimpleNamespace(time=relogio))
+    return relogio
+
+
+def _guardar(cache, relogio, *chaves):
+    for chave in chaves:
+        relogio.agora += 1
+        cache.guardar(chave, f"resposta {chave}")
+
+
+def test_remove_as_menos_usadas_acima_do_limite(tmp_path, relogio):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_entradas=3, max_idade=0)
+    _guardar(cache, relogio, "a", "b", "c", "d")
+    relogio.agora += 1
+    # 'a' é a mais antiga, mas foi usada agora: sai a 'b'
+    assert cache.obter("a") == "resposta a"
+
+    cache.limpar()
+
+    assert cache.estatisticas()["entradas"] == 3
+    assert [cache.obter(chave) for chave in "abcd"] == ["resposta a", None, "resposta c", "resposta d"]
+
+
+def test_limpeza_automatica_a_cada_intervalo_de_insercoes(tmp_path, relogio, monkeypatch):
+    monkeypatch.setattr(response_cache, "CACHE_INTERVALO_LIMPEZA", 2)
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_entradas=2, max_idade=0)
+
+    _guardar(cache, relogio, "a", "b", "c")
+    assert cache.estatisticas()["entradas"] == 3
+    _guardar(cache, relogio, "d")
+    assert cache.estatisticas()["entradas"] == 2
+    assert cache.obter("c") == "resposta c" and cache.obter("b") is None
+
+
+def test_respostas_expiradas(tmp_path, relogio):
+    caminho = str(tmp_path / "cache.sqlite")
+    cache = ResponseCache(caminho, max_idade=100)
+    _guardar(cache, relogio, "velha")
+    relogio.agora += 60
+    _guardar(cache, relogio, "nova")
+    relogio.agora += 50
+
+    # Expirada conta como falha mesmo antes da limpeza
+    assert cache.obter("velha") is None and cache.obter("nova") == "resposta nova"
+    cache.fechar()
+    # Ao reabrir, a limpeza remove do arquivo o que expirou
+    assert ResponseCache(caminho, max_idade=100).estatisticas()["entradas"] == 1
+
+
+def test_contadores_de_acertos_e_falhas(tmp_path, relogio):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    chave = chave_cache(b"imagem", "gemma3:4b", "prompt")
+    alternativa = chave_cache(b"imagem", "gemma3:4b", "prompt antigo")
+    assert chave != chave_cache(b"imagem", "gemma3:4b", "prompt", {"temperature": 0})
+
+    assert cache.obter(chave) is None
+    cache.guardar(alternativa, "resposta antiga")
+    # Várias chaves numa consulta contam uma vez só; vale a primeira encontrada
+    assert cache.obter(chave, alternativa) == "resposta antiga"
+    cache.guardar(chave, "resposta")
+    assert cache.obter(chave, alternativa) == "resposta"
+    assert cache.obter("outra", "mais uma") is None
+
+    assert cache.estatisticas() == {"acertos": 2, "falhas": 2, "taxa_acerto": 0.5, "entradas": 2}
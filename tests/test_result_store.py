@@ -0,0 +1,112 @@
+import os
+
+import pytest
+
+from extract_data import interpretar_resposta_json
+from infer_ean import ler_registros
+from ollama_client import RespostaInvalidaError
+from result_store import ResultStore, importar_resultados_txt, truncar_resultados
+
+RESULTADOS_TXT = """Imagem: a.jpg
+Aqui estão as informações extraídas da imagem:
+
+* **Marca:** Nestlé
+* **Produto:** Leite Ninho 400g
+* **Preço:** R$ 19,90
+* **Códigos de Barras:** 7891000100103
+========================================
+Imagem: b.jpg
+* **Marca:** Pilão
+* **Produto:** Café Tradicional 500g
+========================================
+"""
+
+
+def _indice(caminho):
+    with open(caminho + ".idx", encoding="utf-8") as f:
+        return [linha.rstrip("\n").split("\t") for linha in f]
+
+
+def test_importar_resultados_txt(tmp_path):
+    txt = tmp_path / "resultado.txt"
+    txt.write_text(RESULTADOS_TXT, encoding="utf-8")
+    jsonl = str(tmp_path / "resultado.jsonl")
+
+    assert importar_resultados_txt(str(txt), ResultStore(jsonl)) == 2
+
+    store = ResultStore(jsonl)
+    assert store.obter("a.jpg")["dados"] == {
+        "marca": "Nestlé", "produto": "Leite Ninho 400g", "preço": "R$ 19,90", "códigos_de_barras": "7891000100103",
+    }
+    assert "Leite Ninho" in store.obter("a.jpg")["resposta"]
+    # O infer_ean lê o JSONL importado com os mesmos dados que lia do .txt
+    assert list(ler_registros(jsonl)) == list(ler_registros(str(txt)))
+
+
+def test_indice_consistente_com_o_jsonl(tmp_path):
+    jsonl = str(tmp_path / "resultado.jsonl")
+    store = ResultStore(jsonl)
+    store.adicionar("a.jpg", {"produto": "A"})
+    store.adicionar("b.jpg", {"produto": "Bê"})
+    store.adicionar("a.jpg", {"produto": "A corrigido"})
+
+    with open(jsonl, "rb") as f:
+        conteudo = f.read()
+    entradas = _indice(jsonl)
+    assert [imagem for imagem, _, _ in entradas] == ["a.jpg", "b.jpg", "a.jpg"]
+    # Cada entrada cobre exatamente a linha do registro e elas se sucedem sem lacunas
+    assert int(entradas[0][1]) == 0 and int(entradas[-1][2]) == len(conteudo)
+    for (_, _, fim), (_, inicio, _) in zip(entradas, entradas[1:]):
+        assert fim == inicio
+    for imagem, inicio, fim in entradas:
+        assert conteudo[int(inicio):int(fim)].endswith(b"\n") and imagem.encode() in conteudo[int(inicio):int(fim)]
+    assert ResultStore(jsonl).obter("a.jpg")["dados"] == {"produto": "A corrigido"}
+
+
+def test_indice_ausente_ou_atrasado_e_reconstruido(tmp_path):
+    jsonl = str(tmp_path / "resultado.jsonl")
+    store = ResultStore(jsonl)
+    for i in range(3):
+        store.adicionar(f"{i}.jpg", {"produto": str(i)})
+    completo = _indice(jsonl)
+
+    os.remove(jsonl + ".idx")
+    assert len(ResultStore(jsonl)) == 3 and _indice(jsonl) == completo
+
+    # Índice sem a última entrada (processo interrompido entre as duas escritas)
+    with open(jsonl + ".idx", "w", encoding="utf-8") as f:
+        f.writelines("\t".join(entrada) + "\n" for entrada in completo[:2])
+    assert ResultStore(jsonl).obter("2.jpg")["dados"] == {"produto": "2"}
+    assert _indice(jsonl) == completo
+
+
+def test_linha_incompleta_e_truncamento_mantem_indice(tmp_path):
+    jsonl = str(tmp_path / "resultado.jsonl")
+    store = ResultStore(jsonl)
+    store.adicionar("a.jpg", {"produto": "A"})
+    fim_a = os.path.getsize(jsonl)
+    store.adicionar("b.jpg", {"produto": "B"})
+    with open(jsonl, "ab") as f:
+        f.write(b'{"imagem": "c.jpg", "da')
+
+    store = ResultStore(jsonl)
+    assert "c.jpg" not in store and len(store) == 2
+
+    truncar_resultados(jsonl, fim_a)
+    assert [imagem for imagem, _, _ in _indice(jsonl)] == ["a.jpg"]
+    assert "b.jpg" not in ResultStore(jsonl)
+
+
+def test_interpretar_resposta_estruturada():
+    dados = interpretar_resposta_json(
+        '{"marca": " Nestlé ", "produto": "Leite Ninho", "preço": 19.9, "unidade": null, "extra": "x"}'
+    )
+
+    # Campos ausentes ou nulos viram "", valores são convertidos para texto sem espaços nas bordas
+    assert dados == {"marca": "Nestlé", "produto": "Leite Ninho", "preço": "19.9", "unidade": "", "códigos_de_barras": ""}
+
+
+@pytest.mark.parametrize("resposta", ["não é json", "[1, 2]", '"texto"', '{"outro": "campo"}', ""])
+def test_resposta_estruturada_invalida(resposta):
+    with pytest.raises(RespostaInvalidaError):
+        interpretar_resposta_json(resposta)
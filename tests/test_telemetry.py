@@ -0,0 +1,81 @@
+import re
+import urllib.request
+
+import pytest
+
+from telemetry import ETAPAS, Telemetria
+
+_LINHA = re.compile(r'^(\w+)(?:\{(\w+)="([^"]*)"\})? (\S+)$')
+
+
+def _amostras(texto):
+    """Lê o texto do Prometheus como {(métrica, rótulo, valor do rótulo): valor}, conferindo HELP/TYPE."""
+    amostras, tipos = {}, {}
+    for linha in texto.splitlines():
+        if linha.startswith("# TYPE "):
+            _, _, nome, tipo = linha.split(" ")
+            tipos[nome] = tipo
+            continue
+        if linha.startswith("#"):
+            continue
+        nome, rotulo, valor_rotulo, valor = _LINHA.match(linha).groups()
+        assert re.sub(r"_(sum|count)$", "", nome) in tipos, nome
+        amostras[(nome, rotulo, valor_rotulo)] = float(valor)
+    return amostras
+
+
+def _metricas(modelo, carga_ms, eval_count=20):
+    return {
+        "modelo": modelo, "tentativas": 1, "requisicao_s": 1.5,
+        "total_duration": 1_200_000_000, "load_duration": int(carga_ms * 1e6),
+        "prompt_eval_count": 300, "prompt_eval_duration": 200_000_000,
+        "eval_count": eval_count, "eval_duration": 800_000_000,
+    }
+
+
+@pytest.fixture
+def telemetria():
+    telemetria = Telemetria()
+    for i in range(3):
+        imagem = f"{i}.jpg"
+        telemetria.registrar(imagem, codificacao_ms=10.0, parse_ms=2.0)
+        telemetria.registrar_ollama(imagem, _metricas("gemma3:4b", carga_ms=900 if i == 0 else 5))
+    telemetria.registrar_ollama("3.jpg", _metricas("gemma3:27b", carga_ms=5, eval_count=40))
+    with telemetria.medir("3.jpg", "ean"):
+        pass
+    # Resposta vinda do cache: conta como imagem, mas não como requisição ao Ollama
+    telemetria.registrar("4.jpg", cache=True, modelo="gemma3:4b")
+    return telemetria
+
+
+def test_exportacao_prometheus(telemetria):
+    amostras = _amostras(telemetria.texto_prometheus())
+
+    assert amostras[("extracao_imagens_total", None, None)] == 5
+    contagens = {etapa: amostras[("extracao_etapa_segundos_count", "etapa", etapa)] for etapa in ETAPAS}
+    assert contagens == {"codificacao": 3, "requisicao": 4, "rede": 4, "parse": 3, "ean": 1}
+    assert amostras[("extracao_etapa_segundos_sum", "etapa", "codificacao")] == pytest.approx(0.03)
+    # requisição de 1,5 s com total_duration de 1,2 s: 0,3 s de rede por requisição
+    assert amostras[("extracao_etapa_segundos_sum", "etapa", "rede")] == pytest.approx(4 * 0.3)
+
+    assert amostras[("ollama_requisicoes_total", "modelo", "gemma3:4b")] == 3
+    assert amostras[("ollama_requisicoes_total", "modelo", "gemma3:27b")] == 1
+    assert amostras[("ollama_recargas_total", "modelo", "gemma3:4b")] == 1
+    assert amostras[("ollama_recargas_total", "modelo", "gemma3:27b")] == 0
+    assert amostras[("ollama_carga_segundos_total", "modelo", "gemma3:4b")] == pytest.approx(0.91)
+    assert amostras[("ollama_prompt_tokens_total", "modelo", "gemma3:4b")] == 900
+    assert amostras[("ollama_tokens_gerados_total", "modelo", "gemma3:27b")] == 40
+    assert amostras[("ollama_geracao_segundos_total", "modelo", "gemma3:4b")] == pytest.approx(2.4)
+    assert {rotulo for _, rotulo, _ in amostras if rotulo} == {"etapa", "modelo"}
+
+
+def test_servidor_de_metricas(telemetria):
+    servidor = telemetria.iniciar_servidor_metricas(0, host="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{servidor.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as resposta:
+            assert resposta.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert resposta.read().decode("utf-8") == telemetria.texto_prometheus()
+    finally:
+        servidor.shutdown()
+        servidor.server_close()